@@ -0,0 +1,431 @@
+import numpy as np
+from traffic import TrafficGenerator, UP_CALL, DOWN_CALL
+from wait_tracker import WaitTracker
+from ledger import TripLedger, ORIGIN, DESTINATION, SPAWN, BOARD
+from snapshot import SNAPSHOT_VERSION, CAR_WORDS, SnapshotReader, read_building_header
+
+SMALL_BATCH = 8  # arrivals up to this count are enqueued one by one, larger bursts in one vectorized pass
+
+# Column layout of the rider and queue tables: ORIGIN, DESTINATION, SPAWN (and BOARD for riders)
+
+class ArrayBuilding:
+    """Struct-of-arrays simulation core with the same step semantics as Building.
+
+    Cars and passengers are kept in preallocated NumPy arrays instead of
+    Elevator/Passenger objects, so the cost of a step no longer grows with
+    the number of people waiting in the building. With a dozen cars and a few
+    arrivals per step, NumPy calls on such small arrays cost more than the
+    work they do, so the per-step loops over cars and arrivals read the car
+    arrays once as Python lists and write them back once; the arrays stay
+    the state every other method reads.
+    """
+    NO_DESTINATION = -1
+
+    def __init__(self, num_floors, num_elevators, capacity=10, speed=1, queue_capacity=64, seed=None, traffic=None):
+        self.num_floors = num_floors
+        self.num_elevators = num_elevators
+        self.capacity = capacity
+        self.speed = speed
+        self.loading_time = 2  # steps needed for boarding/alighting
+        self.traffic = traffic if traffic is not None else TrafficGenerator(num_floors, seed=seed)
+        self.tick = 0  # number of steps simulated, used as the spawn clock
+
+        # Elevator cars
+        self.positions = np.zeros(num_elevators, dtype=np.int32)
+        self.destinations = np.full(num_elevators, self.NO_DESTINATION, dtype=np.int32)
+        self.directions = np.zeros(num_elevators, dtype=np.int32)  # 0: idle, 1: up, -1: down
+        self.door_open = np.zeros(num_elevators, dtype=bool)
+        self.door_timers = np.zeros(num_elevators, dtype=np.int32)
+        self.loads = np.zeros(num_elevators, dtype=np.int32)
+        self.capacities = np.full(num_elevators, capacity, dtype=np.float32)
+
+        # Riding passengers: (car, slot, ORIGIN/DESTINATION/SPAWN/BOARD), first `loads[e]` slots are used
+        self.riders = np.zeros((num_elevators, capacity, 4), dtype=np.int64)
+        self.rider_destinations = self.riders[:, :, DESTINATION]
+        self._slots = np.arange(capacity)
+        # Riders per car and destination floor, so finding the cars someone leaves is one lookup
+        self.car_call_counts = np.zeros((num_elevators, num_floors), dtype=np.int32)
+        self._cars = np.arange(num_elevators)
+
+        # Waiting passengers: one FIFO row per hall call (row 2*floor + UP_CALL/DOWN_CALL) holding
+        # entries [queue_heads, queue_tails) with columns ORIGIN/DESTINATION/SPAWN so a boarding
+        # group is a single slice copy
+        self._rows = np.arange(2 * num_floors)
+        self.queues = np.zeros((2 * num_floors, queue_capacity, 3), dtype=np.int64)
+        self.queues[:, :, ORIGIN] = self._rows[:, None] // 2
+        self.queue_heads = np.zeros(2 * num_floors, dtype=np.int64)
+        self.queue_tails = np.zeros(2 * num_floors, dtype=np.int64)
+        self._floors = np.arange(num_floors)
+
+        # Wait totals over everyone waiting, updated on arrival and boarding
+        self.waits = WaitTracker()
+        self.ledger = TripLedger()  # completed trips
+        self.delivered = 0  # passengers delivered during the current step
+        self.profiler = None  # StepProfiler, set to time the step phases
+
+    def step(self, time_step=None):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+            waiting = self.waits.count
+
+        self.tick += 1
+        self.delivered = 0
+        self.waits.advance(self.tick)
+        if profiler is not None:
+            profiler.mark("wait_update")
+
+        # Move elevators
+        self._move()
+        self._drop_passengers()
+        if profiler is not None:
+            profiler.mark("movement")
+            boarded = waiting - self.waits.count
+            profiler.count("picked_up", boarded)
+            profiler.count("delivered", self.delivered)
+            waiting = self.waits.count
+
+        # Generate new passengers
+        self._generate_passengers(time_step if time_step is not None else 0)
+        if profiler is not None:
+            profiler.mark("generation")
+            profiler.count("generated", self.waits.count - waiting)
+            profiler.gauge("waiting", self.waits.count)
+            profiler.gauge("longest_queue", int(self.get_waiting_counts().max()))
+
+    def take_action(self, action):
+        if self.profiler is not None:
+            self.profiler.start()
+        elevator_id, destination_floor = action
+
+        # Validate action
+        if not (0 <= elevator_id < self.num_elevators):
+            return -10  # Large penalty for invalid elevator ID
+
+        if not (0 <= destination_floor < self.num_floors):
+            return -10  # Large penalty for invalid floor
+
+        # Only set destination if elevator isn't full
+        if self.loads[elevator_id] < self.capacity:
+            self.destinations[elevator_id] = destination_floor
+        if self.profiler is not None:
+            self.profiler.mark("dispatch")
+
+        return self._calculate_reward()
+
+    def take_joint_action(self, targets):
+        """Give every car its destination floor in one action; a target of `num_floors` keeps the car's orders"""
+        if self.profiler is not None:
+            self.profiler.start()
+        targets = np.asarray(targets)
+        if targets.shape != (self.num_elevators,) or ((targets < 0) | (targets > self.num_floors)).any():
+            return -10  # Large penalty for invalid targets
+
+        # Only set destinations of elevators that aren't full
+        assign = (targets < self.num_floors) & (self.loads < self.capacity)
+        self.destinations[assign] = targets[assign]
+        if self.profiler is not None:
+            self.profiler.mark("dispatch")
+
+        return self._calculate_reward()
+
+    def _move(self):
+        """Elevator.move() for every car: move, pick up on the way, then handle arrival"""
+        destinations = self.destinations.tolist()
+        if max(destinations) < 0:
+            return
+        positions = self.positions.tolist()
+        directions = self.directions.tolist()
+        door_open = self.door_open.tolist()
+        loads = self.loads.tolist()
+        waiting = None  # people per queue row, read once a car can board
+        for e, destination in enumerate(destinations):
+            if destination < 0:
+                continue
+            position, direction = positions[e], directions[e]
+            if position < destination:
+                direction = 1
+                position += self.speed
+            elif position > destination:
+                direction = -1
+                position -= self.speed
+            arrived = direction != 0 and (position - destination) * direction >= 0
+
+            # Pick up on the way, in car order like the per-object loop; cars faster than one
+            # floor per step can be past the building until they snap to their destination
+            if door_open[e] and loads[e] < self.capacity and 0 <= position < self.num_floors:
+                if waiting is None:
+                    waiting = (self.queue_tails - self.queue_heads).tolist()
+                if waiting[2*position + UP_CALL] or waiting[2*position + DOWN_CALL]:
+                    # Cars ending their trip have no committed direction and serve the longest-waiting call
+                    self._pickup_passengers(e, position, 0 if arrived else direction, loads[e], waiting)
+
+            # Snap to destination if overshot and handle arrival
+            if arrived:
+                position, direction = destination, 0
+                destinations[e] = self.NO_DESTINATION
+                self.door_open[e] = True
+                self.door_timers[e] = 0
+            positions[e], directions[e] = position, direction
+        self.positions[:] = positions
+        self.destinations[:] = destinations
+        self.directions[:] = directions
+
+    def _pickup_passengers(self, e, floor, direction, load, waiting):
+        """Board the longest-waiting passengers (queue heads) going `direction` (0: the longest-waiting
+        call) into car `e` at `floor`; `waiting` is kept up to date"""
+        if direction:
+            row = 2*floor + (UP_CALL if direction == 1 else DOWN_CALL)
+        else:
+            row = self._longest_waiting_row(floor)
+        count = min(waiting[row], self.capacity - load)
+        if count <= 0:
+            return  # nobody going this way, or an earlier car took them
+        head = int(self.queue_heads[row])
+        boarding = self.queues[row, head:head+count]
+        self.riders[e, load:load+count, :BOARD] = boarding
+        self.riders[e, load:load+count, BOARD] = self.tick
+        self.car_call_counts[e] += np.bincount(boarding[:, DESTINATION], minlength=self.num_floors).astype(np.int32)
+        self.queue_heads[row] = head + count
+        waiting[row] -= count
+        self.loads[e] = load + count
+        self._forget_waiting(boarding[:, SPAWN])
+
+    def _longest_waiting_row(self, floor):
+        """Queue row of the floor's hall call whose head has waited longest"""
+        up, down = 2*floor + UP_CALL, 2*floor + DOWN_CALL
+        if self.queue_tails[down] == self.queue_heads[down]:
+            return up
+        if self.queue_tails[up] == self.queue_heads[up]:
+            return down
+        up_spawn = self.queues[up, self.queue_heads[up], SPAWN]
+        return up if up_spawn <= self.queues[down, self.queue_heads[down], SPAWN] else down
+
+    def _forget_waiting(self, spawn_times):
+        """Remove boarded passengers from the wait totals"""
+        if self.tick - spawn_times[-1] >= self.waits.cap:
+            # Queues are FIFO, so everyone boarding already hit the cap
+            self.waits.remove_capped(len(spawn_times), int(spawn_times.sum()))
+            return
+        for spawn in spawn_times.tolist():
+            self.waits.remove(spawn)
+
+    def _drop_passengers(self):
+        """Vectorized Elevator.remove_passengers() for every car with open doors"""
+        hits = self.car_call_counts[self._cars, self.positions].tolist()
+        if not any(hits):
+            return
+        door_open = self.door_open.tolist()
+        cars = [e for e, hit in enumerate(hits) if hit and door_open[e]]
+        if not cars:
+            return
+        drop_floors = np.where(self.door_open, self.positions, -1)
+        departing = (self.rider_destinations == drop_floors[:, None]) & (self._slots < self.loads[:, None])
+        self.car_call_counts[cars, self.positions[cars]] = 0
+        arrivals = self.riders[departing]
+        self.ledger.record_many(arrivals, self.tick)
+        self.delivered += len(arrivals)
+        # Stable-compact the remaining riders to the front of each row
+        order = np.argsort(departing, axis=1, kind='stable')
+        self.riders[:] = np.take_along_axis(self.riders, order[:, :, None], axis=1)
+        self.loads -= departing.sum(axis=1, dtype=np.int32)
+
+    def _generate_passengers(self, time_step=0):
+        floors, destinations = self.traffic.sample(time_step)
+        if floors.size:
+            self._enqueue(floors, destinations)
+
+    def _enqueue(self, floors, destinations):
+        """Append passengers to the back of their hall call queues"""
+        if len(floors) <= SMALL_BATCH:
+            for floor, destination in zip(floors.tolist(), destinations.tolist()):
+                row = 2*floor + (UP_CALL if destination > floor else DOWN_CALL)
+                slot = int(self.queue_tails[row])
+                if slot >= self.queues.shape[1]:
+                    self._make_room([row], 1)
+                    slot = int(self.queue_tails[row])
+                self.queues[row, slot, DESTINATION] = destination
+                self.queues[row, slot, SPAWN] = self.tick
+                self.queue_tails[row] = slot + 1
+            self.waits.add(self.tick, len(floors))
+            return
+        rows = 2*floors + np.where(destinations > floors, UP_CALL, DOWN_CALL)
+        if len(rows) > 1 and (rows[1:] < rows[:-1]).any():
+            order = np.argsort(rows, kind='stable')
+            rows, destinations = rows[order], destinations[order]
+        # Position of each arrival among the arrivals for the same call
+        ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        slots = self.queue_tails[rows] + ranks
+        if slots.max() >= self.queues.shape[1]:
+            self._make_room(rows, len(rows))
+            slots = self.queue_tails[rows] + ranks
+        self.queues[rows, slots, DESTINATION] = destinations
+        self.queues[rows, slots, SPAWN] = self.tick
+        self.queue_tails += np.bincount(rows, minlength=len(self._rows))
+        self.waits.add(self.tick, len(rows))
+
+    def _make_room(self, rows, count):
+        """Make room for `count` more passengers on each of the queue `rows` by compacting
+        them, doubling the queue capacity if that is not enough"""
+        for row in np.unique(rows).tolist():
+            head, tail = int(self.queue_heads[row]), int(self.queue_tails[row])
+            if tail + count <= self.queues.shape[1]:
+                continue
+            self.queues[row, :tail-head] = self.queues[row, head:tail]
+            self.queue_heads[row] = 0
+            self.queue_tails[row] = tail - head
+            self._grow_queues(tail - head + count)
+
+    def _grow_queues(self, length):
+        """Double the queue capacity until every queue can hold `length` passengers"""
+        while length > self.queues.shape[1]:
+            grown = np.zeros((len(self._rows), 2 * self.queues.shape[1], 3), dtype=self.queues.dtype)
+            grown[:, :, ORIGIN] = self._rows[:, None] // 2
+            grown[:, :self.queues.shape[1]] = self.queues
+            self.queues = grown
+
+    def get_waiting_counts(self):
+        return (self.queue_tails - self.queue_heads).reshape(self.num_floors, 2).sum(axis=1, dtype=np.int32)
+
+    def get_call_counts(self):
+        """Passengers waiting at each floor to go up / down, shape (num_floors, 2)"""
+        return (self.queue_tails - self.queue_heads).reshape(self.num_floors, 2).astype(np.int32)
+
+    def get_hall_calls(self):
+        """Whether each floor has someone waiting to go up / down, shape (num_floors, 2)"""
+        return (self.queue_tails > self.queue_heads).reshape(self.num_floors, 2)
+
+    def get_destination(self, elevator_id):
+        destination = int(self.destinations[elevator_id])
+        return None if destination == self.NO_DESTINATION else destination
+
+    def get_destinations(self):
+        """Destination floor of each car, -1 for none"""
+        return self.destinations.copy()
+
+    def get_car_calls(self):
+        """Floors requested by the riders of each car, shape (num_elevators, num_floors)"""
+        return self.car_call_counts > 0
+
+    def get_car_call_counts(self):
+        """Riders of each car by destination floor, shape (num_elevators, num_floors)"""
+        return self.car_call_counts.copy()
+
+    def get_dispatchable(self):
+        """Cars that are standing still and have room, i.e. waiting for a dispatch"""
+        return (self.directions == 0) & (self.loads < self.capacity)
+
+    def get_valid_dispatches(self):
+        """Whether dispatching each car to each floor has any effect, see Building.get_valid_dispatches"""
+        destinations = self.destinations[:, None]
+        at_empty_floor = (destinations < 0) & (self._floors == self.positions[:, None]) & \
+            (self.get_waiting_counts() == 0)
+        return (self.loads < self.capacity)[:, None] & (self._floors != destinations) & ~at_empty_floor
+
+    def get_max_wait_times(self):
+        """Longest wait per floor; queues are FIFO so it is the wait of the older queue head"""
+        return self._max_wait_times(self.queue_tails > self.queue_heads, np.empty(self.num_floors, dtype=np.int32))
+
+    def _max_wait_times(self, calls, out):
+        heads = self.queues[self._rows, np.minimum(self.queue_heads, self.queues.shape[1]-1), SPAWN]
+        heads = np.where(calls, heads, self.tick)
+        return np.subtract(self.tick, heads.reshape(self.num_floors, 2).min(axis=1), out=out, casting="unsafe")
+
+    def fill_observation(self, obs):
+        """Write car and queue state into the preallocated arrays of `obs`"""
+        obs["elevator_positions"][:] = self.positions
+        obs["elevator_directions"][:] = self.directions
+        np.divide(self.loads, self.capacity, out=obs["elevator_loads"], casting="unsafe")
+        # Queue lengths are computed once for the counts, the hall calls and the waits
+        waiting = self.queue_tails - self.queue_heads
+        calls = waiting > 0
+        by_floor = waiting.reshape(self.num_floors, 2)
+        np.add(by_floor[:, 0], by_floor[:, 1], out=obs["waiting_counts"], casting="unsafe")
+        obs["hall_calls"][:] = calls.reshape(self.num_floors, 2)
+        self._max_wait_times(calls, obs["waiting_times"])
+
+    def _open_passengers(self):
+        """Rider rows and queue entries of the passengers not delivered yet"""
+        entries = np.arange(self.queues.shape[1])
+        queued = (entries >= self.queue_heads[:, None]) & (entries < self.queue_tails[:, None])
+        return self.riders[self._slots < self.loads[:, None]], self.queues[queued]
+
+    def get_open_waits(self):
+        """Waits of the passengers not delivered yet, see Building.get_open_waits"""
+        riders, waiting = self._open_passengers()
+        return np.concatenate((riders[:, BOARD] - riders[:, SPAWN], self.tick - waiting[:, SPAWN]))
+
+    def get_open_trips(self):
+        """(origin, destination) rows of the passengers not delivered yet, riders first"""
+        riders, waiting = self._open_passengers()
+        return np.concatenate((riders[:, [ORIGIN, DESTINATION]], waiting[:, [ORIGIN, DESTINATION]]))
+
+    def get_total_wait_time(self):
+        return self.waits.total_wait()
+
+    def get_utilization(self):
+        return int(self.loads.sum()) / (self.capacity * self.num_elevators)
+
+    def _get_state(self):
+        return {
+            'elevator_positions': self.positions.copy(),
+            'elevator_directions': self.directions.copy(),  # 1=up, -1=down, 0=idle
+            'elevator_loads': self.loads / self.capacity,
+            'waiting_passengers': self.get_waiting_counts(),
+            'waiting_times': self.get_max_wait_times(),
+            'hall_calls': self.get_hall_calls()
+        }
+
+    def _calculate_reward(self):
+        # Delivery bonus (most important), per passenger who got off this step
+        delivered = self.delivered * 5.0
+
+        # Wait penalty (capped per passenger)
+        wait_penalty = self.waits.capped_wait_sum() * 0.1
+
+        # Movement penalty (only when empty)
+        moving = [load for direction, load in zip(self.directions.tolist(), self.loads.tolist()) if direction]
+        move_penalty = 0.05 * (len(moving) + sum(1 for load in moving if load > 0))
+
+        reward = delivered - wait_penalty - move_penalty
+        if self.profiler is not None:
+            self.profiler.mark("reward")
+        return min(max(reward/10, -1.0), 1.0)  # Scaled and bounded
+
+    def snapshot(self):
+        """Simulation state as a flat int64 array in the layout of Building.snapshot()"""
+        header = np.array([SNAPSHOT_VERSION, self.num_floors, self.num_elevators, self.tick, self.delivered,
+                           len(self.ledger)], dtype=np.int64)
+        cars = np.stack((self.positions, self.destinations, self.directions, self.door_open,
+                         self.door_timers, self.loads), axis=1)
+        riders = self.riders[self._slots < self.loads[:, None]]
+        slots = np.arange(self.queues.shape[1])
+        live = (slots >= self.queue_heads[:, None]) & (slots < self.queue_tails[:, None])
+        return np.concatenate((header, cars.ravel(), riders.ravel(), self.queue_tails - self.queue_heads,
+                               self.queues[live].ravel(), self.waits.snapshot(), self.traffic.snapshot()))
+
+    def restore(self, snapshot):
+        """Return to the state of a snapshot() of this building (or of a Building of the same shape);
+        completed trips are not copied back, the ledger is truncated to the snapshot's count"""
+        reader = SnapshotReader(snapshot)
+        self.tick, self.delivered, trips = read_building_header(reader, self.num_floors, self.num_elevators)
+        cars = reader.take(CAR_WORDS * self.num_elevators).reshape(-1, CAR_WORDS)
+        self.positions[:], self.destinations[:], self.directions[:] = cars[:, 0], cars[:, 1], cars[:, 2]
+        self.door_open[:], self.door_timers[:], self.loads[:] = cars[:, 3], cars[:, 4], cars[:, 5]
+        riding = self._slots < self.loads[:, None]
+        self.riders[riding] = reader.take(4 * int(self.loads.sum())).reshape(-1, 4)
+        self.car_call_counts[:] = 0
+        np.add.at(self.car_call_counts, (np.nonzero(riding)[0], self.rider_destinations[riding]), 1)
+
+        counts = reader.take(2 * self.num_floors)
+        self._grow_queues(int(counts.max()))
+        self.queue_heads[:] = 0
+        self.queue_tails[:] = counts
+        live = np.arange(self.queues.shape[1]) < counts[:, None]
+        self.queues[live] = reader.take(3 * int(counts.sum())).reshape(-1, 3)
+        self.waits.restore(reader.take(self.waits.cap + 5).tolist())
+        self.traffic.restore(reader.rest())
+        self.ledger.size = min(self.ledger.size, trips)
+
+    def __str__(self):
+        return f"ArrayBuilding with {self.num_floors} floors and {self.num_elevators} elevators"
@@ -0,0 +1,324 @@
+import numpy as np
+from array_building import ORIGIN, DESTINATION, SPAWN, BOARD
+from traffic import TrafficGenerator, UP_CALL, DOWN_CALL
+from wait_tracker import WAIT_CAP
+
+class BatchedBuilding:
+    """N independent buildings ("lanes") simulated together over stacked arrays.
+
+    Every lane follows the same step semantics as ArrayBuilding; all arrays carry
+    a leading lane dimension so one call to `step`/`take_actions` advances the
+    whole batch.
+    """
+    NO_DESTINATION = -1
+
+    def __init__(self, num_buildings, num_floors, num_elevators, capacity=10, speed=1, queue_capacity=64, seed=None,
+                 traffic=None):
+        self.num_buildings = num_buildings
+        self.num_floors = num_floors
+        self.num_elevators = num_elevators
+        self.capacity = capacity
+        self.speed = speed
+        self.traffic = traffic if traffic is not None else TrafficGenerator(num_floors, seed=seed)
+        n, e, f = num_buildings, num_elevators, num_floors
+
+        self.ticks = np.zeros(n, dtype=np.int64)  # per-lane spawn clock
+        self.delivered = np.zeros(n, dtype=np.int64)  # passengers delivered per lane during the current step
+
+        # Elevator cars
+        self.positions = np.zeros((n, e), dtype=np.int32)
+        self.destinations = np.full((n, e), self.NO_DESTINATION, dtype=np.int32)
+        self.directions = np.zeros((n, e), dtype=np.int32)  # 0: idle, 1: up, -1: down
+        self.door_open = np.zeros((n, e), dtype=bool)
+        self.door_timers = np.zeros((n, e), dtype=np.int32)
+        self.loads = np.zeros((n, e), dtype=np.int32)
+
+        # Riding passengers: (lane, car, slot, ORIGIN/DESTINATION/SPAWN/BOARD)
+        self.riders = np.zeros((n, e, capacity, 4), dtype=np.int64)
+        self.rider_destinations = self.riders[..., DESTINATION]
+        self._slots = np.arange(capacity)
+
+        # Waiting passengers: FIFO rows per (lane, hall call) holding entries [queue_heads, queue_tails),
+        # hall call rows are 2*floor + UP_CALL/DOWN_CALL
+        self._rows = np.arange(2 * f)
+        self.queues = np.zeros((n, 2 * f, queue_capacity, 3), dtype=np.int64)
+        self.queues[..., ORIGIN] = self._rows[:, None] // 2
+        self.queue_heads = np.zeros((n, 2 * f), dtype=np.int64)
+        self.queue_tails = np.zeros((n, 2 * f), dtype=np.int64)
+        self._floors = np.arange(f)
+        self._lanes = np.arange(n)
+
+        # Wait totals per lane, the vectorized counterpart of WaitTracker
+        self.num_waiting = np.zeros(n, dtype=np.int64)
+        self.spawn_sum = np.zeros(n, dtype=np.int64)  # sum of spawn ticks of waiting passengers
+        self._recent_spawns = np.zeros((n, WAIT_CAP), dtype=np.int64)
+        self._recent_count = np.zeros(n, dtype=np.int64)
+        self._recent_deficit = np.zeros(n, dtype=np.int64)
+
+    def reset_lanes(self, lanes):
+        """Put the given lanes (boolean mask or indices) back to an empty building"""
+        self.ticks[lanes] = 0
+        self.delivered[lanes] = 0
+        self.positions[lanes] = 0
+        self.destinations[lanes] = self.NO_DESTINATION
+        self.directions[lanes] = 0
+        self.door_open[lanes] = False
+        self.door_timers[lanes] = 0
+        self.loads[lanes] = 0
+        self.queue_heads[lanes] = 0
+        self.queue_tails[lanes] = 0
+        self.num_waiting[lanes] = 0
+        self.spawn_sum[lanes] = 0
+        self._recent_spawns[lanes] = 0
+        self._recent_count[lanes] = 0
+        self._recent_deficit[lanes] = 0
+
+    def step(self, time_steps, active=None):
+        """Advance every lane (or only the `active` ones) by one tick"""
+        if active is None:
+            active = np.ones(self.num_buildings, dtype=bool)
+        self.ticks += active
+        self.delivered[:] = 0
+        self._age_waiting(active)
+
+        # Move elevators
+        self._move(active)
+        self._drop_passengers()
+
+        # Generate new passengers
+        self._generate_passengers(np.asarray(time_steps), active)
+
+    def take_actions(self, actions):
+        """Apply one (elevator_id, destination_floor) action per lane and return the rewards"""
+        actions = np.asarray(actions)
+        elevator_ids, floors = actions[:, 0], actions[:, 1]
+        valid = (elevator_ids >= 0) & (elevator_ids < self.num_elevators) & \
+            (floors >= 0) & (floors < self.num_floors)
+
+        # Only set destination if elevator isn't full
+        lanes = self._lanes[valid]
+        cars = elevator_ids[valid]
+        has_room = self.loads[lanes, cars] < self.capacity
+        self.destinations[lanes[has_room], cars[has_room]] = floors[valid][has_room]
+
+        return np.where(valid, self._calculate_rewards(), -10.0)  # Large penalty for invalid actions
+
+    def take_joint_actions(self, targets):
+        """Apply one joint action per lane, a destination floor per car (`num_floors` keeps the car's orders),
+        and return the rewards"""
+        targets = np.asarray(targets)
+        valid = ((targets >= 0) & (targets <= self.num_floors)).all(axis=1)
+
+        # Only set destinations of elevators that aren't full
+        assign = valid[:, None] & (targets < self.num_floors) & (self.loads < self.capacity)
+        self.destinations[assign] = targets[assign]
+
+        return np.where(valid, self._calculate_rewards(), -10.0)  # Large penalty for invalid actions
+
+    def _age_waiting(self, active):
+        lanes = self._lanes[active]
+        self._recent_deficit[lanes] -= self._recent_count[lanes]
+        slots = self.ticks[lanes] % WAIT_CAP  # passengers spawned WAIT_CAP ticks ago are now capped
+        self._recent_count[lanes] -= self._recent_spawns[lanes, slots]
+        self._recent_spawns[lanes, slots] = 0
+
+    def _move(self, active):
+        moving = (self.destinations >= 0) & active[:, None]
+        if not moving.any():
+            return
+        step = np.sign(np.where(moving, self.destinations - self.positions, 0))
+        self.directions = np.where(step != 0, step, self.directions)
+        self.positions += step * self.speed
+        arrived = moving & (self.directions != 0) & ((self.positions - self.destinations) * self.directions >= 0)
+
+        # Pick up on the way, in car order within each lane
+        self._pickup_passengers(moving, arrived)
+
+        # Snap to destination if overshot and handle arrival
+        if arrived.any():
+            self.positions[arrived] = self.destinations[arrived]
+            self.destinations[arrived] = self.NO_DESTINATION
+            self.directions[arrived] = 0
+            self.door_open[arrived] = True
+            self.door_timers[arrived] = 0
+
+    def _pickup_passengers(self, moving, arrived):
+        """Board queue heads going the car's way into cars with open doors, car by car across all lanes at once"""
+        floors = self.positions.clip(0, self.num_floors-1)
+        waiting = self.queue_tails - self.queue_heads
+        floor_waiting = waiting[:, UP_CALL::2] + waiting[:, DOWN_CALL::2]
+        candidates = moving & self.door_open & (self.loads < self.capacity) & (floors == self.positions) & \
+            (np.take_along_axis(floor_waiting, floors, axis=1) > 0)
+        # Cars ending their trip have no committed direction and serve the longest-waiting call
+        committed = (self.directions != 0) & ~arrived
+        for e in np.flatnonzero(candidates.any(axis=0)).tolist():
+            lanes = np.flatnonzero(candidates[:, e])
+            car_floors = floors[lanes, e]
+            rows = 2*car_floors + np.where(self.directions[lanes, e] == 1, UP_CALL, DOWN_CALL)
+            free = ~committed[lanes, e]
+            if free.any():
+                rows[free] = self._longest_waiting_rows(lanes[free], car_floors[free])
+            heads = self.queue_heads[lanes, rows]
+            loads = self.loads[lanes, e].astype(np.int64)
+            counts = np.minimum(self.queue_tails[lanes, rows] - heads, self.capacity - loads)
+            if not (counts > 0).any():
+                continue  # nobody going these ways, or earlier cars took them
+
+            # Gather the boarding groups as flat (lane, slot) pairs
+            group, offset = np.nonzero(self._slots < counts[:, None])
+            board_lanes = lanes[group]
+            boarding = self.queues[board_lanes, rows[group], heads[group] + offset]
+            self.riders[board_lanes, e, loads[group] + offset, :BOARD] = boarding
+            self.riders[board_lanes, e, loads[group] + offset, BOARD] = self.ticks[board_lanes]
+            self.queue_heads[lanes, rows] = heads + counts
+            self.loads[lanes, e] = loads + counts
+            self._forget_waiting(board_lanes, boarding[:, SPAWN])
+
+    def _longest_waiting_rows(self, lanes, floors):
+        """Queue rows of the hall calls whose head has waited longest at (lane, floor)"""
+        up, down = 2*floors + UP_CALL, 2*floors + DOWN_CALL
+        up_heads, down_heads = self.queue_heads[lanes, up], self.queue_heads[lanes, down]
+        last = self.queues.shape[2] - 1
+        up_spawns = self.queues[lanes, up, np.minimum(up_heads, last), SPAWN]
+        down_spawns = self.queues[lanes, down, np.minimum(down_heads, last), SPAWN]
+        up_waiting = self.queue_tails[lanes, up] > up_heads
+        take_down = (self.queue_tails[lanes, down] > down_heads) & (~up_waiting | (down_spawns < up_spawns))
+        return np.where(take_down, down, up)
+
+    def _forget_waiting(self, lanes, spawn_times):
+        """Remove boarded passengers from the wait bookkeeping of their lanes"""
+        n = self.num_buildings
+        self.num_waiting -= np.bincount(lanes, minlength=n)
+        self.spawn_sum -= np.bincount(lanes, weights=spawn_times, minlength=n).astype(np.int64)
+        waits = self.ticks[lanes] - spawn_times
+        recent = waits < WAIT_CAP
+        if recent.any():
+            lanes, spawn_times, waits = lanes[recent], spawn_times[recent], waits[recent]
+            np.subtract.at(self._recent_spawns, (lanes, spawn_times % WAIT_CAP), 1)
+            self._recent_count -= np.bincount(lanes, minlength=n)
+            self._recent_deficit -= np.bincount(lanes, weights=WAIT_CAP - waits, minlength=n).astype(np.int64)
+
+    def _drop_passengers(self):
+        drop_floors = np.where(self.door_open, self.positions, -1)
+        departing = (self.rider_destinations == drop_floors[..., None]) & (self._slots < self.loads[..., None])
+        if not departing.any():
+            return
+        self.delivered += departing.sum(axis=(1, 2))
+        # Stable-compact the remaining riders to the front of each car
+        order = np.argsort(departing, axis=2, kind='stable')
+        self.riders[:] = np.take_along_axis(self.riders, order[..., None], axis=2)
+        self.loads -= departing.sum(axis=2, dtype=np.int32)
+
+    def _generate_passengers(self, time_steps, active):
+        lanes, floors, destinations = self.traffic.sample_lanes(time_steps)
+        keep = active[lanes]
+        if not keep.all():
+            lanes, floors, destinations = lanes[keep], floors[keep], destinations[keep]
+        if lanes.size:
+            self._enqueue(lanes, floors, destinations)
+
+    def _enqueue(self, lanes, floors, destinations):
+        """Append passengers to their (lane, hall call) queues"""
+        calls = 2*floors + np.where(destinations > floors, UP_CALL, DOWN_CALL)
+        rows = lanes * len(self._rows) + calls
+        if len(rows) > 1 and (rows[1:] < rows[:-1]).any():
+            order = np.argsort(rows, kind='stable')
+            lanes, calls, rows, destinations = lanes[order], calls[order], rows[order], destinations[order]
+        ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        slots = self.queue_tails[lanes, calls] + ranks
+        if slots.max() >= self.queues.shape[2]:
+            self._make_room(ranks.max() + 1)
+            slots = self.queue_tails[lanes, calls] + ranks
+        self.queues[lanes, calls, slots, DESTINATION] = destinations
+        self.queues[lanes, calls, slots, SPAWN] = self.ticks[lanes]
+        self.queue_tails += np.bincount(rows, minlength=self.queue_tails.size).reshape(self.queue_tails.shape)
+
+        counts = np.bincount(lanes, minlength=self.num_buildings)
+        self.num_waiting += counts
+        self.spawn_sum += counts * self.ticks
+        self._recent_spawns[self._lanes, self.ticks % WAIT_CAP] += counts
+        self._recent_count += counts
+        self._recent_deficit += WAIT_CAP * counts
+
+    def _make_room(self, count):
+        """Compact every queue row to start at 0, doubling the capacity until every row
+        has room for `count` more passengers"""
+        queue_capacity = self.queues.shape[2]
+        columns = np.minimum(self.queue_heads[..., None] + np.arange(queue_capacity), queue_capacity-1)
+        self.queues[:] = np.take_along_axis(self.queues, columns[..., None], axis=2)
+        self.queue_tails -= self.queue_heads
+        self.queue_heads[:] = 0
+        while self.queue_tails.max() + count > self.queues.shape[2]:
+            queue_capacity = self.queues.shape[2]
+            grown = np.zeros(self.queues.shape[:2] + (2 * queue_capacity, 3), dtype=self.queues.dtype)
+            grown[..., ORIGIN] = self._rows[:, None] // 2
+            grown[:, :, :queue_capacity] = self.queues
+            self.queues = grown
+
+    def get_waiting_counts(self):
+        waiting = self.queue_tails - self.queue_heads
+        return waiting.reshape(self.num_buildings, self.num_floors, 2).sum(axis=2, dtype=np.int32)
+
+    def get_hall_calls(self):
+        """Whether each (lane, floor) has someone waiting to go up / down, shape (N, num_floors, 2)"""
+        return (self.queue_tails > self.queue_heads).reshape(self.num_buildings, self.num_floors, 2)
+
+    def get_max_wait_times(self):
+        """Longest wait per (lane, floor): the wait of the older queue head"""
+        heads = self.queue_heads.clip(0, self.queues.shape[2]-1)
+        spawns = np.take_along_axis(self.queues[..., SPAWN], heads[..., None], axis=2)[..., 0]
+        spawns = np.where(self.queue_tails > self.queue_heads, spawns, self.ticks[:, None])
+        oldest = spawns.reshape(self.num_buildings, self.num_floors, 2).min(axis=2)
+        return (self.ticks[:, None] - oldest).astype(np.int32)
+
+    def get_car_calls(self):
+        """Floors requested by the riders of each car, shape (num_buildings, num_elevators, num_floors)"""
+        calls = np.zeros((self.num_buildings, self.num_elevators, self.num_floors), dtype=bool)
+        lanes, cars, slots = np.nonzero(self._slots < self.loads[..., None])
+        calls[lanes, cars, self.rider_destinations[lanes, cars, slots]] = True
+        return calls
+
+    def get_dispatchable(self):
+        """Cars that are standing still and have room, shape (num_buildings, num_elevators)"""
+        return (self.directions == 0) & (self.loads < self.capacity)
+
+    def get_valid_dispatches(self):
+        """Whether dispatching each car to each floor has any effect per lane, shape
+        (num_buildings, num_elevators, num_floors); see Building.get_valid_dispatches"""
+        destinations = self.destinations[..., None]
+        at_empty_floor = (destinations < 0) & (self._floors == self.positions[..., None]) & \
+            (self.get_waiting_counts() == 0)[:, None, :]
+        return (self.loads < self.capacity)[..., None] & (self._floors != destinations) & ~at_empty_floor
+
+    def fill_observations(self, obs):
+        """Write car and queue state of every lane into the preallocated (N, ...) arrays of `obs`"""
+        obs["elevator_positions"][:] = self.positions
+        obs["elevator_directions"][:] = self.directions
+        np.divide(self.loads, self.capacity, out=obs["elevator_loads"], casting="unsafe")
+        obs["waiting_counts"][:] = self.get_waiting_counts()
+        obs["waiting_times"][:] = self.get_max_wait_times()
+        obs["hall_calls"][:] = self.get_hall_calls()
+
+    def get_total_wait_times(self):
+        return self.num_waiting * self.ticks - self.spawn_sum
+
+    def get_utilizations(self):
+        return self.loads.mean(axis=1) / self.capacity
+
+    def _calculate_rewards(self):
+        # Delivery bonus (most important), per passenger who got off this step
+        delivered = self.delivered * 5.0
+
+        # Wait penalty (capped per passenger)
+        wait_penalty = (WAIT_CAP * self.num_waiting - self._recent_deficit) * 0.1
+
+        # Movement penalty (only when empty)
+        moving = self.directions != 0
+        move_penalty = 0.05 * (moving.sum(axis=1) + (moving & (self.loads > 0)).sum(axis=1))
+
+        rewards = delivered - wait_penalty - move_penalty
+        return np.clip(rewards/10, -1, 1)  # Scaled and bounded
+
+    def __str__(self):
+        return (f"BatchedBuilding with {self.num_buildings} buildings of "
+                f"{self.num_floors} floors and {self.num_elevators} elevators")
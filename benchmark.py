@@ -0,0 +1,233 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+import numpy as np
+from building import Building
+from array_building import ArrayBuilding
+from elevator_env import ElevatorEnv
+
+# Minutes [start, end) of the day under each traffic intensity (see TrafficGenerator)
+PHASES = {"off_peak": (0, 480), "morning_peak": (480, 600), "evening_peak": (1020, 1140)}
+CORES = {"object": Building, "array": ArrayBuilding}
+FULL_GRID = dict(floors=[10, 20, 50], elevators=[3, 6, 12], phases=list(PHASES))
+QUICK_GRID = dict(floors=[10, 50], elevators=[3, 12], phases=["off_peak", "morning_peak"])
+
+def _summary(durations_ns):
+    """Throughput and latency percentiles from per-step durations"""
+    durations_us = np.asarray(durations_ns) / 1000
+    return {
+        "steps": len(durations_us),
+        "steps_per_sec": len(durations_us) / (durations_us.sum() / 1e6),
+        "p50_us": float(np.percentile(durations_us, 50)),
+        "p90_us": float(np.percentile(durations_us, 90)),
+        "p99_us": float(np.percentile(durations_us, 99)),
+    }
+
+def _phase_minutes(phase, steps, warmup):
+    """Minute of the day of every step: the warmup runs up to the start of the phase, the
+    measured steps wrap around inside it so they all see its traffic"""
+    start, end = PHASES[phase]
+    warm = (start - warmup + np.arange(warmup)) % 1440
+    measured = start + np.arange(steps) % (end - start)
+    return np.concatenate((warm, measured)).tolist()
+
+def bench_building_step(core, num_floors, num_elevators, phase, steps, warmup):
+    """Building.step latency, with a random dispatch between steps to keep the cars busy"""
+    building = CORES[core](num_floors, num_elevators, seed=0)
+    rng = np.random.default_rng(0)
+    actions = list(zip(rng.integers(num_elevators, size=warmup+steps).tolist(),
+                       rng.integers(num_floors, size=warmup+steps).tolist()))
+    minutes = _phase_minutes(phase, steps, warmup)
+    durations = []
+    for i, action in enumerate(actions):
+        t0 = time.perf_counter_ns()
+        building.step(minutes[i])
+        t1 = time.perf_counter_ns()
+        building.take_action(action)
+        if i >= warmup:
+            durations.append(t1 - t0)
+    return _summary(durations)
+
+def bench_env_step(core, num_floors, num_elevators, phase, steps, warmup):
+    """ElevatorEnv.step latency under random actions"""
+    env = ElevatorEnv(num_floors, num_elevators, episode_length=10**9, array_core=(core == "array"))
+    env.reset(seed=0)
+    env.action_space.seed(0)
+    actions = [env.action_space.sample() for _ in range(warmup+steps)]
+    minutes = _phase_minutes(phase, steps, warmup)
+    durations = []
+    for i, action in enumerate(actions):
+        env.current_step = minutes[i] - 1  # step() advances it to minutes[i]
+        t0 = time.perf_counter_ns()
+        env.step(action)
+        if i >= warmup:
+            durations.append(time.perf_counter_ns() - t0)
+    return _summary(durations)
+
+def bench_episode(core, num_floors, num_elevators, episodes):
+    """Full-day episodes under random actions; latency is per episode step"""
+    env = ElevatorEnv(num_floors, num_elevators, array_core=(core == "array"))
+    env.action_space.seed(0)
+    durations = []
+    for episode in range(episodes):
+        env.reset(seed=episode)
+        actions = [env.action_space.sample() for _ in range(env.episode_length)]
+        for action in actions:
+            t0 = time.perf_counter_ns()
+            env.step(action)
+            durations.append(time.perf_counter_ns() - t0)
+    return _summary(durations)
+
+def bench_vec_rollout(kind, num_envs, num_floors, num_elevators, phase, steps, warmup):
+    """Vectorized rollout steps as seen by PPO; throughput counts individual building steps"""
+    from stable_baselines3.common.env_util import make_vec_env
+    from vec_env import ElevatorVecEnv
+
+    if kind == "batched":
+        env = ElevatorVecEnv(num_envs, num_floors, num_elevators, seed=0)
+    else:
+        env = make_vec_env(lambda: ElevatorEnv(num_floors, num_elevators, array_core=(kind == "dummy_array")),
+                           n_envs=num_envs, seed=0)
+    env.reset()
+    rng = np.random.default_rng(0)
+    actions = np.stack([rng.integers(num_elevators, size=(warmup+steps, num_envs)),
+                        rng.integers(num_floors, size=(warmup+steps, num_envs))], axis=-1)
+    minutes = _phase_minutes(phase, steps, warmup)
+    durations = []
+    for i in range(warmup+steps):
+        # Every lane at the same minute; step() advances it to minutes[i]
+        if kind == "batched":
+            env.current_steps[:] = minutes[i] - 1
+        else:
+            for lane in env.envs:
+                lane.unwrapped.current_step = minutes[i] - 1
+        t0 = time.perf_counter_ns()
+        env.step(actions[i])
+        if i >= warmup:
+            durations.append(time.perf_counter_ns() - t0)
+    env.close()
+    result = _summary(durations)
+    result["steps_per_sec"] *= num_envs  # building steps per second
+    return result
+
+def run_suite(grid, steps, warmup, episodes, num_envs, benches):
+    results = []
+
+    def record(bench, result, **config):
+        results.append(dict(bench=bench, **config, **result))
+        print(f"{bench:<14} " + " ".join(f"{k}={v}" for k, v in config.items()) +
+              f"  {result['steps_per_sec']:>10.0f} steps/s  p50 {result['p50_us']:.1f}us  p99 {result['p99_us']:.1f}us")
+
+    for core in CORES:
+        for num_floors in grid["floors"]:
+            for num_elevators in grid["elevators"]:
+                config = dict(core=core, floors=num_floors, elevators=num_elevators)
+                for phase in grid["phases"]:
+                    if "building_step" in benches:
+                        record("building_step", bench_building_step(core, num_floors, num_elevators, phase,
+                                                                    steps, warmup), **config, phase=phase)
+                    if "env_step" in benches:
+                        record("env_step", bench_env_step(core, num_floors, num_elevators, phase,
+                                                          steps, warmup), **config, phase=phase)
+                if "episode" in benches:
+                    record("episode", bench_episode(core, num_floors, num_elevators, episodes),
+                           **config, phase="full_day")
+
+    if "vec_rollout" in benches:
+        for kind in ("dummy", "dummy_array", "batched"):
+            for num_floors in grid["floors"]:
+                for num_elevators in grid["elevators"]:
+                    for phase in grid["phases"]:
+                        record("vec_rollout", bench_vec_rollout(kind, num_envs, num_floors, num_elevators, phase,
+                                                                steps, warmup),
+                               core=kind, floors=num_floors, elevators=num_elevators, phase=phase, envs=num_envs)
+    return results
+
+def core_ratios(results):
+    """Object/array p50 latency ratio of every configuration run on both cores, printed as a table"""
+    p50 = {}
+    for r in results:
+        if r["core"] in CORES:
+            p50[(r["bench"], r["floors"], r["elevators"], r["phase"], r["core"])] = r["p50_us"]
+    ratios = []
+    for (bench, floors, elevators, phase, core), value in p50.items():
+        array = p50.get((bench, floors, elevators, phase, "array"))
+        if core == "object" and array:
+            ratios.append(dict(bench=bench, floors=floors, elevators=elevators, phase=phase,
+                               object_p50_us=value, array_p50_us=array, speedup=value / array))
+    if ratios:
+        print("\nArray core speedup (object p50 / array p50):")
+        for r in ratios:
+            print(f"  {r['bench']:<14} floors={r['floors']} elevators={r['elevators']} phase={r['phase']:<13}"
+                  f" {r['object_p50_us']:8.1f}us / {r['array_p50_us']:8.1f}us = {r['speedup']:5.2f}x")
+    return ratios
+
+def _key(result):
+    return (result["bench"], result["core"], result["floors"], result["elevators"], result["phase"],
+            result.get("envs"))
+
+def compare(results, baseline, tolerance):
+    """Print throughput changes against a baseline and return the regressed entries"""
+    previous = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    print(f"\nComparison against baseline from {baseline.get('created', 'unknown')} (tolerance {tolerance:.0%}):")
+    for result in results:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        change = result["steps_per_sec"] / old["steps_per_sec"] - 1
+        flag = ""
+        if change < -tolerance:
+            flag = "  REGRESSION"
+            regressions.append(result)
+        print(f"  {' '.join(str(k) for k in _key(result) if k is not None):<50} {change:+7.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulator and environment benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Smaller grid for a fast check")
+    parser.add_argument("--steps", type=int, default=500, help="Measured steps per configuration")
+    parser.add_argument("--warmup", type=int, default=200, help="Unmeasured steps to build up queues first")
+    parser.add_argument("--episodes", type=int, default=1, help="Full-day episodes per configuration")
+    parser.add_argument("--envs", type=int, default=16, help="Environments for vectorized rollouts")
+    parser.add_argument("--bench", nargs="+", default=["building_step", "env_step", "episode", "vec_rollout"],
+                        help="Benchmarks to run")
+    parser.add_argument("--output", type=str, default="benchmark_results.json", help="Where to write results")
+    parser.add_argument("--baseline", type=str, default="benchmark_baseline.json", help="Baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative throughput drop")
+    args = parser.parse_args()
+
+    results = run_suite(QUICK_GRID if args.quick else FULL_GRID, args.steps, args.warmup,
+                        args.episodes, args.envs, args.bench)
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+        "core_ratios": core_ratios(results),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    if compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
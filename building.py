@@ -1,47 +1,84 @@
-import random
+from collections import deque
 import numpy as np
 from elevator import Elevator
+from traffic import TrafficGenerator, UP_CALL, DOWN_CALL
+from wait_tracker import WaitTracker
+from ledger import TripLedger
+from snapshot import SNAPSHOT_VERSION, CAR_WORDS, SnapshotReader, read_building_header
 
 class Passenger:
     def __init__(self, start_floor, destination_floor, spawn_time):
         self.start_floor = start_floor
         self.destination = destination_floor
         self.spawn_time = spawn_time
-        self.wait_time = 0
-        
-    def increment_wait(self):
-        self.wait_time += 1
+        self.wait_time = 0  # set when boarding; while waiting it is Building.time - spawn_time
+        self.board_time = None
 
 class Building:
-    def __init__(self, num_floors, num_elevators):
+    def __init__(self, num_floors, num_elevators, seed=None, traffic=None):
         self.num_floors = num_floors
+        self.traffic = traffic if traffic is not None else TrafficGenerator(num_floors, seed=seed)
         self.elevators = [Elevator(i, num_floors, building=self) for i in range(num_elevators)]
-        self.waiting_passengers = {floor: [] for floor in range(num_floors)}
-        self.state = self._get_state()
-        self.next_state = None
+        # Per-floor FIFO queues for each travel direction (1: up, -1: down); the head is
+        # always the longest-waiting passenger of that hall call
+        self.waiting_passengers = {floor: {1: deque(), -1: deque()} for floor in range(num_floors)}
+        self.time = 0  # number of steps simulated, the clock passenger waits are measured on
+        self.waits = WaitTracker()
+        self.ledger = TripLedger()  # completed trips
+        self.delivered = 0  # passengers delivered during the current step
+        self.profiler = None  # StepProfiler, set to time the step phases
+
+        # Observation counters, kept current by elevator and queue events
+        self.positions = np.array([e.current_floor for e in self.elevators], dtype=np.int32)
+        self.directions = np.array([e.direction for e in self.elevators], dtype=np.int32)
+        self.loads = np.array([len(e.passengers) for e in self.elevators], dtype=np.int32)
+        self.capacities = np.array([e.capacity for e in self.elevators], dtype=np.float32)
+        self.waiting_counts = np.zeros(num_floors, dtype=np.int32)
+        self.call_counts = np.zeros((num_floors, 2), dtype=np.int32)  # waiting per floor, UP_CALL/DOWN_CALL
+        self.head_spawn_times = np.zeros((num_floors, 2), dtype=np.int64)  # spawn time of each queue head
+
+    @property
+    def state(self):
+        return self._get_state()
 
     def step(self, time_step=None):  # Make time_step optional
-        # Update passenger wait times
-        for floor, passengers in self.waiting_passengers.items():
-            for p in passengers:
-                p.increment_wait()
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+            waiting = self.waits.count
+
+        # Advance the clock; wait times follow from spawn times
+        self.time += 1
+        self.delivered = 0
+        self.waits.advance(self.time)
+        if profiler is not None:
+            profiler.mark("wait_update")
         
         # Move elevators
         for elevator in self.elevators:
             elevator.move()
             elevator.remove_passengers()
+        if profiler is not None:
+            profiler.mark("movement")
+            boarded = waiting - self.waits.count
+            profiler.count("picked_up", boarded)
+            profiler.count("delivered", self.delivered)
+            waiting = self.waits.count
 
         # Generate new passengers (pass time_step if needed)
         if time_step is not None:
             self._generate_passengers(time_step)
         else:
             self._generate_passengers()
-
-        # Update state
-        self.state = self.next_state if self.next_state else self._get_state()
-        self.next_state = self._get_state()
+        if profiler is not None:
+            profiler.mark("generation")
+            profiler.count("generated", self.waits.count - waiting)
+            profiler.gauge("waiting", self.waits.count)
+            profiler.gauge("longest_queue", int(self.waiting_counts.max()))
 
     def take_action(self, action):
+        if self.profiler is not None:
+            self.profiler.start()
         elevator_id, destination_floor = action
         
         # Validate action
@@ -56,63 +93,257 @@ class Building:
         # Only set destination if elevator isn't full
         if len(elevator.passengers) < elevator.capacity:
             elevator.destination = destination_floor
+        if self.profiler is not None:
+            self.profiler.mark("dispatch")
         
         return self._calculate_reward()
 
+    def take_joint_action(self, targets):
+        """Give every car its destination floor in one action; a target of `num_floors` keeps the car's orders"""
+        if self.profiler is not None:
+            self.profiler.start()
+        if len(targets) != len(self.elevators) or not all(0 <= t <= self.num_floors for t in targets):
+            return -10  # Large penalty for invalid targets
+
+        # Only set destinations of elevators that aren't full
+        for elevator, target in zip(self.elevators, targets):
+            if target < self.num_floors and len(elevator.passengers) < elevator.capacity:
+                elevator.destination = int(target)
+        if self.profiler is not None:
+            self.profiler.mark("dispatch")
+
+        return self._calculate_reward()
+
     def _generate_passengers(self, time_step=0):
-        # Simulate peak hours (morning rush - going up, evening - going down)
-        is_morning_peak = (time_step % 1440) in range(480, 600)  # 8-10AM
-        is_evening_peak = (time_step % 1440) in range(1020, 1140)  # 5-7PM
-        
-        for floor in range(self.num_floors):
-            # Higher probability for lobby during morning, top floors during evening
-            prob = 0.05  # base probability
-            if floor == 0 and is_morning_peak:
-                prob = 0.3
-            elif floor == self.num_floors-1 and is_evening_peak:
-                prob = 0.3
-                
-            if random.random() < prob:
-                if is_morning_peak and floor == 0:
-                    destination = random.randint(floor+1, self.num_floors-1)
-                elif is_evening_peak and floor == self.num_floors-1:
-                    destination = 0
-                else:
-                    destination = random.choice([f for f in range(self.num_floors) if f != floor])
-                self.waiting_passengers[floor].append(Passenger(floor, destination, time_step))
+        floors, destinations = self.traffic.sample(time_step)
+        for floor, destination in zip(floors.tolist(), destinations.tolist()):
+            self.add_waiting(Passenger(floor, destination, self.time))
 
     def _get_state(self):
         return {
-            'elevator_positions': [elevator.current_floor for elevator in self.elevators],
-            'elevator_directions': [elevator.direction for elevator in self.elevators],  # 1=up, -1=down, 0=idle
-            'elevator_loads': [len(elevator.passengers)/elevator.capacity for elevator in self.elevators],
-            'waiting_passengers': {floor: len(passengers) for floor, passengers in self.waiting_passengers.items()},
-            'waiting_times': {floor: max([p.wait_time for p in passengers], default=0) 
-                            for floor, passengers in self.waiting_passengers.items()}
+            'elevator_positions': self.positions.tolist(),
+            'elevator_directions': self.directions.tolist(),  # 1=up, -1=down, 0=idle
+            'elevator_loads': (self.loads / self.capacities).tolist(),
+            'waiting_passengers': dict(enumerate(self.waiting_counts.tolist())),
+            'waiting_times': dict(enumerate(self.get_max_wait_times().tolist())),
+            'hall_calls': dict(enumerate(self.get_hall_calls().tolist()))
         }
 
+    def fill_observation(self, obs):
+        """Write the observation counters into the preallocated arrays of `obs`"""
+        obs["elevator_positions"][:] = self.positions
+        obs["elevator_directions"][:] = self.directions
+        np.divide(self.loads, self.capacities, out=obs["elevator_loads"])
+        obs["waiting_counts"][:] = self.waiting_counts
+        obs["waiting_times"][:] = self.get_max_wait_times()
+        np.greater(self.call_counts, 0, out=obs["hall_calls"], casting="unsafe")
+
+    def elevator_changed(self, elevator):
+        """Refresh the counters of an elevator after it moved, boarded or unloaded"""
+        self.positions[elevator.id] = elevator.current_floor
+        self.directions[elevator.id] = elevator.direction
+        self.loads[elevator.id] = len(elevator.passengers)
+
+    def add_waiting(self, passenger):
+        """Queue a passenger at their start floor, in the queue of their travel direction"""
+        floor = passenger.start_floor
+        direction = 1 if passenger.destination > floor else -1
+        column = UP_CALL if direction == 1 else DOWN_CALL
+        queue = self.waiting_passengers[floor][direction]
+        if not queue:
+            self.head_spawn_times[floor, column] = passenger.spawn_time
+        queue.append(passenger)
+        self.waiting_counts[floor] += 1
+        self.call_counts[floor, column] += 1
+        self.waits.add(passenger.spawn_time)
+
+    def passenger_boarded(self, passenger):
+        """Account for a passenger that was just popped from the head of its queue"""
+        floor = passenger.start_floor
+        direction = 1 if passenger.destination > floor else -1
+        column = UP_CALL if direction == 1 else DOWN_CALL
+        queue = self.waiting_passengers[floor][direction]
+        if queue:
+            self.head_spawn_times[floor, column] = queue[0].spawn_time
+        self.waiting_counts[floor] -= 1
+        self.call_counts[floor, column] -= 1
+        passenger.board_time = self.time
+        passenger.wait_time = self.time - passenger.spawn_time
+        self.waits.remove(passenger.spawn_time)
+
+    def passengers_arrived(self, passengers):
+        """Record riders that just got off at their destination"""
+        for p in passengers:
+            self.ledger.record(p.start_floor, p.destination, p.spawn_time, p.board_time, self.time)
+        self.delivered += len(passengers)
+
+    def longest_waiting_direction(self, floor):
+        """Direction (1 or -1) of the floor's longest-waiting passenger, 0 if nobody waits"""
+        up, down = self.waiting_passengers[floor][1], self.waiting_passengers[floor][-1]
+        if not down:
+            return 1 if up else 0
+        return 1 if up and up[0].spawn_time <= down[0].spawn_time else -1
+
+    def get_wait_time(self, passenger):
+        return self.time - passenger.spawn_time
+
+    def get_max_wait_time(self, floor):
+        heads = [queue[0].spawn_time for queue in self.waiting_passengers[floor].values() if queue]
+        return self.time - min(heads) if heads else 0
+
+    def get_waiting_counts(self):
+        return self.waiting_counts.copy()
+
+    def get_destination(self, elevator_id):
+        return self.elevators[elevator_id].destination
+
+    def get_destinations(self):
+        """Destination floor of each car, -1 for none"""
+        return np.array([-1 if e.destination is None else e.destination for e in self.elevators], dtype=np.int32)
+
+    def get_car_calls(self):
+        """Floors requested by the riders of each car, shape (num_elevators, num_floors)"""
+        calls = np.zeros((len(self.elevators), self.num_floors), dtype=bool)
+        for elevator in self.elevators:
+            calls[elevator.id, [p.destination for p in elevator.passengers]] = True
+        return calls
+
+    def get_dispatchable(self):
+        """Cars that are standing still and have room, i.e. waiting for a dispatch"""
+        return (self.directions == 0) & (self.loads < self.capacities)
+
+    def get_valid_dispatches(self):
+        """Whether dispatching each car to each floor is worth doing, shape (num_elevators, num_floors).
+        Full cars ignore dispatches, repeating a car's order changes nothing (beyond holding it at the
+        floor if it arrives this tick), and sending a car without orders to its own floor only holds
+        it there unless someone waits."""
+        floors = np.arange(self.num_floors)
+        destinations = self.get_destinations()[:, None]
+        at_empty_floor = (destinations < 0) & (floors == self.positions[:, None]) & (self.waiting_counts == 0)
+        return (self.loads < self.capacities)[:, None] & (floors != destinations) & ~at_empty_floor
+
+    def get_max_wait_times(self):
+        return self.time - np.where(self.call_counts > 0, self.head_spawn_times, self.time).min(axis=1)
+
+    def get_hall_calls(self):
+        """Whether each floor has someone waiting to go up / down, shape (num_floors, 2)"""
+        return self.call_counts > 0
+
+    def get_call_counts(self):
+        """Passengers waiting at each floor to go up / down, shape (num_floors, 2)"""
+        return self.call_counts.copy()
+
+    def get_car_call_counts(self):
+        """Riders of each car by destination floor, shape (num_elevators, num_floors)"""
+        counts = np.zeros((len(self.elevators), self.num_floors), dtype=np.int32)
+        for elevator in self.elevators:
+            for p in elevator.passengers:
+                counts[elevator.id, p.destination] += 1
+        return counts
+
+    def get_waiting(self, floor):
+        """Passengers waiting at `floor`, up queue first"""
+        queues = self.waiting_passengers[floor]
+        return list(queues[1]) + list(queues[-1])
+
     def get_all_waiting(self):
         """Returns list of all waiting passengers"""
-        return [p for passengers in self.waiting_passengers.values() for p in passengers]
+        return [p for floor in self.waiting_passengers for p in self.get_waiting(floor)]
+
+    def get_open_waits(self):
+        """Waits of the passengers not delivered yet: riders waited until boarding, and those
+        still waiting have waited until now (a lower bound on their final wait)"""
+        riding = [p.board_time - p.spawn_time for elevator in self.elevators for p in elevator.passengers]
+        waiting = [self.time - p.spawn_time for p in self.get_all_waiting()]
+        return np.array(riding + waiting, dtype=np.int64)
+
+    def get_open_trips(self):
+        """(origin, destination) rows of the passengers not delivered yet, riders first"""
+        passengers = [p for elevator in self.elevators for p in elevator.passengers] + self.get_all_waiting()
+        return np.array([(p.start_floor, p.destination) for p in passengers], dtype=np.int64).reshape(-1, 2)
+
+    def get_total_wait_time(self):
+        return self.waits.total_wait()
+
+    def get_utilization(self):
+        return float(np.mean(self.loads / self.capacities))
         
     def _calculate_reward(self):
-        # Delivery bonus (most important)
-        delivered = sum(
-            1 for e in self.elevators
-            if any(p.destination == e.current_floor for p in e.passengers)
-        ) * 5.0  # Increased bonus
+        # Delivery bonus (most important), per passenger who got off this step
+        delivered = self.delivered * 5.0  # Increased bonus
         
         # Wait penalty (capped per passenger)
-        wait_penalty = sum(min(p.wait_time, 20) for p in self.get_all_waiting()) * 0.1
+        wait_penalty = self.waits.capped_wait_sum() * 0.1
         
         # Movement penalty (only when empty)
-        move_penalty = sum(
-            abs(e.direction) * (0.1 if e.passengers else 0.05)
-            for e in self.elevators
-        )
+        moving = self.directions != 0
+        move_penalty = 0.05 * (np.count_nonzero(moving) + np.count_nonzero(moving & (self.loads > 0)))
         
         reward = delivered - wait_penalty - move_penalty
+        if self.profiler is not None:
+            self.profiler.mark("reward")
         return np.clip(reward/10, -1, 1)  # Scaled and bounded
 
+    def snapshot(self):
+        """Simulation state as a flat int64 array, see snapshot.py for the layout.
+
+        Completed trips are history and only their count is kept: restoring
+        truncates the ledger back to it instead of copying it.
+        """
+        cars, riders = [], []
+        for e in self.elevators:
+            destination = -1 if e.destination is None else e.destination
+            cars += [e.current_floor, destination, e.direction, e.door_open, e.door_timer, len(e.passengers)]
+            for p in e.passengers:
+                riders += [p.start_floor, p.destination, p.spawn_time, p.board_time]
+        counts, waiting = [], []
+        for floor in range(self.num_floors):
+            for direction in (1, -1):
+                queue = self.waiting_passengers[floor][direction]
+                counts.append(len(queue))
+                for p in queue:
+                    waiting += [p.start_floor, p.destination, p.spawn_time]
+        header = [SNAPSHOT_VERSION, self.num_floors, len(self.elevators), self.time, self.delivered, len(self.ledger)]
+        words = np.array(header + cars + riders + counts + waiting + self.waits.snapshot(), dtype=np.int64)
+        return np.concatenate((words, self.traffic.snapshot()))
+
+    def restore(self, snapshot):
+        """Return to the state of a snapshot() of this building (or of an ArrayBuilding of the same shape)"""
+        reader = SnapshotReader(snapshot)
+        self.time, self.delivered, trips = read_building_header(reader, self.num_floors, len(self.elevators))
+        cars = reader.take(CAR_WORDS * len(self.elevators)).reshape(-1, CAR_WORDS).tolist()
+        riders = reader.take(4 * sum(car[5] for car in cars)).reshape(-1, 4).tolist()
+        for elevator, (floor, destination, direction, door_open, door_timer, load) in zip(self.elevators, cars):
+            elevator.current_floor = floor
+            elevator.destination = None if destination < 0 else destination
+            elevator.direction = direction
+            elevator.door_open = bool(door_open)
+            elevator.door_timer = door_timer
+            elevator.passengers = [self._rider(*row) for row in riders[:load]]
+            riders = riders[load:]
+            self.elevator_changed(elevator)
+
+        counts = reader.take(2 * self.num_floors)
+        waiting = reader.take(3 * int(counts.sum())).reshape(-1, 3).tolist()
+        self.call_counts[:] = counts.reshape(self.num_floors, 2)
+        self.waiting_counts[:] = self.call_counts.sum(axis=1)
+        for floor in range(self.num_floors):
+            for column, direction in enumerate((1, -1)):
+                count = int(self.call_counts[floor, column])
+                queue = self.waiting_passengers[floor][direction] = deque(Passenger(*row) for row in waiting[:count])
+                waiting = waiting[count:]
+                if queue:
+                    self.head_spawn_times[floor, column] = queue[0].spawn_time
+        self.waits.restore(reader.take(self.waits.cap + 5).tolist())
+        self.traffic.restore(reader.rest())
+        self.ledger.size = min(self.ledger.size, trips)
+
+    @staticmethod
+    def _rider(start_floor, destination, spawn_time, board_time):
+        passenger = Passenger(start_floor, destination, spawn_time)
+        passenger.board_time = board_time
+        passenger.wait_time = board_time - spawn_time
+        return passenger
+
     def __str__(self):
         return f"Building with {self.num_floors} floors and {len(self.elevators)} elevators"
\ No newline at end of file
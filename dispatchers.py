@@ -0,0 +1,137 @@
+import numpy as np
+from elevator_env import ElevatorEnv, dispatch_action
+
+STOP_TIME = 2  # ticks a stop costs, Elevator.loading_time
+
+class Dispatcher:
+    """Rule-based dispatch policy with the `predict` interface of Stable-Baselines3 models.
+
+    Car calls (where the riders of a car want to go) and car destinations are
+    not part of the observation, so a dispatcher reads the DispatchState of
+    the env it is bound to: an ElevatorEnv, or any VecEnv of them
+    (DummyVecEnv, SharedMemoryVecEnv, ElevatorVecEnv) for batched predictions.
+    Subclasses score every (car, floor) pair in `_costs`; the cheapest pair
+    among the cars waiting for a dispatch becomes the action (in joint action
+    mode, that car's target with every other car keeping its orders).
+    """
+    def __init__(self, env):
+        if isinstance(getattr(env, "unwrapped", None), ElevatorEnv):
+            self.env = env.unwrapped
+            self.num_envs = 1
+            config = [getattr(self.env, name) for name in ("num_floors", "num_elevators", "joint_actions")]
+        elif hasattr(env, "env_method"):
+            self.env = env
+            self.num_envs = env.num_envs
+            config = [env.get_attr(name, 0)[0] for name in ("num_floors", "num_elevators", "joint_actions")]
+        else:
+            raise ValueError("Dispatchers need an ElevatorEnv or a VecEnv of them")
+        self.num_floors, self.num_elevators, self.joint_actions = config
+
+    def states(self):
+        """DispatchState of every lane of the bound env"""
+        if isinstance(self.env, ElevatorEnv):
+            return [self.env.dispatch_state()]
+        if hasattr(self.env, "dispatch_states"):  # ElevatorVecEnv reads all lanes in one pass
+            return self.env.dispatch_states()
+        return self.env.env_method("dispatch_state")
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        positions = observation["elevator_positions"] if isinstance(observation, dict) else observation
+        actions = [self._action(*self._act(lane, building)) for lane, building in enumerate(self.states())]
+        return (np.array(actions) if np.ndim(positions) == 2 else actions[0]), state
+
+    def _action(self, car, floor):
+        return dispatch_action(car, floor, self.num_floors, self.num_elevators, self.joint_actions)
+
+    def _act(self, lane, building):
+        costs = self._dispatch_costs(lane, building)
+        car, floor = divmod(int(np.argmin(costs)), building.num_floors)
+        if np.isfinite(costs[car, floor]):
+            self._dispatched(lane, building, car, floor)
+            return car, floor
+        return self._standing_order(building)
+
+    def candidates(self, lane, building, count):
+        """Up to `count` dispatches worth making, cheapest first, then the no-op action"""
+        costs = self._dispatch_costs(lane, building)
+        order = np.argsort(costs, axis=None, kind="stable")[:count]
+        order = order[np.isfinite(costs.ravel()[order])]
+        pairs = [divmod(int(i), building.num_floors) for i in order]
+        no_op = self._standing_order(building)
+        return pairs + [no_op] if no_op not in pairs else pairs
+
+    def _dispatch_costs(self, lane, building):
+        """(num_elevators, num_floors) dispatch costs of a DispatchState, inf where a dispatch is not
+        worth making"""
+        costs = self._costs(lane, building)
+        costs[~building.dispatchable] = np.inf
+        costs[~building.valid] = np.inf  # full, or already ordered there
+        return costs
+
+    @staticmethod
+    def _standing_order(building):
+        """Nothing to do: repeat a standing order, or hold a car where it is"""
+        heading = np.flatnonzero(building.destinations >= 0)
+        car = int(heading[0]) if len(heading) else 0
+        return car, int(building.destinations[car]) if len(heading) else int(building.positions[car])
+
+    def _dispatched(self, lane, building, car, floor):
+        pass
+
+    @staticmethod
+    def _open_calls(building):
+        """Floors with a hall call that no car is already heading to"""
+        floors = np.arange(building.num_floors)
+        return building.hall_calls.any(axis=1) & ~np.isin(floors, building.destinations)
+
+    @staticmethod
+    def _distances(building):
+        return np.abs(np.arange(building.num_floors) - building.positions[:, None]).astype(np.float64)
+
+class NearestCarDispatcher(Dispatcher):
+    """Loaded cars go to their nearest car call, empty cars to the nearest open hall call"""
+    def _costs(self, lane, building):
+        distances = self._distances(building)
+        requests = building.car_calls.copy()  # a state may be scored more than once, keep it intact
+        empty = building.loads == 0
+        requests[empty] = self._open_calls(building)
+        return np.where(requests, distances, np.inf)
+
+class CollectiveDispatcher(Dispatcher):
+    """Collective control (LOOK): each car sweeps in one direction, stopping at car calls
+    and hall calls going its way, and reverses when nothing is left ahead"""
+    def __init__(self, env):
+        super().__init__(env)
+        self._sweeps = [np.ones(self.num_elevators, dtype=np.int64) for _ in range(self.num_envs)]
+
+    def _costs(self, lane, building):
+        num_floors = building.num_floors
+        sweeps = self._sweeps[lane][:, None]
+        offsets = np.arange(num_floors) - building.positions[:, None]
+        car_calls = building.car_calls
+        hall_calls = building.hall_calls
+        # Hall call in the sweep direction of each car, (num_elevators, num_floors)
+        same_way = np.where(sweeps > 0, hall_calls[:, 0], hall_calls[:, 1])
+        requests = car_calls | self._open_calls(building)
+        costs = np.abs(offsets) + num_floors * ~(car_calls | same_way) + 2 * num_floors * (offsets * sweeps < 0)
+        return np.where(requests, costs, np.inf)
+
+    def _dispatched(self, lane, building, car, floor):
+        if floor != building.positions[car]:
+            self._sweeps[lane][car] = 1 if floor > building.positions[car] else -1
+
+class ETADispatcher(Dispatcher):
+    """Estimated-time-of-arrival assignment: hall calls go to the car that reaches them
+    soonest, counting the stops for its riders first, longest waiting floors first"""
+    def _costs(self, lane, building):
+        distances = self._distances(building)
+        car_calls = building.car_calls
+        etas = distances + STOP_TIME * car_calls.sum(axis=1, keepdims=True)
+        hall_costs = np.where(self._open_calls(building), etas - building.max_wait_times, np.inf)
+        return np.where(car_calls, distances, hall_costs)
+
+DISPATCHERS = {
+    "nearest": NearestCarDispatcher,
+    "look": CollectiveDispatcher,
+    "eta": ETADispatcher,
+}
@@ -24,7 +24,7 @@ class Elevator:
                 self.current_floor -= self.speed
             
             # Auto-pickup if enabled
-            if hasattr(self, 'building'):  # Safety check
+            if self.building is not None:  # Safety check
                 self._try_pickup_passengers()
             
             # Snap to destination if overshot
@@ -32,21 +32,27 @@ class Elevator:
             (self.direction == -1 and self.current_floor <= self.destination):
                 self.current_floor = self.destination
                 self._handle_arrival()
+            self._notify_building()
 
     def _try_pickup_passengers(self):
-        if (not self.is_full() and 
-            self.current_floor in self.building.waiting_passengers and
-            self.building.waiting_passengers[self.current_floor]):
-            
-            # Sort passengers by longest waiting first
-            passengers = sorted(self.building.waiting_passengers[self.current_floor],
-                            key=lambda p: p.wait_time, reverse=True)
-            
-            # Take as many as capacity allows
-            for p in passengers[:self.get_available_space()]:
-                self.add_passenger(p)
-                self.building.waiting_passengers[self.current_floor].remove(p)
-                # print(f"Picked up passenger waiting {p.wait_time} steps")
+        queues = self.building.waiting_passengers.get(self.current_floor)
+        if self.is_full() or not self.door_open or queues is None:
+            return
+        # Riders only board a car going their way; a car ending its trip here has no
+        # committed direction and serves whichever hall call has waited longest
+        direction = self.direction
+        if direction == 0 or self._reaching_destination():
+            direction = self.building.longest_waiting_direction(self.current_floor)
+            if direction == 0:
+                return
+        # Queues are in arrival order, so the longest waiting board first;
+        # take as many as capacity allows
+        queue = queues[direction]
+        while queue and self.add_passenger(queue[0]):
+            self.building.passenger_boarded(queue.popleft())
+
+    def _reaching_destination(self):
+        return self.destination is not None and (self.current_floor - self.destination) * self.direction >= 0
 
     def _handle_arrival(self):
         """Helper method for destination arrival logic"""
@@ -70,9 +76,18 @@ class Elevator:
             return []
         
         departing = [p for p in self.passengers if p.destination == self.current_floor]
-        self.passengers = [p for p in self.passengers if p.destination != self.current_floor]
+        if departing:
+            self.passengers = [p for p in self.passengers if p.destination != self.current_floor]
+            self._notify_building()
+            if self.building is not None:
+                self.building.passengers_arrived(departing)
         return departing
 
+    def _notify_building(self):
+        """Keep the building's observation counters in sync with this car"""
+        if self.building is not None:
+            self.building.elevator_changed(self)
+
     def get_available_space(self):
         return self.capacity - len(self.passengers)
 
@@ -2,9 +2,100 @@ import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 from building import Building
+from array_building import ArrayBuilding
+from traffic import TrafficGenerator
+from traces import TraceReplay
+from step_profiler import StepProfiler
+from events import EventQueue
+from metrics import StreamingMetrics
+from snapshot import RNG_WORDS, pack_rng, unpack_rng, SnapshotReader
+
+# Flat observation layout (flat_obs=True): the Dict entries flattened in this order into one
+# float32 vector and divided by their upper bound, so every value lies in [-1, 1]
+# (waiting counts and times are clipped at 1). With E elevators and F floors:
+#   elevator_positions   [0, E)            floor / (F - 1)
+#   elevator_directions  [E, 2E)           -1 down, 0 idle, 1 up
+#   elevator_loads       [2E, 3E)          riders / capacity
+#   waiting_counts       [3E, 3E+F)        waiting passengers / 20
+#   waiting_times        [3E+F, 3E+2F)     longest wait / 100
+#   hall_calls           [3E+2F, 3E+4F)    up and down call flags, floor by floor
+#   time_step            [3E+4F]           step / episode_length
+#   elevator_destinations [3E+4F+1, 4E+4F+1)  destination / (F - 1), -1 / (F - 1) for none (joint actions only)
+FLAT_OBSERVATION_KEYS = ("elevator_positions", "elevator_directions", "elevator_loads",
+                         "waiting_counts", "waiting_times", "hall_calls", "time_step", "elevator_destinations")
+
+def flat_observation_layout(observation_space):
+    """Slice of each key of the Dict observation space in the flat observation vector"""
+    layout, offset = {}, 0
+    for key in FLAT_OBSERVATION_KEYS:
+        if key not in observation_space.spaces:
+            continue
+        size = int(np.prod(observation_space[key].shape))
+        layout[key] = slice(offset, offset + size)
+        offset += size
+    return layout
+
+def env_config(env):
+    """Keyword arguments that rebuild an ElevatorEnv simulating like `env`"""
+    return dict(
+        num_floors=env.num_floors, num_elevators=env.num_elevators, episode_length=env.episode_length,
+        num_passengers=env.num_passengers, array_core=env.array_core, arrival_process=env.arrival_process,
+        trace_path=env.trace.path if env.trace is not None else None, event_driven=env.event_driven,
+        max_skip=env.max_skip, flat_obs=env.flat_obs, joint_actions=env.joint_actions,
+    )
+
+def dispatch_action_masks(valid, joint_actions=False):
+    """Masks over the concatenated MultiDiscrete action dimensions (the form of sb3-contrib's
+    `action_masks()`) from (..., num_elevators, num_floors) valid dispatch masks"""
+    if joint_actions:
+        keep = np.ones(valid.shape[:-1] + (1,), dtype=bool)  # keeping a car's orders is always allowed
+        return np.concatenate((valid, keep), axis=-1).reshape(valid.shape[:-2] + (-1,))
+    # (car, floor) pairs do not factor into per-dimension masks: allow the cars with a valid floor
+    # and the floors valid for some car; when nothing has an effect, allow everything
+    cars, floors = valid.any(axis=-1), valid.any(axis=-2)
+    nothing = ~cars.any(axis=-1, keepdims=True)
+    return np.concatenate((cars | nothing, floors | nothing), axis=-1)
+
+def dispatch_action(elevator_id, destination_floor, num_floors, num_elevators, joint_actions=False):
+    """Action sending one car to a floor, in the format of the action space"""
+    if joint_actions:
+        action = np.full(num_elevators, num_floors)
+        action[elevator_id] = destination_floor
+        return action
+    return np.array([elevator_id, destination_floor])
+
+class DispatchState:
+    """Building state read by the classical dispatchers (see dispatchers.py).
+
+    The cars' destinations and riders' car calls are not part of the
+    observation, so dispatchers read them from this copy of one building's
+    state. Being plain arrays, it is picklable and can be taken from any core,
+    a worker process or one lane of a BatchedBuilding.
+    """
+    def __init__(self, num_floors, positions, loads, destinations, car_calls, hall_calls, dispatchable, valid,
+                 max_wait_times):
+        self.num_floors = num_floors
+        self.positions = positions
+        self.loads = loads
+        self.destinations = destinations  # -1: none
+        self.car_calls = car_calls  # (num_elevators, num_floors)
+        self.hall_calls = hall_calls  # (num_floors, 2)
+        self.dispatchable = dispatchable  # standing still with room
+        self.valid = valid  # (num_elevators, num_floors), see get_valid_dispatches
+        self.max_wait_times = max_wait_times
+
+    @classmethod
+    def from_building(cls, building):
+        """State of a Building or ArrayBuilding"""
+        return cls(building.num_floors, np.array(building.positions), np.array(building.loads),
+                   building.get_destinations(), building.get_car_calls(), building.get_hall_calls(),
+                   building.get_dispatchable(), building.get_valid_dispatches(), building.get_max_wait_times())
 
 class ElevatorEnv(gym.Env):
-    def __init__(self, num_floors=10, num_elevators=3, episode_length=1440, num_passengers=10):
+    def __init__(self, num_floors=10, num_elevators=3, episode_length=1440, num_passengers=10, array_core=False,
+                 arrival_process="bernoulli", trace_path=None, profile=False, profile_every=0,
+                 event_driven=False, max_skip=60, flat_obs=False, metrics=False, metrics_window=1000,
+                 joint_actions=False):
         super(ElevatorEnv, self).__init__()
         
         self.num_floors = num_floors
@@ -12,56 +103,129 @@ class ElevatorEnv(gym.Env):
         self.episode_length = episode_length
         self.current_step = 0
         self.num_passengers = num_passengers    # max number of passengers to generate per floor
+        self.array_core = array_core    # use the NumPy struct-of-arrays simulator instead of objects
+        self.arrival_process = arrival_process    # "bernoulli" (at most one per floor and step) or "poisson"
+        # Replay a pre-generated arrival trace instead of sampling arrivals
+        self.trace = TraceReplay(trace_path) if trace_path else None
+        if self.trace is not None and self.trace.num_floors != num_floors:
+            raise ValueError(f"Trace {trace_path} was generated for {self.trace.num_floors} floors, not {num_floors}")
+        # Optional per-phase timings and passenger counters, reported in `info["profile"]`
+        # and printed every `profile_every` steps; they accumulate across episodes
+        self.profiler = StepProfiler() if profile else None
+        self.profile_every = profile_every
+        # Optional wait/trip time percentiles, throughput and utilization in `info["metrics"]`,
+        # accumulated across episodes in bounded memory
+        self.metrics = StreamingMetrics(metrics_window) if metrics else None
+        # Semi-MDP mode: after a dispatch, keep simulating until the next decision event
+        # (a car arriving, a new hall call, the episode end) or `max_skip` ticks
+        self.event_driven = event_driven
+        self.max_skip = max_skip
+        self._events = EventQueue(num_elevators)
         # Initialize building with realistic parameters
-        self.building = Building(num_floors, num_elevators)
+        self.building = self._make_building()
         
         # Enhanced action space: (elevator_id, destination_floor)
         self.action_space = spaces.MultiDiscrete([
             num_elevators,  # elevator_id
             num_floors       # destination_floor
         ])
+        # Joint action space: a destination floor for every car at once, `num_floors` keeps its orders
+        self.joint_actions = joint_actions
+        if joint_actions:
+            self.action_space = spaces.MultiDiscrete([num_floors + 1] * num_elevators)
         
         # Enhanced observation space with more state information
-        self.observation_space = spaces.Dict({
+        self.dict_observation_space = spaces.Dict({
             "elevator_positions": spaces.Box(0, num_floors-1, shape=(num_elevators,), dtype=np.int32),
             "elevator_directions": spaces.Box(-1, 1, shape=(num_elevators,), dtype=np.int32),
             "elevator_loads": spaces.Box(0, 1, shape=(num_elevators,), dtype=np.float32),
             "waiting_counts": spaces.Box(0, 20, shape=(num_floors,), dtype=np.int32),
             "waiting_times": spaces.Box(0, 100, shape=(num_floors,), dtype=np.int32),
+            "hall_calls": spaces.Box(0, 1, shape=(num_floors, 2), dtype=np.int8),  # up / down call per floor
             "time_step": spaces.Box(0, episode_length, shape=(1,), dtype=np.int32)
         })
+        if joint_actions:
+            # Keeping a car's orders only makes sense when its orders are observed
+            self.dict_observation_space["elevator_destinations"] = spaces.Box(
+                -1, num_floors-1, shape=(num_elevators,), dtype=np.int32)
+        self.observation_space = self.dict_observation_space
+        # Optional flat Box observation for MlpPolicy, see FLAT_OBSERVATION_KEYS for the index map
+        self.flat_obs = flat_obs
+        if flat_obs:
+            self.obs_layout = flat_observation_layout(self.dict_observation_space)
+            size = max(s.stop for s in self.obs_layout.values())
+            self.observation_space = spaces.Box(-1, 1, shape=(size,), dtype=np.float32)
+            self._flat_scale = np.zeros(size, dtype=np.float32)
+            for key, space in self.dict_observation_space.spaces.items():
+                self._flat_scale[self.obs_layout[key]] = 1 / max(float(space.high.max()), 1)
+        self._obs = self._new_obs_buffers()
+
+    def _new_obs_buffers(self):
+        # Observation arrays are overwritten in place every step of an episode;
+        # in flat mode they are views into the one float32 vector
+        if self.flat_obs:
+            self._flat = np.zeros(self.observation_space.shape, dtype=np.float32)
+            return {
+                key: self._flat[self.obs_layout[key]].reshape(space.shape)
+                for key, space in self.dict_observation_space.spaces.items()
+            }
+        return {
+            key: np.zeros(space.shape, dtype=space.dtype)
+            for key, space in self.observation_space.spaces.items()
+        }
+
+    def _make_building(self, seed=None):
+        if self.trace is not None:
+            traffic = self.trace
+        else:
+            traffic = TrafficGenerator(self.num_floors, seed=seed, arrival_process=self.arrival_process,
+                                       max_arrivals=self.num_passengers)
+        if self.array_core:
+            building = ArrayBuilding(self.num_floors, self.num_elevators, traffic=traffic)
+        else:
+            building = Building(self.num_floors, self.num_elevators, traffic=traffic)
+        building.profiler = self.profiler
+        return building
 
     def reset(self, seed=None, **kwargs):
         super().reset(seed=seed)
         self.current_step = 0
-        self.building = Building(self.num_floors, self.num_elevators)
+        self.building = self._make_building(self.np_random.integers(2**32))
+        self._events.clear()
+        # Fresh buffers per episode keep the final observation of the last one valid after reset
+        self._obs = self._new_obs_buffers()
         return self._get_observation(), {}
 
     def step(self, action):
         # print(f"\n--- Step {self.current_step} ---")
         # print(f"Action taken: Elevator {action[0]} to floor {action[1]}")
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
         self.current_step += 1
         
-        # Parse action
-        elevator_id, destination_floor = action
+        # Parse and validate action
+        dispatches = self._dispatches(action)
         
-        # Validate action
-        if not (0 <= elevator_id < self.num_elevators) or not (0 <= destination_floor < self.num_floors):
+        elapsed = 1  # ticks simulated by this step
+        if dispatches is None:
             reward = -10  # Penalize invalid actions
+            if profiler is not None:
+                profiler.count("invalid_actions")
         else:
             # Execute building step and action
             self.building.step(self.current_step)
-            reward = self.building.take_action((elevator_id, destination_floor))
-        
-        # Force pickup if idle and passengers waiting
-        if self.building.elevators[elevator_id].is_idle():
-            for floor, passengers in enumerate(self.building.waiting_passengers):
-                if passengers:
-                    destination = floor  # Override with nearest waiting floor
-                    break
+            if self.joint_actions:
+                reward = self.building.take_joint_action(action)
+            else:
+                reward = self.building.take_action(dispatches[0])
+            if self.event_driven:
+                reward, elapsed = self._fast_forward(dispatches, reward)
 
         # Get new observation
         obs = self._get_observation()
+        if profiler is not None:
+            profiler.mark("observation")
         # Print summary
         # print(f"Reward: {reward}")
         # print(f"Next state:")
@@ -71,56 +235,126 @@ class ElevatorEnv(gym.Env):
         done = self.current_step >= self.episode_length
         truncated = False
         info = {
-            "total_wait_time": sum(
-                p.wait_time 
-                for floor_passengers in self.building.waiting_passengers.values() 
-                for p in floor_passengers
-            ),
-            "elevator_utilization": sum(
-                len(e.passengers)/e.capacity 
-                for e in self.building.elevators
-            ) / self.num_elevators
+            "total_wait_time": self.building.get_total_wait_time(),
+            "elevator_utilization": self.building.get_utilization()
         }
+        if self.event_driven:
+            info["elapsed_time"] = elapsed
+        if self.metrics is not None:
+            self.metrics.record(self.building, reward, elapsed)
+            if done:  # undelivered passengers' waits would otherwise never be counted
+                self.metrics.record_open_waits(self.building.get_open_waits())
+            info["metrics"] = self.metrics.snapshot()
+        if profiler is not None:
+            profiler.mark("info")
+            profiler.count("steps")
+            info["profile"] = profiler.snapshot()
+            if self.profile_every and profiler.counters["steps"] % self.profile_every == 0:
+                print(f"\nProfile after {profiler.counters['steps']} steps:\n{profiler.summary()}")
         # print(f"Info: {info}")
         return obs, reward, done, truncated, info
 
+    def snapshot(self):
+        """Episode state (step counter, env RNG, pending arrival events, building) as a flat int64
+        array; metrics and profiler totals are not part of it and keep accumulating"""
+        events = self._events.snapshot()
+        head = np.array([self.current_step, len(events), *events], dtype=np.int64)
+        return np.concatenate((head, pack_rng(self.np_random.bit_generator), self.building.snapshot()))
+
+    def restore(self, snapshot):
+        """Return to a snapshot() of an env with the same configuration; returns its observation"""
+        reader = SnapshotReader(snapshot)
+        self.current_step, count = reader.take(2).tolist()
+        self._events.restore(reader.take(count).tolist())
+        unpack_rng(self.np_random.bit_generator, reader.take(RNG_WORDS))
+        self.building.restore(reader.rest())
+        return self._get_observation()
+
+    def _dispatches(self, action):
+        """(elevator_id, destination_floor) orders given by `action`, or None if it is invalid"""
+        if self.joint_actions:
+            targets = np.asarray(action)
+            if targets.shape != (self.num_elevators,) or ((targets < 0) | (targets > self.num_floors)).any():
+                return None
+            return [(car, target) for car, target in enumerate(targets.tolist()) if target < self.num_floors]
+        elevator_id, destination_floor = action
+        if not (0 <= elevator_id < self.num_elevators) or not (0 <= destination_floor < self.num_floors):
+            return None
+        return [(elevator_id, destination_floor)]
+
+    def dispatch_action(self, elevator_id, destination_floor):
+        """Action sending one car to a floor, in the format of the action space"""
+        return dispatch_action(elevator_id, destination_floor, self.num_floors, self.num_elevators,
+                               self.joint_actions)
+
+    def dispatch_state(self):
+        """DispatchState of the building, for the classical dispatchers"""
+        return DispatchState.from_building(self.building)
+
+    def valid_dispatches(self):
+        """(num_elevators, num_floors) mask of the dispatches that would have an effect"""
+        return self.building.get_valid_dispatches()
+
+    def action_masks(self):
+        """Valid action mask for masked-policy algorithms such as sb3-contrib's MaskablePPO"""
+        return dispatch_action_masks(self.valid_dispatches(), self.joint_actions)
+
+    def _fast_forward(self, dispatches, reward):
+        """Advance tick by tick without new dispatches while no car can take one and
+        nothing new happens; returns the summed reward and the number of ticks elapsed"""
+        building = self.building
+        events = self._events
+        for elevator_id, destination_floor in dispatches:
+            if building.get_destination(elevator_id) == destination_floor:  # full cars ignore dispatches
+                travel = abs(destination_floor - int(building.positions[elevator_id]))
+                events.schedule_arrival(self.current_step + max(travel, 1), elevator_id)
+
+        elapsed = 1
+        # A car standing by for a dispatch is a decision to make
+        if building.get_dispatchable().any():
+            events.pop_due(self.current_step)
+            return reward, elapsed
+        while self.current_step < self.episode_length and elapsed < self.max_skip:
+            next_arrival = events.next_time()
+            if next_arrival is not None and next_arrival <= self.current_step:
+                break
+            empty_floors = building.get_waiting_counts() == 0
+            self.current_step += 1
+            building.step(self.current_step)
+            reward += building._calculate_reward()
+            elapsed += 1
+            if (building.get_waiting_counts()[empty_floors] > 0).any():
+                break  # new hall call
+        events.pop_due(self.current_step)
+        return reward, elapsed
+
     def _get_observation(self):
-        state = self.building.state
-        return {
-            "elevator_positions": np.array(
-                [elevator.current_floor for elevator in self.building.elevators],
-                dtype=np.int32
-            ),
-            "elevator_directions": np.array(
-                [elevator.direction for elevator in self.building.elevators],
-                dtype=np.int32
-            ),
-            "elevator_loads": np.array(
-                [len(elevator.passengers)/elevator.capacity for elevator in self.building.elevators],
-                dtype=np.float32
-            ),
-            "waiting_counts": np.array(
-                [len(self.building.waiting_passengers[floor]) for floor in range(self.num_floors)],
-                dtype=np.int32
-            ),
-            "waiting_times": np.array(
-                [max([p.wait_time for p in self.building.waiting_passengers[floor]], default=0)
-                for floor in range(self.num_floors)],
-                dtype=np.int32
-            ),
-            "time_step": np.array([self.current_step], dtype=np.int32)
-        }
+        """Observation backed by reusable buffers; copy it to keep it past the next step"""
+        self.building.fill_observation(self._obs)
+        self._obs["time_step"][0] = self.current_step
+        if self.joint_actions:
+            self._obs["elevator_destinations"][:] = self.building.get_destinations()
+        if self.flat_obs:
+            np.multiply(self._flat, self._flat_scale, out=self._flat)
+            np.minimum(self._flat, 1, out=self._flat)
+            return self._flat
+        return self._obs
 
     def render(self, mode='human'):
-        if mode == 'human':
+        if mode == 'human' and self.array_core:
+            print(f"\nStep {self.current_step}")
+            print(f"Elevators: positions {self.building.positions.tolist()}, "
+                  f"directions {self.building.directions.tolist()}, loads {self.building.loads.tolist()}")
+            print(f"Waiting passengers per floor: {self.building.get_waiting_counts().tolist()}")
+        elif mode == 'human':
             print(f"\nStep {self.current_step}")
             print("Elevators:")
             for elevator in self.building.elevators:
                 print(f"  {str(elevator)}")
             print("Waiting passengers:")
-            for floor, passengers in self.building.waiting_passengers.items():
-                if passengers:
-                    print(f"  Floor {floor}: {len(passengers)} waiting")
+            for floor, queues in self.building.waiting_passengers.items():
+                if queues[1] or queues[-1]:
+                    print(f"  Floor {floor}: {len(queues[1])} going up, {len(queues[-1])} going down")
         elif mode == 'rgb_array':
             # Could implement visual rendering here
             pass
\ No newline at end of file
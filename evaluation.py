@@ -0,0 +1,141 @@
+import copy
+import numpy as np
+from batched_building import BatchedBuilding
+from elevator_env import ElevatorEnv
+
+# The VecEnvs built on Stable-Baselines3 (and so torch) are imported by make_eval_env when
+# asked for; in-process lanes use EnvLanes, so evaluating a dispatcher does not load torch
+
+class EnvLanes:
+    """In-process ElevatorEnv lanes with the part of the DummyVecEnv interface that
+    run_episodes, the dispatchers and the policies use: stacked observations,
+    auto-reset with `terminal_observation`, seed, get_attr, set_attr and env_method"""
+    def __init__(self, env_fns):
+        self.envs = [fn() for fn in env_fns]
+        self.num_envs = len(self.envs)
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+        self._seeds = [None] * self.num_envs
+
+    def seed(self, seed=None):
+        """Seed the next reset, lane i with `seed + i`"""
+        self._seeds = [None if seed is None else seed + i for i in range(self.num_envs)]
+
+    def reset(self):
+        observations = [env.reset(seed=seed)[0] for env, seed in zip(self.envs, self._seeds)]
+        self._seeds = [None] * self.num_envs
+        return self._stack(observations)
+
+    def step(self, actions):
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        observations, infos = [], []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            obs, rewards[i], terminated, truncated, info = env.step(action)
+            dones[i] = terminated or truncated
+            if dones[i]:
+                # reset() gives the env fresh observation buffers, so the final one stays valid
+                info["terminal_observation"] = obs
+                obs, _ = env.reset()
+            observations.append(obs)
+            infos.append(info)
+        return self._stack(observations), rewards, dones, infos
+
+    @staticmethod
+    def _stack(observations):
+        if isinstance(observations[0], dict):
+            return {key: np.stack([obs[key] for obs in observations]) for key in observations[0]}
+        return np.stack(observations)
+
+    def _lanes(self, indices):
+        if indices is None:
+            return self.envs
+        return [self.envs[i] for i in ([indices] if isinstance(indices, int) else indices)]
+
+    def get_attr(self, name, indices=None):
+        return [getattr(env, name) for env in self._lanes(indices)]
+
+    def set_attr(self, name, value, indices=None):
+        for env in self._lanes(indices):
+            setattr(env, name, value)
+
+    def env_method(self, name, *args, indices=None, **kwargs):
+        return [getattr(env, name)(*args, **kwargs) for env in self._lanes(indices)]
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+def make_eval_env(num_floors, num_elevators, n_envs, n_workers=0, batched=False, trace_path=None,
+                  event_driven=False, flat_obs=False, joint_actions=False):
+    """VecEnv with `n_envs` evaluation lanes.
+
+    The lanes run in one BatchedBuilding (`batched`), spread over `n_workers`
+    processes, or as in-process ElevatorEnvs (EnvLanes); the latter two keep
+    StreamingMetrics. Only the first two need Stable-Baselines3.
+    """
+    if batched:
+        from vec_env import ElevatorVecEnv
+        if event_driven:
+            raise ValueError("event-driven stepping is not supported by the batched environment")
+        return ElevatorVecEnv(n_envs, num_floors, num_elevators, trace_path=trace_path, flat_obs=flat_obs,
+                              joint_actions=joint_actions)
+    env_kwargs = dict(num_floors=num_floors, num_elevators=num_elevators, trace_path=trace_path,
+                      event_driven=event_driven, flat_obs=flat_obs, metrics=True, joint_actions=joint_actions)
+    if n_workers > 0:
+        from subproc_vec_env import SharedMemoryVecEnv
+        return SharedMemoryVecEnv(n_workers, -(-n_envs // n_workers), env_kwargs)
+    return EnvLanes([lambda: ElevatorEnv(**env_kwargs) for _ in range(n_envs)])
+
+def run_episodes(model, venv, num_episodes, seed=None, deterministic=True, use_masks=False, lane_metrics=None):
+    """Play `num_episodes` episodes on the lanes of `venv` with one batched predict per tick.
+
+    Lane i plays (num_episodes + i) // num_envs episodes, so lanes whose
+    episodes end sooner (event-driven stepping) do not crowd out the others.
+    Returns one dict per episode, in completion order, with its reward,
+    length, total_wait_time and elevator_utilization. Lanes keep stepping
+    until every lane is done; if `lane_metrics` is a list, a copy of each
+    lane's StreamingMetrics taken at its last counted episode end is appended
+    to it, so the steps played past a lane's target are left out.
+    """
+    n = venv.num_envs
+    targets = np.array([(num_episodes + i) // n for i in range(n)])
+    counts = np.zeros(n, dtype=np.int64)
+    returns = np.zeros(n)
+    lengths = np.zeros(n, dtype=np.int64)
+    results = []
+
+    # The lanes of a BatchedBuilding (ElevatorVecEnv) keep no StreamingMetrics
+    keep_metrics = lane_metrics is not None and not isinstance(getattr(venv, "building", None), BatchedBuilding)
+    venv.seed(seed)
+    obs = venv.reset()
+    while (counts < targets).any():
+        # Masked policies get the valid action masks of every lane
+        masks = {"action_masks": np.stack(venv.env_method("action_masks"))} if use_masks else {}
+        actions, _ = model.predict(obs, deterministic=deterministic, **masks)
+        obs, rewards, dones, infos = venv.step(actions)
+        returns += rewards
+        lengths += 1
+        for i in np.flatnonzero(dones).tolist():
+            if counts[i] < targets[i]:
+                results.append({
+                    "reward": float(returns[i]),
+                    "length": int(lengths[i]),
+                    "total_wait_time": infos[i].get("total_wait_time", 0),
+                    "elevator_utilization": infos[i].get("elevator_utilization", 0),
+                })
+                counts[i] += 1
+                if counts[i] == targets[i] and keep_metrics:
+                    lane_metrics.append(copy.deepcopy(venv.get_attr("metrics", i)[0]))
+            returns[i] = 0
+            lengths[i] = 0
+    return results
+
+def collect_metrics(lane_metrics):
+    """StreamingMetrics of the lanes (see run_episodes) merged into one, or None if there are none"""
+    if not lane_metrics:
+        return None
+    merged = lane_metrics[0]
+    for metrics in lane_metrics[1:]:
+        merged.merge(metrics)
+    return merged
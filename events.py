@@ -0,0 +1,51 @@
+import heapq
+
+class EventQueue:
+    """Min-heap of scheduled car arrivals for event-driven stepping.
+
+    A car dispatched at tick `t` from floor `p` to floor `d` reaches it at
+    `t + |d - p|` (cars move one floor per tick). Re-dispatching a car bumps
+    its version, so the older arrival is dropped lazily when it reaches the
+    top of the heap instead of being searched for.
+    """
+    def __init__(self, num_elevators):
+        self._heap = []
+        self._versions = [0] * num_elevators
+
+    def clear(self):
+        self._heap.clear()
+        self._versions = [0] * len(self._versions)
+
+    def schedule_arrival(self, time, elevator_id):
+        """Replace any pending arrival of `elevator_id` with one at `time`"""
+        self._versions[elevator_id] += 1
+        heapq.heappush(self._heap, (time, elevator_id, self._versions[elevator_id]))
+
+    def next_time(self):
+        """Tick of the earliest pending arrival, or None"""
+        heap = self._heap
+        while heap and heap[0][2] != self._versions[heap[0][1]]:
+            heapq.heappop(heap)  # superseded by a later dispatch
+        return heap[0][0] if heap else None
+
+    def pop_due(self, now):
+        """Remove and return the cars whose arrival is at or before `now`"""
+        arrived = []
+        while True:
+            time = self.next_time()
+            if time is None or time > now:
+                return arrived
+            arrived.append(heapq.heappop(self._heap)[1])
+
+    def snapshot(self):
+        """Pending arrivals and car versions as ints; superseded entries are left out"""
+        live = [entry for entry in self._heap if entry[2] == self._versions[entry[1]]]
+        return [len(live), *(value for entry in live for value in entry), *self._versions]
+
+    def restore(self, words):
+        """Restore from a list of ints produced by snapshot()"""
+        count = words[0]
+        entries = words[1:1 + 3*count]
+        self._heap = [tuple(entries[i:i+3]) for i in range(0, 3*count, 3)]
+        heapq.heapify(self._heap)
+        self._versions = list(words[1 + 3*count:])
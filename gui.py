@@ -1,7 +1,10 @@
 import tkinter as tk
 from tkinter import ttk
 from elevator_env import ElevatorEnv
-from stable_baselines3 import PPO
+from dispatchers import DISPATCHERS, NearestCarDispatcher
+from lookahead import LookaheadDispatcher
+from metrics import StreamingMetrics
+from recordings import ReplayEnv
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
@@ -40,10 +43,13 @@ class ElevatorGUI:
         # Initialize
         self.obs, _ = self.env.reset()
         self.step_count = 0
-        self.rewards = []
-        self.wait_times = []
+        self.create_building_items()
         self.draw_building()
         
+        # Charts are redrawn every chart_interval ms, however fast the simulation steps
+        self.chart_interval = 250
+        self.refresh_charts()
+        
     def setup_stats_panel(self):
         """Set up the statistics and metrics display"""
         # Create main container for stats
@@ -67,18 +73,47 @@ class ElevatorGUI:
         self.ax_flow = self.fig.add_subplot(gs[1, 1])
         self.ax_flow.set_title("Passenger Flow")
         
+        # Chart artists are created once and updated in place; animated ones are
+        # left out of full draws and blitted over the saved axes backgrounds
+        (self.reward_line,) = self.ax_reward.plot([], [], label='Reward', animated=True)
+        self.ax_reward.set_ylabel("Reward")
+        self.ax_reward.grid(True)
+        self.wait_bars = self.ax_wait.bar(np.arange(20), np.zeros(20), width=1, align="edge", alpha=0.7,
+                                          animated=True).patches
+        self.ax_wait.set_xlabel("Wait Time (steps)")
+        self.ax_wait.set_ylabel("Count")
+        (self.util_line,) = self.ax_util.plot([], [], animated=True)
+        self.ax_util.set_ylim(0, 1)
+        self.ax_util.set_ylabel("Utilization %")
+        (self.delivered_line,) = self.ax_flow.plot([], [], label='Delivered', animated=True)
+        (self.waiting_line,) = self.ax_flow.plot([], [], 'r--', label='Waiting', animated=True)
+        self.ax_flow.legend()
+        self.chart_axes = [self.ax_reward, self.ax_wait, self.ax_util, self.ax_flow]
+        self.chart_artists = [self.reward_line, *self.wait_bars, self.util_line, self.delivered_line, self.waiting_line]
+        self.reset_chart_limits()
+        
         # Embed matplotlib figure
         self.canvas_stats = FigureCanvasTkAgg(self.fig, master=stats_container)
         self.canvas_stats.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.canvas_stats.mpl_connect("draw_event", self.capture_backgrounds)
+        self.backgrounds = []
+        self.stats_dirty = False
         
         # Add text stats below the plots
         self.stats_text = tk.Text(stats_container, height=8, width=80, font=("Consolas", 10))
         self.stats_text.pack(side=tk.BOTTOM, fill=tk.BOTH, expand=True)
         
-        # Additional stats tracking
-        self.delivered_history = []
-        self.utilization_history = []
-        self.wait_time_distribution = []
+        # Stats tracking in bounded memory: the last history_window steps and wait time percentiles
+        self.history_window = 2000
+        self.metrics = StreamingMetrics(self.history_window)
+        
+    def reset_chart_limits(self):
+        self.needs_full_draw = True
+        for ax in [self.ax_reward, self.ax_wait, self.ax_flow]:
+            ax.set_xlim(0, 100)
+            ax.set_ylim(0, 1)
+        self.ax_reward.set_ylim(-1, 1)
+        self.ax_util.set_xlim(0, 100)
         
     def setup_controls(self):
         """Set up control buttons and speed control"""
@@ -103,152 +138,212 @@ class ElevatorGUI:
         self.auto_running = False
         self.speed = 500
         
-    def draw_building(self):
-        """Draw the building with elevators and passengers"""
-        self.canvas.delete("all")
+    def create_building_items(self):
+        """Create the canvas items once; draw_building only moves and recolors them"""
         num_floors = self.env.building.num_floors
-        num_elevators = len(self.env.building.elevators)
-        floor_height = 450 / num_floors
+        num_elevators = self.env.num_elevators
+        self.floor_height = floor_height = 450 / num_floors
         elevator_width = 30
         
         # Draw building outline
         self.canvas.create_rectangle(50, 20, 550, 470, outline="black")
         
-        # Draw floors and labels
+        # Floors, labels and (initially empty) waiting passenger counts
+        self.call_items = []
         for i in range(num_floors):
             y = 450 - i * floor_height
             self.canvas.create_line(50, y, 550, y, fill="gray")
             self.canvas.create_text(30, y - floor_height/2, text=f"F{i}", anchor=tk.E, font=("Arial", 12))
-            
-            # Draw waiting passengers
-            wait_count = len(self.env.building.waiting_passengers[i])
-            if wait_count > 0:
-                self.canvas.create_text(570, y - floor_height/2, text=f"{wait_count} waiting", anchor=tk.W, font=("Arial", 12))
-                
-        # Draw elevators
-        for i, elevator in enumerate(self.env.building.elevators):
+            self.call_items.append(self.canvas.create_text(570, y - floor_height/2, text="", anchor=tk.W,
+                                                           font=("Arial", 12)))
+        self.shown_calls = np.zeros((num_floors, 2), dtype=np.int64)
+        
+        # Per elevator: car, passenger count, destination arrow and rider destinations
+        self.car_items = []
+        for i in range(num_elevators):
             x = 100 + i * (400 / max(1, num_elevators-1))
-            y = 450 - elevator.current_floor * floor_height
+            self.car_items.append({
+                "x": x,
+                "car": self.canvas.create_rectangle(x - elevator_width/2, 450 - floor_height,
+                                                    x + elevator_width/2, 450, fill="gray", outline="black"),
+                "load": self.canvas.create_text(x, 450 - floor_height/2, text="", font=("Arial", 12)),
+                "arrow": self.canvas.create_line(x, 450, x, 450, arrow=tk.LAST, dash=(2,2), state=tk.HIDDEN),
+                "riders": self.canvas.create_text(x, 450 - floor_height + 10, text="", font=("Arial", 8),
+                                                  fill="darkgreen"),
+            })
+        
+    def draw_building(self):
+        """Move and recolor the building's canvas items to the current state"""
+        floor_height = self.floor_height
+        elevator_width = 30
+        
+        # Waiting passengers, only on floors whose counts changed
+        building = self.env.building
+        call_counts = building.get_call_counts()
+        for i in np.flatnonzero((call_counts != self.shown_calls).any(axis=1)).tolist():
+            up_count, down_count = call_counts[i].tolist()
+            text = f"▲{up_count} ▼{down_count}" if up_count or down_count else ""
+            self.canvas.itemconfigure(self.call_items[i], text=text)
+        self.shown_calls[:] = call_counts
+                
+        # Elevators, read through the accessors both simulation cores share
+        positions, directions, loads = building.positions.tolist(), building.directions.tolist(), building.loads.tolist()
+        capacities = building.capacities.astype(int).tolist()
+        destinations = building.get_destinations().tolist()
+        car_call_counts = building.get_car_call_counts()
+        for i, items in enumerate(self.car_items):
+            x = items["x"]
+            y = 450 - positions[i] * floor_height
             
             # Elevator car
-            fill_color = "blue" if elevator.direction == 1 else \
-                        "red" if elevator.direction == -1 else "gray"
-            self.canvas.create_rectangle(
-                x - elevator_width/2, y - floor_height,
-                x + elevator_width/2, y,
-                fill=fill_color, outline="black"
-            )
+            fill_color = "blue" if directions[i] == 1 else \
+                        "red" if directions[i] == -1 else "gray"
+            self.canvas.coords(items["car"], x - elevator_width/2, y - floor_height, x + elevator_width/2, y)
+            self.canvas.itemconfigure(items["car"], fill=fill_color)
             
             # Passenger count
-            load_percent = len(elevator.passengers) / elevator.capacity
-            self.canvas.create_text(
-                x, y - floor_height/2,
-                text=f"{len(elevator.passengers)}/{elevator.capacity}",
-                fill="white" if load_percent > 0.5 else "black",
-                font=("Arial", 12)
-            )
+            load_percent = loads[i] / capacities[i]
+            self.canvas.coords(items["load"], x, y - floor_height/2)
+            self.canvas.itemconfigure(items["load"], text=f"{loads[i]}/{capacities[i]}",
+                                      fill="white" if load_percent > 0.5 else "black")
             
             # Destination indicator
-            if elevator.destination is not None:
-                dest_y = 450 - elevator.destination * floor_height
-                self.canvas.create_line(x, y, x, dest_y, arrow=tk.LAST, dash=(2,2))
+            if destinations[i] >= 0:
+                dest_y = 450 - destinations[i] * floor_height
+                self.canvas.coords(items["arrow"], x, y, x, dest_y)
+                self.canvas.itemconfigure(items["arrow"], state=tk.NORMAL)
+            else:
+                self.canvas.itemconfigure(items["arrow"], state=tk.HIDDEN)
             
-            # Passenger destinations (NEW)
-            if elevator.passengers:
-                dest_counts = {}
-                for p in elevator.passengers:
-                    dest_counts[p.destination] = dest_counts.get(p.destination, 0) + 1
-                
-                dest_text = ",".join(f"{k}({v})" for k,v in dest_counts.items())
-                self.canvas.create_text(
-                    x, y - floor_height + 10,
-                    text=f"→{dest_text}",
-                    font=("Arial", 8),
-                    fill="darkgreen"
-                )
+            # Passenger destinations
+            dest_text = self.rider_destinations(car_call_counts[i])
+            self.canvas.coords(items["riders"], x, y - floor_height + 10)
+            self.canvas.itemconfigure(items["riders"], text=f"→{dest_text}" if dest_text else "")
 
-        # Update stats display
+        # Record this step for the charts
         self.update_stats()
         
+    @staticmethod
+    def rider_destinations(counts):
+        """"floor(riders)" list of a car's car calls"""
+        return ",".join(f"{floor}({count})" for floor, count in enumerate(counts.tolist()) if count)
+
     def update_stats(self):
-        """Update all statistics displays"""
-        # Clear all axes
-        for ax in [self.ax_reward, self.ax_wait, self.ax_util, self.ax_flow]:
-            ax.clear()
-        
-        # 1. Reward History Plot
-        if len(self.rewards) > 1:
-            self.ax_reward.plot(self.rewards, label='Reward')
-            self.ax_reward.set_ylabel("Reward")
-            self.ax_reward.grid(True)
-        
-        # 2. Wait Time Distribution
-        if self.wait_times:
-            self.ax_wait.hist(self.wait_times, bins=20, alpha=0.7)
-            self.ax_wait.set_xlabel("Wait Time (steps)")
-            self.ax_wait.set_ylabel("Count")
-        
-        # 3. Elevator Utilization
-        util = [len(e.passengers)/e.capacity for e in self.env.building.elevators]
-        self.utilization_history.append(np.mean(util))
-        if len(self.utilization_history) > 1:
-            self.ax_util.plot(self.utilization_history)
-            self.ax_util.set_ylim(0, 1)
-            self.ax_util.set_ylabel("Utilization %")
-        
-        # 4. Passenger Flow
-        delivered = sum(1 for e in self.env.building.elevators 
-                    if any(p.destination == e.current_floor for p in e.passengers))
-        self.delivered_history.append(delivered)
-        waiting = sum(len(p) for p in self.env.building.waiting_passengers.values())
-        
-        if len(self.delivered_history) > 1:
-            self.ax_flow.plot(self.delivered_history, label='Delivered')
-            self.ax_flow.plot([waiting]*len(self.delivered_history), 'r--', label='Waiting')
-            self.ax_flow.legend()
-        
-        
-        # Calculate metrics
-        total_waiting = sum(len(p) for p in self.env.building.waiting_passengers.values())
-        avg_wait_time = np.mean(self.wait_times) if self.wait_times else 0
-        current_reward = self.rewards[-1] if self.rewards else 0
-        
-        # Update text stats
+        """Mark the charts stale; refresh_charts draws them from self.metrics"""
+        self.stats_dirty = True
+        
+    def refresh_charts(self):
+        """Redraw charts and text stats on a fixed cadence, independent of the simulation speed"""
+        if self.stats_dirty:
+            self.stats_dirty = False
+            self.update_chart_artists()
+            self.update_text_stats()
+        self.master.after(self.chart_interval, self.refresh_charts)
+        
+    def update_chart_artists(self):
+        """Update line and bar data in place; blit unless an axis had to grow"""
+        metrics = self.metrics
+        grown = self.needs_full_draw or not self.backgrounds
+        
+        rewards = metrics.rewards.values()
+        steps = np.arange(len(rewards))
+        self.reward_line.set_data(steps, rewards)
+        grown |= self._fit_axis(self.ax_reward, len(steps), rewards)
+        
+        # Histogram of the most recent passenger waits over [0, current x limit)
+        if len(metrics.recent_waits):
+            waits = metrics.recent_waits.values()
+            grown |= self._fit_axis(self.ax_wait, waits.max() + 1)
+            counts, edges = np.histogram(waits, bins=len(self.wait_bars), range=(0, self.ax_wait.get_xlim()[1]))
+            for bar, left, count in zip(self.wait_bars, edges, counts.tolist()):
+                bar.set_x(left)
+                bar.set_width(edges[1] - edges[0])
+                bar.set_height(count)
+            grown |= self._fit_axis(self.ax_wait, None, [0, counts.max()])
+        
+        self.util_line.set_data(steps, metrics.utilization.values())
+        grown |= self._fit_axis(self.ax_util, len(steps))
+        
+        delivered, waiting = metrics.delivered.values(), metrics.waiting.values()
+        self.delivered_line.set_data(steps, delivered)
+        self.waiting_line.set_data(steps, waiting)
+        grown |= self._fit_axis(self.ax_flow, len(steps), np.concatenate((delivered, waiting)))
+        
+        if grown:
+            self.needs_full_draw = False
+            self.canvas_stats.draw()  # new limits: full redraw, which recaptures the backgrounds
+        else:
+            self.blit_charts()
+        
+    @staticmethod
+    def _fit_axis(ax, x_max=None, values=None):
+        """Double the axis limits that `x_max` or `values` fall outside of; True if any changed"""
+        changed = False
+        if x_max is not None and x_max > ax.get_xlim()[1]:
+            ax.set_xlim(0, 2 * x_max)
+            changed = True
+        if values is not None and len(values):
+            low, high = ax.get_ylim()
+            lowest, highest = min(values), max(values)
+            if lowest < low or highest > high:
+                span = max(highest - lowest, high - low, 1)
+                ax.set_ylim(min(low, lowest - span / 2), max(high, highest + span / 2))
+                changed = True
+        return changed
+        
+    def capture_backgrounds(self, event=None):
+        """Save each axes without its animated artists after a full draw, then draw them on top"""
+        self.backgrounds = [self.canvas_stats.copy_from_bbox(ax.bbox) for ax in self.chart_axes]
+        for artist in self.chart_artists:
+            artist.axes.draw_artist(artist)
+        
+    def blit_charts(self):
+        """Redraw only the animated artists over the saved axes backgrounds"""
+        for ax, background in zip(self.chart_axes, self.backgrounds):
+            self.canvas_stats.restore_region(background)
+        for artist in self.chart_artists:
+            artist.axes.draw_artist(artist)
+        for ax in self.chart_axes:
+            self.canvas_stats.blit(ax.bbox)
+        self.canvas_stats.flush_events()
+        
+    def update_text_stats(self):
+        """Rewrite the text panel"""
+        building = self.env.building
+        total_waiting = int(building.get_waiting_counts().sum())
+        current_reward = self.metrics.rewards.last()
+        waits = self.metrics.wait_times.percentiles()
+        
         self.stats_text.delete(1.0, tk.END)
         self.stats_text.insert(tk.END, 
             f"Step: {self.step_count}\n"
             f"Current Reward: {current_reward:.2f}\n"
-            f"Total Waiting: {total_waiting}\n"
-            f"Avg Wait Time: {avg_wait_time:.1f} steps\n"
+            f"Total Waiting: {total_waiting}   Delivered: {self.metrics.total_delivered}\n"
+            f"Wait Time P50/P95/P99: {waits['p50']:.1f} / {waits['p95']:.1f} / {waits['p99']:.1f} steps\n"
         )
         self.stats_text.insert(tk.END,
             f"Elevators:\n"
             f"{'ID':<3}{'Pos':<5}{'Load':<7}{'Dest':<5}{'Passengers'}\n"
         )
-        for i, elevator in enumerate(self.env.building.elevators):
-            passenger_dests = [p.destination for p in elevator.passengers]
-            dest_counts = {d:passenger_dests.count(d) for d in set(passenger_dests)}
-            dest_str = ",".join(f"{k}({v})" for k,v in dest_counts.items()) if dest_counts else "Empty"
+        destinations = building.get_destinations().tolist()
+        car_call_counts = building.get_car_call_counts()
+        for i in range(self.env.num_elevators):
+            direction = int(building.directions[i])
+            dest_str = self.rider_destinations(car_call_counts[i]) or "Empty"
             
             self.stats_text.insert(tk.END,
-                f"  E{i:<3}: Floor {elevator.current_floor:<5} | "
-                f"{len(elevator.passengers)}/{elevator.capacity:<7} | "
-                f"{'▲' if elevator.direction == 1 else '▼' if elevator.direction == -1 else '■'} | "
-                f"{elevator.destination if elevator.destination else '-':<5}"
+                f"  E{i:<3}: Floor {int(building.positions[i]):<5} | "
+                f"{int(building.loads[i])}/{int(building.capacities[i]):<7} | "
+                f"{'▲' if direction == 1 else '▼' if direction == -1 else '■'} | "
+                f"{destinations[i] if destinations[i] >= 0 else '-':<5}"
                 f"{dest_str}\n"
             )
-        
-        self.canvas_stats.draw()
     
     def get_passenger_flow(self):
         """Track origin-destination pairs"""
         flow = np.zeros((self.env.num_floors, self.env.num_floors))
-        for floor in range(self.env.num_floors):
-            for p in self.env.building.waiting_passengers[floor]:
-                flow[floor, p.destination] += 1
-        for elevator in self.env.building.elevators:
-            for p in elevator.passengers:
-                flow[p.start_floor, p.destination] += 1
+        trips = self.env.building.get_open_trips()
+        np.add.at(flow, (trips[:, 0], trips[:, 1]), 1)
         return flow
 
     def update_flow_heatmap(self):
@@ -266,8 +361,7 @@ class ElevatorGUI:
         self.obs, reward, done, _, info = self.env.step(action)
         
         self.step_count += 1
-        self.rewards.append(reward)
-        self.wait_times.append(info.get("total_wait_time", 0))
+        self.metrics.record(self.env.building, reward, info.get("elapsed_time", 1))
         
         self.draw_building()
         
@@ -281,11 +375,8 @@ class ElevatorGUI:
         """Reset the simulation"""
         self.obs, _ = self.env.reset()
         self.step_count = 0
-        self.rewards = []
-        self.wait_times = []
-        self.delivered_history = []
-        self.utilization_history = []
-        self.wait_time_distribution = []
+        self.metrics = StreamingMetrics(self.history_window)
+        self.reset_chart_limits()
         self.draw_building()
         
     def toggle_auto(self):
@@ -299,18 +390,39 @@ class ElevatorGUI:
         """Set simulation speed"""
         self.speed = int(float(value))
 
-def run_gui(num_floors, num_elevators, model_path="elevator_ppo_model"):
-    """Run the GUI with specified parameters"""
+def run_gui(num_floors, num_elevators, model_path="elevator_ppo_model", replay_path=None, lookahead_workers=0,
+            budget=0.1):
+    """Run the GUI with specified parameters, or play back the recording at `replay_path`.
+    `model_path` may also name a dispatcher (see dispatchers.py), "lookahead" for the rollout planner,
+    or a weights file exported with main.py --export."""
+    if replay_path:
+        # The replay env re-simulates the recorded episodes and supplies their actions
+        env = ReplayEnv(replay_path)
+        root = tk.Tk()
+        gui = ElevatorGUI(root, env, env)
+        root.mainloop()
+        return
     env = ElevatorEnv(num_floors, num_elevators)
-    try:
-        model = PPO.load(model_path+f"_{num_floors}_{num_elevators}")
-    except:
-        print(f"Could not load model from {model_path}. Using random actions.")
-        model = None
+    if model_path in DISPATCHERS:
+        model = DISPATCHERS[model_path](env)
+    elif model_path == "lookahead":
+        model = LookaheadDispatcher(env, workers=lookahead_workers, budget=budget)
+    elif model_path.endswith(".npz"):
+        from numpy_policy import NumpyPolicy
+        model = NumpyPolicy.load(model_path)
+    else:
+        try:
+            from stable_baselines3 import PPO
+            model = PPO.load(model_path+f"_{num_floors}_{num_elevators}")
+        except:
+            print(f"Could not load model from {model_path}. Using the nearest-car dispatcher.")
+            model = NearestCarDispatcher(env)
     
     root = tk.Tk()
     gui = ElevatorGUI(root, env, model)
     root.mainloop()
+    if hasattr(model, "close"):
+        model.close()
 
 if __name__ == "__main__":
     import argparse
@@ -318,6 +430,7 @@ if __name__ == "__main__":
     parser.add_argument("--floors", type=int, default=10, help="Number of floors")
     parser.add_argument("--elevators", type=int, default=3, help="Number of elevators")
     parser.add_argument("--model", type=str, default="elevator_ppo_model", help="Model path")
+    parser.add_argument("--replay", type=str, help="Play back a recording made with main.py --record")
     args = parser.parse_args()
     
-    run_gui(args.floors, args.elevators, args.model)
\ No newline at end of file
+    run_gui(args.floors, args.elevators, args.model, args.replay)
\ No newline at end of file
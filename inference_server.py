@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import time
+import numpy as np
+from elevator_env import ElevatorEnv
+from metrics import QuantileSketch
+
+# Wire protocol: on connect the server sends a HELLO record; after that every request and
+# response is one fixed-size little-endian record, so frames need no length prefix.
+#   request   id uint64, then one field per observation key (or "flat"), see request_dtype
+#   response  id uint64, action int64[action_dim], queue and inference seconds, batch size, status
+# Responses come back in completion order; clients match them to requests by id.
+MAGIC = b"ELVINFER"
+VERSION = 2
+OK, INFERENCE_FAILED = 0, 1  # response status
+HELLO = np.dtype([("magic", "S8"), ("version", "<u4"), ("request_bytes", "<u4"), ("response_bytes", "<u4")])
+
+def request_dtype(observation_space):
+    """Record layout of a request carrying one observation of `observation_space`"""
+    spaces = observation_space.spaces if hasattr(observation_space, "spaces") else {"flat": observation_space}
+    return np.dtype([("id", "<u8")] + [(key, np.dtype(space.dtype).newbyteorder("<"), space.shape)
+                                       for key, space in spaces.items()])
+
+def response_dtype(action_space):
+    return np.dtype([("id", "<u8"), ("action", "<i8", action_space.shape), ("queue_time", "<f8"),
+                     ("inference_time", "<f8"), ("batch_size", "<u4"), ("status", "<u4")])
+
+class InferenceServer:
+    """Local policy server batching concurrent requests.
+
+    Building controllers connect over a Unix socket (or TCP on localhost) and
+    send one observation per request. Requests are queued and grouped into a
+    micro-batch that closes when it holds `max_batch` requests or `max_delay`
+    seconds after its first request arrived; the batch goes through one
+    `model.predict` in a worker thread while the next batch fills. Each
+    response reports its queueing and inference time and the batch size, and
+    the server keeps sketches of both latencies and of batch sizes. If
+    `model.predict` raises, every request of that batch is answered with the
+    INFERENCE_FAILED status and the server goes on with the next batch.
+    """
+    def __init__(self, model, observation_space, action_space, max_batch=64, max_delay=0.002):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.request = request_dtype(observation_space)
+        self.response = response_dtype(action_space)
+        self._keys = [name for name in self.request.names if name != "id"]
+        self._queue = asyncio.Queue()
+        self._server = None
+        self._batcher = None
+        self._handlers = {}  # {writer: handler task} of open controller connections
+        self.queue_times = QuantileSketch()  # microseconds
+        self.inference_times = QuantileSketch()  # microseconds, per batch
+        self.batch_sizes = QuantileSketch()
+        self.requests = 0
+        self.failed_batches = 0
+        self.last_error = None  # exception of the last failed batch
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        """Listen on the Unix socket `path`, or on TCP `host`:`port` (0 picks a free port)"""
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host=host, port=port)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        return self
+
+    @property
+    def address(self):
+        """Socket path, or (host, port) of a TCP server"""
+        return self._server.sockets[0].getsockname()
+
+    async def close(self):
+        self._server.close()
+        for writer in self._handlers:
+            writer.close()
+        # Let the handlers see their connections end before the loop goes away
+        await asyncio.gather(*self._handlers.values(), return_exceptions=True)
+        await self._server.wait_closed()
+        self._batcher.cancel()
+
+    async def _handle(self, reader, writer):
+        hello = np.zeros(1, dtype=HELLO)
+        hello["magic"] = MAGIC
+        hello["version"] = VERSION
+        hello["request_bytes"] = self.request.itemsize
+        hello["response_bytes"] = self.response.itemsize
+        writer.write(hello.tobytes())
+        self._handlers[writer] = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        pending = set()
+        try:
+            while True:
+                frame = await reader.readexactly(self.request.itemsize)
+                future = loop.create_future()
+                self._queue.put_nowait((frame, time.perf_counter(), future))
+                # Answer in completion order; a controller may keep several requests in flight
+                task = asyncio.create_task(self._respond(future, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._handlers.pop(writer, None)
+            writer.close()
+
+    async def _respond(self, future, writer):
+        writer.write(await future)
+        await writer.drain()
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0][1] + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            started = time.perf_counter()
+            requests = np.frombuffer(b"".join(frame for frame, _, _ in batch), dtype=self.request)
+            try:
+                actions = await loop.run_in_executor(None, self._predict, requests)
+            except Exception as error:  # a bad batch must not stall the requests behind it
+                self.failed_batches += 1
+                self.last_error = error
+                actions = None
+            self._reply(batch, requests, actions, started, time.perf_counter())
+
+    def _predict(self, requests):
+        if self._keys == ["flat"]:
+            obs = requests["flat"]
+        else:
+            obs = {key: requests[key] for key in self._keys}
+        actions, _ = self.model.predict(obs, deterministic=True)
+        return np.asarray(actions).reshape((len(requests),) + self.response["action"].shape)
+
+    def _reply(self, batch, requests, actions, started, finished):
+        responses = np.zeros(len(batch), dtype=self.response)
+        responses["id"] = requests["id"]
+        if actions is None:
+            responses["status"] = INFERENCE_FAILED
+        else:
+            responses["action"] = actions
+        queue_times = started - np.array([arrival for _, arrival, _ in batch])
+        responses["queue_time"] = queue_times
+        responses["inference_time"] = finished - started
+        responses["batch_size"] = len(batch)
+        for (_, _, future), response in zip(batch, responses):
+            if not future.done():  # the controller may have disconnected
+                future.set_result(response.tobytes())
+        self.requests += len(batch)
+        self.queue_times.add(queue_times * 1e6)
+        self.inference_times.add((finished - started) * 1e6)
+        self.batch_sizes.add(len(batch))
+
+    def stats(self):
+        """Request count and percentiles of queueing time, batch inference time (us) and batch size"""
+        stats = {"requests": self.requests, "failed_batches": self.failed_batches}
+        for name, sketch in (("queue_us", self.queue_times), ("inference_us", self.inference_times),
+                             ("batch_size", self.batch_sizes)):
+            stats.update({f"{name}_{k}": v for k, v in sketch.percentiles().items()})
+        return stats
+
+class InferenceClient:
+    """Connection of one building controller to an InferenceServer.
+
+    Several `predict` calls may be in flight at once: a reader task hands
+    each response to the call that sent the request with its id.
+    """
+    def __init__(self, observation_space, action_space):
+        self.request = request_dtype(observation_space)
+        self.response = response_dtype(action_space)
+        self._keys = [name for name in self.request.names if name != "id"]
+        self._next_id = 0
+        self._reader = self._writer = None
+        self._pending = {}  # {request id: future of its response}
+        self._reader_task = None
+
+    async def connect(self, path=None, host="127.0.0.1", port=None):
+        if path is not None:
+            self._reader, self._writer = await asyncio.open_unix_connection(path)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(host, port)
+        hello = np.frombuffer(await self._reader.readexactly(HELLO.itemsize), dtype=HELLO)[0]
+        if hello["magic"] != MAGIC or hello["version"] != VERSION:
+            raise ValueError("Not an elevator inference server")
+        if (hello["request_bytes"], hello["response_bytes"]) != (self.request.itemsize, self.response.itemsize):
+            raise ValueError("The server serves a policy for different observation or action spaces")
+        self._reader_task = asyncio.create_task(self._read_responses())
+        return self
+
+    async def _read_responses(self):
+        try:
+            while True:
+                frame = await self._reader.readexactly(self.response.itemsize)
+                response = np.frombuffer(frame, dtype=self.response)[0]
+                future = self._pending.pop(int(response["id"]), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Inference server connection lost: {error}"))
+            self._pending.clear()
+
+    async def predict(self, observation):
+        """Action for one observation, and the response record with its latency breakdown"""
+        request = np.zeros(1, dtype=self.request)
+        request_id = self._next_id
+        request["id"] = request_id
+        self._next_id += 1
+        if self._keys == ["flat"]:
+            request["flat"] = observation
+        else:
+            for key in self._keys:
+                request[key] = observation[key]
+        if self._reader_task.done():
+            raise ConnectionError("Inference server connection lost")
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self._writer.write(request.tobytes())
+        response = await future
+        if response["status"] != OK:
+            raise RuntimeError(f"The inference server failed on request {request_id}")
+        return response["action"].copy(), response
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._reader_task.cancel()
+
+async def drive_buildings(env_kwargs, num_buildings, steps, path=None, host="127.0.0.1", port=None, seed=0):
+    """Step `num_buildings` ElevatorEnvs concurrently, each asking the server for every action;
+    returns the round-trip latencies (seconds) and the total reward of each building"""
+    async def controller(index):
+        env = ElevatorEnv(**env_kwargs)
+        client = await InferenceClient(env.observation_space, env.action_space).connect(path, host, port)
+        obs, _ = env.reset(seed=seed + index)
+        latencies, total = [], 0.0
+        for _ in range(steps):
+            sent = time.perf_counter()
+            action, _ = await client.predict(obs)
+            latencies.append(time.perf_counter() - sent)
+            obs, reward, done, _, _ = env.step(action)
+            total += reward
+            if done:
+                obs, _ = env.reset()
+        await client.close()
+        return latencies, total
+
+    results = await asyncio.gather(*(controller(i) for i in range(num_buildings)))
+    return np.concatenate([r[0] for r in results]), [r[1] for r in results]
+
+def _load_model(model_path):
+    if model_path.endswith(".npz"):
+        from numpy_policy import NumpyPolicy
+        return NumpyPolicy.load(model_path)
+    from stable_baselines3 import PPO
+    return PPO.load(model_path)
+
+async def _simulate(args):
+    env_kwargs = dict(num_floors=args.floors, num_elevators=args.elevators, flat_obs=args.flat_obs)
+    env = ElevatorEnv(**env_kwargs)
+    server = await InferenceServer(_load_model(args.model), env.observation_space, env.action_space,
+                                   args.max_batch, args.max_delay / 1000).start(args.socket)
+    address = server.address
+    path, port = (address, None) if isinstance(address, str) else (None, address[1])
+    started = time.perf_counter()
+    latencies, rewards = await drive_buildings(env_kwargs, args.buildings, args.steps, path, port=port)
+    elapsed = time.perf_counter() - started
+    await server.close()
+    p50, p95, p99 = np.percentile(latencies * 1e6, [50, 95, 99])
+    print(f"{len(latencies)} decisions for {args.buildings} buildings in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.0f} decisions/s)")
+    print(f"Round trip P50/P95/P99: {p50:.0f} / {p95:.0f} / {p99:.0f} us")
+    print("Server:", {k: round(v, 1) for k, v in server.stats().items()})
+
+async def _serve(args):
+    env = ElevatorEnv(args.floors, args.elevators, flat_obs=args.flat_obs)
+    server = await InferenceServer(_load_model(args.model), env.observation_space, env.action_space,
+                                   args.max_batch, args.max_delay / 1000).start(args.socket, port=args.port)
+    print(f"Serving {args.model} on {server.address}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching policy inference server")
+    parser.add_argument("command", choices=["serve", "simulate"],
+                        help="serve: run the server; simulate: drive simulated buildings against an in-process server")
+    parser.add_argument("--model", type=str, required=True, help="Saved PPO model, or weights exported with main.py --export")
+    parser.add_argument("--floors", type=int, default=10, help="Number of floors")
+    parser.add_argument("--elevators", type=int, default=3, help="Number of elevators")
+    parser.add_argument("--flat-obs", action="store_true", help="The model takes flat observations")
+    parser.add_argument("--socket", type=str, default=None, help="Unix socket path (default: TCP on localhost)")
+    parser.add_argument("--port", type=int, default=0, help="TCP port when no socket path is given")
+    parser.add_argument("--max-batch", type=int, default=64, help="Largest micro-batch")
+    parser.add_argument("--max-delay", type=float, default=2.0,
+                        help="Milliseconds a request may wait for its batch to fill")
+    parser.add_argument("--buildings", type=int, default=32, help="Simulated buildings (simulate)")
+    parser.add_argument("--steps", type=int, default=200, help="Decisions per simulated building (simulate)")
+    args = parser.parse_args()
+
+    asyncio.run(_simulate(args) if args.command == "simulate" else _serve(args))
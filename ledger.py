@@ -0,0 +1,55 @@
+import numpy as np
+
+# Columns of a trip row; the first four are also the rider table layout of ArrayBuilding
+ORIGIN, DESTINATION, SPAWN, BOARD, ARRIVAL = range(5)
+
+class TripLedger:
+    """Append-only table of completed trips, one int64 row per delivered passenger.
+
+    Rows are appended in arrival order to a buffer that doubles when full, so
+    recording a trip is amortized O(1) and the trip table is a plain view
+    that wait, ride and trip times are computed from.
+    """
+    def __init__(self, capacity=256):
+        self._rows = np.zeros((capacity, 5), dtype=np.int64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, count):
+        while self.size + count > len(self._rows):
+            grown = np.zeros((2 * len(self._rows), 5), dtype=np.int64)
+            grown[:self.size] = self._rows[:self.size]
+            self._rows = grown
+
+    def record(self, origin, destination, spawn, board, arrival):
+        self._reserve(1)
+        self._rows[self.size] = (origin, destination, spawn, board, arrival)
+        self.size += 1
+
+    def record_many(self, riders, arrival):
+        """Record riders given as rows of ORIGIN/DESTINATION/SPAWN/BOARD that all arrived at `arrival`"""
+        count = len(riders)
+        self._reserve(count)
+        self._rows[self.size:self.size+count, :ARRIVAL] = riders[:, :ARRIVAL]
+        self._rows[self.size:self.size+count, ARRIVAL] = arrival
+        self.size += count
+
+    def clear(self):
+        self.size = 0
+
+    @property
+    def trips(self):
+        return self._rows[:self.size]
+
+    def wait_times(self):
+        """Time from spawn to boarding of every delivered passenger"""
+        return self.trips[:, BOARD] - self.trips[:, SPAWN]
+
+    def ride_times(self):
+        return self.trips[:, ARRIVAL] - self.trips[:, BOARD]
+
+    def trip_times(self):
+        """Time from spawn to arrival at the destination"""
+        return self.trips[:, ARRIVAL] - self.trips[:, SPAWN]
@@ -0,0 +1,144 @@
+import multiprocessing as mp
+import time
+import numpy as np
+from elevator_env import ElevatorEnv, env_config
+from dispatchers import Dispatcher, DISPATCHERS
+
+class Rollouts:
+    """Simulates candidate dispatches from restored snapshots under a base dispatcher.
+
+    Rollouts run on an array-core copy of the env (either core restores the
+    other's snapshots). The traffic generator is reseeded after each restore,
+    so a rollout samples future arrivals instead of replaying the real ones;
+    trace replays are deterministic and are simulated as recorded.
+    """
+    def __init__(self, config, base="eta"):
+        self.env = ElevatorEnv(**dict(config, array_core=True, flat_obs=False))
+        self.base = base
+
+    def run(self, snapshot, action, seed, horizon, discount, deadline):
+        """Discounted return of `action` followed by `horizon - 1` base dispatches,
+        or None if `deadline` (time.monotonic()) passes first"""
+        if time.monotonic() > deadline:
+            return None
+        env = self.env
+        env.restore(snapshot)
+        env.building.traffic.seed(seed)
+        base = DISPATCHERS[self.base](env)
+        obs, total, done, _, _ = env.step(env.dispatch_action(*action))
+        weight = 1.0
+        for _ in range(horizon - 1):
+            if done:
+                break
+            if time.monotonic() > deadline:
+                return None
+            weight *= discount
+            action, _ = base.predict(obs)
+            obs, reward, done, _, _ = env.step(action)
+            total += weight * reward
+        return float(total)
+
+_rollouts = None  # Rollouts of a pool worker
+
+def _init_worker(config, base):
+    global _rollouts
+    _rollouts = Rollouts(config, base)
+
+def _run(task):
+    return _rollouts.run(*task)
+
+def _ready(_):
+    return _rollouts is not None
+
+class LookaheadDispatcher(Dispatcher):
+    """Rollout-based planning dispatcher.
+
+    At each decision the base dispatcher proposes its `num_candidates`
+    cheapest dispatches plus the no-op action; each is scored by the mean
+    return of `rollouts` simulated continuations of `horizon` steps under the
+    base dispatcher, and the best one is taken. Candidates share the rollout
+    seeds of a decision, so they are compared on the same sampled futures.
+    With `workers > 0` rollouts are spread over a process pool. The `budget`
+    (seconds) covers one `predict` call, shared by its buildings: each lane
+    gets an equal part of what is left. Rollouts still running when a lane's
+    time runs out are dropped; if none finished, the base dispatcher's
+    action is taken. With a pool, rollouts stop `ipc_margin` of the lane's
+    time early to leave room for collecting their results.
+    """
+    def __init__(self, env, base="eta", num_candidates=6, rollouts=2, horizon=20, discount=0.99,
+                 budget=0.1, workers=0, seed=None, start_method=None, ipc_margin=0.2):
+        super().__init__(env)
+        # Rollouts start from snapshots, which need the envs in this process
+        self.envs = [e.unwrapped for e in getattr(env, "envs", [env])]
+        if not all(isinstance(e, ElevatorEnv) for e in self.envs):
+            raise ValueError("The lookahead dispatcher needs in-process ElevatorEnvs (an ElevatorEnv or a DummyVecEnv)")
+        if base not in DISPATCHERS:
+            raise ValueError(f"Unknown base dispatcher {base!r}, expected one of {sorted(DISPATCHERS)}")
+        if horizon < 1 or rollouts < 1:
+            raise ValueError("horizon and rollouts must be at least 1")
+        self.base = base
+        self.num_candidates = num_candidates
+        self.rollouts = rollouts
+        self.horizon = horizon
+        self.discount = discount
+        self.budget = budget
+        self.ipc_margin = ipc_margin
+        self.rng = np.random.default_rng(seed)
+        self._proposers = [DISPATCHERS[base](e) for e in self.envs]
+        config = env_config(self.envs[0])
+        if workers > 0:
+            if start_method is None:
+                # Fork is not safe once torch has started threads
+                start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+            self._pool = mp.get_context(start_method).Pool(workers, _init_worker, (config, base))
+            # Start the workers now, so their startup is not charged to the first decision
+            self._pool.map(_ready, range(workers), chunksize=1)
+            self._local = None
+        else:
+            self._pool = None
+            self._local = Rollouts(config, base)
+        self.last_scores = {}  # {candidate: mean return} of the last decision
+        self._deadline = None
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        self._deadline = time.monotonic() + self.budget
+        return super().predict(observation, state, episode_start, deterministic)
+
+    def _act(self, lane, building):
+        start = time.monotonic()
+        deadline = start + max(self._deadline - start, 0.0) / (self.num_envs - lane)
+        env = self.envs[lane]
+        candidates = self._proposers[lane].candidates(0, building, self.num_candidates)
+        if len(candidates) == 1:
+            return candidates[0]
+        snapshot = env.snapshot()
+        seeds = self.rng.integers(2**63, size=self.rollouts).tolist()
+        # Seed by seed, so a tight budget still scores every candidate once
+        if self._pool is not None:
+            stop = deadline - self.ipc_margin * (deadline - start)
+        else:
+            stop = deadline
+        tasks = [(snapshot, candidate, seed, self.horizon, self.discount, stop)
+                 for seed in seeds for candidate in candidates]
+        if self._pool is not None:
+            try:
+                results = self._pool.map_async(_run, tasks).get(max(deadline - time.monotonic(), 0.0))
+            except mp.TimeoutError:
+                results = [None] * len(tasks)
+        else:
+            results = [self._local.run(*task) for task in tasks]
+
+        returns = {}
+        for task, result in zip(tasks, results):
+            if result is not None:
+                returns.setdefault(task[1], []).append(result)
+        self.last_scores = {candidate: float(np.mean(r)) for candidate, r in returns.items()}
+        car, floor = max(self.last_scores, key=self.last_scores.get) if self.last_scores else candidates[0]
+        self._proposers[lane]._dispatched(0, building, car, floor)
+        return car, floor
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -1,30 +1,61 @@
 import argparse
 import os
 from datetime import datetime
-from stable_baselines3 import PPO
-from stable_baselines3.common.env_util import make_vec_env
-from stable_baselines3.common.callbacks import EvalCallback, StopTrainingOnRewardThreshold
-from stable_baselines3.common.torch_layers import CombinedExtractor
 from elevator_env import ElevatorEnv
-from gui import run_gui
+from dispatchers import DISPATCHERS
 import numpy as np
 
+# Stable-Baselines3 (and with it torch), the GUI toolkits and the vectorized envs are imported
+# by the commands that need them, so evaluating a dispatcher or a recording starts without them
+
+def _maskable_ppo():
+    """sb3-contrib's MaskablePPO, an optional dependency needed for --masked"""
+    try:
+        from sb3_contrib import MaskablePPO
+    except ImportError:
+        raise ImportError("--masked needs sb3-contrib: pip install sb3-contrib")
+    return MaskablePPO
+
 def setup_logging():
     """Create logging directory and return path"""
     log_dir = "logs/"
     os.makedirs(log_dir, exist_ok=True)
     return log_dir
 
-def train_agent(num_floors, num_elevators, total_timesteps, log_dir):
+def train_agent(num_floors, num_elevators, total_timesteps, log_dir, n_envs=4, batched=False, trace_path=None,
+                profile_every=0, n_workers=0, envs_per_worker=1, event_driven=False, flat_obs=False,
+                joint_actions=False, masked=False):
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.env_util import make_vec_env
+    from stable_baselines3.common.callbacks import EvalCallback, StopTrainingOnRewardThreshold
+    from stable_baselines3.common.torch_layers import CombinedExtractor
+    from vec_env import ElevatorVecEnv
+    from subproc_vec_env import SharedMemoryVecEnv
+
     # Create vectorized environment
-    env = make_vec_env(
-        lambda: ElevatorEnv(num_floors, num_elevators),
-        n_envs=4,  # Parallel environments for faster training
-        seed=np.random.randint(0, 1000)
-    )
+    if batched:
+        # All buildings simulated together in one batched step
+        env = ElevatorVecEnv(n_envs, num_floors, num_elevators, seed=np.random.randint(0, 1000),
+                             trace_path=trace_path, flat_obs=flat_obs, joint_actions=joint_actions)
+    elif n_workers > 0:
+        # Simulation spread over worker processes, exchanging data through shared memory
+        env = SharedMemoryVecEnv(n_workers, envs_per_worker, dict(
+            num_floors=num_floors, num_elevators=num_elevators, trace_path=trace_path,
+            profile=profile_every > 0, profile_every=profile_every, event_driven=event_driven,
+            flat_obs=flat_obs, joint_actions=joint_actions))
+        env.seed(np.random.randint(0, 1000))
+    else:
+        env = make_vec_env(
+            lambda: ElevatorEnv(num_floors, num_elevators, trace_path=trace_path,
+                                profile=profile_every > 0, profile_every=profile_every,
+                                event_driven=event_driven, flat_obs=flat_obs, joint_actions=joint_actions),
+            n_envs=n_envs,  # Parallel environments for faster training
+            seed=np.random.randint(0, 1000)
+        )
     
     # Setup evaluation callback
-    eval_env = ElevatorEnv(num_floors, num_elevators)
+    eval_env = ElevatorEnv(num_floors, num_elevators, trace_path=trace_path, event_driven=event_driven,
+                           flat_obs=flat_obs, joint_actions=joint_actions)
     eval_callback = EvalCallback(
         eval_env,
         best_model_save_path=log_dir,
@@ -38,16 +69,20 @@ def train_agent(num_floors, num_elevators, total_timesteps, log_dir):
         )
     )
     
-    # Use MultiInputPolicy for dictionary observations
+    # Use MultiInputPolicy for dictionary observations, MlpPolicy for the flat vector
     policy_kwargs = dict(
         net_arch=dict(pi=[64, 64], vf=[64, 64]),
         ortho_init=True,    # Better weight initialization
-        features_extractor_class=CombinedExtractor,
         # activation_fn=torch.nn.ReLU
     )
+    if not flat_obs:
+        policy_kwargs["features_extractor_class"] = CombinedExtractor
     
-    model = PPO(
-        "MultiInputPolicy",  # Changed from MlpPolicy
+    # With masking, PPO only samples dispatches that change something (see ElevatorEnv.action_masks)
+    algorithm = _maskable_ppo() if masked else PPO
+    model = algorithm(
+        # The flat observation is already normalized, so a plain MLP reads it directly
+        "MlpPolicy" if flat_obs else "MultiInputPolicy",
         env,
         verbose=1,
         tensorboard_log=log_dir,
@@ -78,61 +113,202 @@ def train_agent(num_floors, num_elevators, total_timesteps, log_dir):
     print(f"elevator_ppo_model_{num_floors}_{num_elevators}")
     return model
 
-def evaluate_agent(model_path, num_floors, num_elevators, num_episodes, render=False):
-    env = ElevatorEnv(num_floors, num_elevators)
-    model = PPO.load(model_path)
+def evaluate_agent(model_path, num_floors, num_elevators, num_episodes, render=False, trace_path=None, profile_every=0,
+                   event_driven=False, flat_obs=False, n_envs=1, n_workers=0, batched=False, record_path=None,
+                   lookahead_workers=0, budget=0.1, joint_actions=False, masked=False):
+    if n_envs > 1 or n_workers > 0 or batched:
+        from evaluation import make_eval_env, run_episodes, collect_metrics
+
+        # Episodes run concurrently on the lanes of a VecEnv, one batched predict per tick
+        venv = make_eval_env(num_floors, num_elevators, max(n_envs, n_workers), n_workers, batched, trace_path,
+                             event_driven, flat_obs, joint_actions)
+        model = load_policy(model_path, venv, lookahead_workers, budget, masked)
+        lane_metrics = []
+        results = run_episodes(model, venv, num_episodes, use_masks=masked, lane_metrics=lane_metrics)
+        episode_length = venv.get_attr("episode_length", 0)[0]
+        metrics = collect_metrics(lane_metrics)
+        venv.close()
+        if hasattr(model, "close"):
+            model.close()
+        for episode, result in enumerate(results):
+            print(f"\nEpisode {episode + 1}:")
+            print(f"  Reward: {result['reward']:.2f}")
+            print(f"  Avg Wait Time: {result['total_wait_time']/episode_length:.2f} steps")
+            print(f"  Elevator Utilization: {result['elevator_utilization']*100:.2f}%")
+        _print_summary([r["reward"] for r in results], [r["total_wait_time"] for r in results],
+                       [r["elevator_utilization"] for r in results], metrics=metrics)
+        return
+
+    env = ElevatorEnv(num_floors, num_elevators, trace_path=trace_path,
+                      profile=profile_every > 0, profile_every=profile_every, event_driven=event_driven,
+                      flat_obs=flat_obs, metrics=True, joint_actions=joint_actions)
+    model = load_policy(model_path, env, lookahead_workers, budget, masked)
+    # Steps go through the recorder when recording; statistics are read from the env itself
+    if record_path:
+        from recordings import EpisodeRecorder
+        runner = EpisodeRecorder(env, record_path)
+    else:
+        runner = env
     
     rewards = []
     wait_times = []
     utilizations = []
+    trip_times = []
     
     for episode in range(num_episodes):
-        obs, _ = env.reset()
+        obs, _ = runner.reset()
         done = False
         episode_reward = 0
         
         while not done:
             if render:
                 env.render(mode='human')
-            action, _ = model.predict(obs, deterministic=True)
-            obs, reward, done, _, info = env.step(action)
+            masks = {"action_masks": env.action_masks()} if masked else {}
+            action, _ = model.predict(obs, deterministic=True, **masks)
+            obs, reward, done, _, info = runner.step(action)
             episode_reward += reward
         
         rewards.append(episode_reward)
         wait_times.append(info.get("total_wait_time", 0))
         utilizations.append(info.get("elevator_utilization", 0))
+        ledger = env.building.ledger
+        trip_times.append(ledger.trip_times().mean() if len(ledger) else 0)
         
         print(f"\nEpisode {episode + 1}:")
         print(f"  Reward: {episode_reward:.2f}")
         print(f"  Avg Wait Time: {info.get('total_wait_time', 0)/env.episode_length:.2f} steps")
+        print(f"  Delivered: {len(ledger)} passengers, avg trip time {trip_times[-1]:.2f} steps")
         print(f"  Elevator Utilization: {info.get('elevator_utilization', 0)*100:.2f}%")
     
+    if record_path:
+        runner.close()
+        print(f"\nRecorded {num_episodes} episodes to {record_path}")
+    if hasattr(model, "close"):
+        model.close()
+    _print_summary(rewards, wait_times, utilizations, trip_times, env.metrics)
+
+def load_policy(model_path, env, lookahead_workers=0, budget=0.1, masked=False):
+    """The classical dispatcher named `model_path` (see dispatchers.py) or the rollout planner ("lookahead",
+    see lookahead.py) bound to `env`, else a saved PPO model"""
+    if model_path in DISPATCHERS:
+        return DISPATCHERS[model_path](env)
+    if model_path == "lookahead":
+        from lookahead import LookaheadDispatcher
+        return LookaheadDispatcher(env, workers=lookahead_workers, budget=budget)
+    if model_path.endswith(".npz"):
+        # Exported actor (see export_model), evaluated without torch
+        from numpy_policy import NumpyPolicy
+        return NumpyPolicy.load(model_path)
+    if masked:
+        return _maskable_ppo().load(model_path)
+    from stable_baselines3 import PPO
+    return PPO.load(model_path)
+
+def export_model(model_path, weights_path=None, masked=False):
+    """Write the actor of a saved PPO model to a NumPy weights file (see numpy_policy.py)
+    and check that it reproduces the model's deterministic actions"""
+    from numpy_policy import NumpyPolicy, export_policy
+    model = load_policy(model_path, None, masked=masked)
+    weights_path = weights_path or os.path.splitext(model_path)[0] + ".npz"
+    export_policy(model, weights_path)
+    policy = NumpyPolicy.load(weights_path)
+    samples = [model.observation_space.sample() for _ in range(256)]
+    if isinstance(samples[0], dict):
+        observations = {key: np.stack([sample[key] for sample in samples]) for key in samples[0]}
+    else:
+        observations = np.stack(samples)
+    expected, _ = model.predict(observations, deterministic=True)
+    actions, _ = policy.predict(observations)
+    matches = np.mean(np.all(actions == expected, axis=1))
+    print(f"Exported {model_path} to {weights_path} ({os.path.getsize(weights_path) / 1024:.1f} KB); "
+          f"{matches*100:.1f}% of sampled observations get the model's action")
+    return weights_path
+
+def _print_summary(rewards, wait_times, utilizations, trip_times=None, metrics=None):
     print("\nEvaluation Summary:")
     print(f"Average Reward: {np.mean(rewards):.2f} ± {np.std(rewards):.2f}")
     print(f"Average Wait Time: {np.mean(wait_times):.2f} steps")
     print(f"Average Utilization: {np.mean(utilizations)*100:.2f}%")
+    if trip_times:
+        print(f"Average Trip Time: {np.mean(trip_times):.2f} steps")
+    if metrics is not None:
+        # Per-passenger tail latencies over every trip of the evaluation
+        for name, sketch in (("Wait", metrics.wait_times), ("Trip", metrics.trip_times)):
+            p = sketch.percentiles()
+            print(f"{name} Time P50/P95/P99: {p['p50']:.1f} / {p['p95']:.1f} / {p['p99']:.1f} steps")
+        # Trip times need an arrival, so only wait times include the passengers left over at episode ends
+        print(f"Wait times include {metrics.open_waits} passengers undelivered at episode end, "
+              f"counted with their wait so far (a lower bound)")
+        print(f"Throughput: {metrics.total_delivered / max(metrics.total_ticks, 1):.3f} passengers/step")
 
 def main():
     parser = argparse.ArgumentParser(description="Elevator Dispatch RL System")
     parser.add_argument("--gui", action="store_true", help="Run GUI simulation")
     parser.add_argument("--train", action="store_true", help="Train the RL agent")
-    parser.add_argument("--evaluate", type=str, help="Evaluate model (provide path)")
+    parser.add_argument("--evaluate", type=str,
+                        help="Evaluate model (provide path, an exported .npz weights file, nearest, look or eta "
+                             "for a classical dispatcher, "
+                             "or lookahead for the rollout planner)")
     parser.add_argument("--floors", type=int, default=10, help="Number of floors")
     parser.add_argument("--elevators", type=int, default=3, help="Number of elevators")
     parser.add_argument("--timesteps", type=int, default=100000, help="Training timesteps")
+    parser.add_argument("--n-envs", type=int, default=4, help="Parallel training environments")
+    parser.add_argument("--batched", action="store_true", help="Simulate all training environments in one batched VecEnv")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Train on environments in this many worker processes (shared-memory VecEnv)")
+    parser.add_argument("--envs-per-worker", type=int, default=1, help="Environments stepped by each worker process")
     parser.add_argument("--episodes", type=int, default=10, help="Evaluation episodes")
+    parser.add_argument("--eval-envs", type=int, default=1,
+                        help="Evaluation episodes run concurrently with batched predictions (use --workers or --batched to parallelize them)")
     parser.add_argument("--render", action="store_true", help="Render evaluation")
+    parser.add_argument("--trace", type=str, help="Replay arrivals from a trace file (see traces.py)")
+    parser.add_argument("--event-driven", action="store_true",
+                        help="Skip ahead between decision events instead of deciding every step (not with --batched)")
+    parser.add_argument("--flat-obs", action="store_true",
+                        help="Use the normalized flat observation vector and an MLP policy")
+    parser.add_argument("--joint-actions", action="store_true",
+                        help="Each action sets a destination (or keeps the orders) of every elevator at once")
+    parser.add_argument("--masked", action="store_true",
+                        help="Train/evaluate with sb3-contrib's MaskablePPO on the valid dispatch masks")
+    parser.add_argument("--record", type=str, metavar="PATH",
+                        help="Record the evaluated episodes to a file (sequential evaluation only)")
+    parser.add_argument("--replay", type=str, metavar="PATH", help="Play a recording back in the GUI")
+    parser.add_argument("--model", type=str, default="elevator_ppo_model",
+                        help="Model path prefix or dispatcher name for the GUI")
+    parser.add_argument("--lookahead-workers", type=int, default=0,
+                        help="Processes running the rollouts of the lookahead planner (0: in-process)")
+    parser.add_argument("--budget", type=float, default=0.1,
+                        help="Wall-clock seconds the lookahead planner may spend per decision, shared by all buildings")
+    parser.add_argument("--export", type=str, metavar="MODEL",
+                        help="Export the actor of a saved PPO model to a NumPy weights file for torch-free inference")
+    parser.add_argument("--weights", type=str, metavar="PATH",
+                        help="Weights file written by --export (default: the model path with .npz)")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="Print per-phase step timings every N steps of each environment (not with --batched)")
     
     args = parser.parse_args()
     log_dir = setup_logging()
 
+    if args.export:
+        export_model(args.export, args.weights, args.masked)
+
     if args.train:
         print(f"Training agent for {args.timesteps} timesteps...")
         train_agent(
             args.floors,
             args.elevators,
             args.timesteps,
-            log_dir
+            log_dir,
+            args.n_envs,
+            args.batched,
+            args.trace,
+            args.profile,
+            args.workers,
+            args.envs_per_worker,
+            args.event_driven,
+            args.flat_obs,
+            args.joint_actions,
+            args.masked
         )
     
     if args.evaluate:
@@ -142,11 +318,24 @@ def main():
             args.floors,
             args.elevators,
             args.episodes,
-            args.render
+            args.render,
+            args.trace,
+            args.profile,
+            args.event_driven,
+            args.flat_obs,
+            args.eval_envs,
+            args.workers,
+            args.batched,
+            args.record,
+            args.lookahead_workers,
+            args.budget,
+            args.joint_actions,
+            args.masked
         )
     
     if args.gui:
-        run_gui(args.floors, args.elevators)
+        from gui import run_gui
+        run_gui(args.floors, args.elevators, args.model, args.replay, args.lookahead_workers, args.budget)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,204 @@
+import numpy as np
+from ledger import SPAWN, BOARD, ARRIVAL
+
+PERCENTILES = (50, 95, 99)
+
+class RingBuffer:
+    """Fixed-size buffer of the last `capacity` values of a series"""
+    def __init__(self, capacity, dtype=np.float64):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._next = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % len(self._data)
+        self.size = min(self.size + 1, len(self._data))
+
+    def extend(self, values):
+        values = np.asarray(values)[-len(self._data):]
+        count = len(values)
+        end = self._next + count
+        if end <= len(self._data):
+            self._data[self._next:end] = values
+        else:
+            split = len(self._data) - self._next
+            self._data[self._next:] = values[:split]
+            self._data[:end - len(self._data)] = values[split:]
+        self._next = end % len(self._data)
+        self.size = min(self.size + count, len(self._data))
+
+    def values(self):
+        """Stored values, oldest first (a copy)"""
+        if self.size < len(self._data):
+            return self._data[:self.size].copy()
+        return np.concatenate((self._data[self._next:], self._data[:self._next]))
+
+    def first(self, default=0):
+        if not self.size:
+            return default
+        return self._data[self._next] if self.size == len(self._data) else self._data[0]
+
+    def last(self, default=0):
+        return self._data[self._next - 1] if self.size else default
+
+    def mean(self):
+        return float(self._data[:self.size].mean()) if self.size else 0.0
+
+    def clear(self):
+        self._next = 0
+        self.size = 0
+
+class QuantileSketch:
+    """Mergeable quantile sketch of non-negative values (DDSketch-style).
+
+    A value v >= 1 is counted in bucket ceil(log_gamma(v)), with
+    gamma = (1 + a) / (1 - a), so every reported quantile is within relative
+    accuracy `a` of a true one, and memory grows with log(max value), not with
+    the number of values. Zeros are counted exactly; values in (0, 1) share
+    the first bucket, which suits tick counts. Sketches with the same accuracy
+    merge by adding bucket counts.
+    """
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self._gamma)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0
+        self.count = 0
+        self._cached = (None, None)  # (count, percentiles) of the last percentiles() call
+
+    def __len__(self):
+        return self.count
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+        if len(positive):
+            buckets = np.maximum(np.ceil(np.log(positive) / self._log_gamma), 0).astype(np.int64)
+            self._add_counts(np.bincount(buckets))
+
+    def _add_counts(self, counts):
+        if len(counts) > len(self._counts):
+            self._counts = np.concatenate((self._counts, np.zeros(len(counts) - len(self._counts), dtype=np.int64)))
+        self._counts[:len(counts)] += counts
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        self._add_counts(other._counts)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantiles(self, qs):
+        """Estimated values at quantiles `qs` (in [0, 1]); NaN while empty"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if not self.count:
+            return np.full(qs.shape, np.nan)
+        ranks = qs * (self.count - 1)
+        buckets = np.searchsorted(np.cumsum(self._counts), ranks - self.zero_count, side="right")
+        # Bucket i covers (gamma^(i-1), gamma^i]; its estimate is within the accuracy of both ends
+        estimates = 2 * self._gamma ** buckets / (self._gamma + 1)
+        return np.where(ranks < self.zero_count, 0.0, estimates)
+
+    def percentiles(self, ps=PERCENTILES):
+        """{"p50": ..., ...} for the percentiles `ps`, cached until new values arrive"""
+        key = (self.count, tuple(ps))
+        if self._cached[0] != key:
+            self._cached = (key, {f"p{p}": float(v) for p, v in zip(ps, self.quantiles(np.asarray(ps) / 100))})
+        return dict(self._cached[1])
+
+class StreamingMetrics:
+    """Bounded-memory episode metrics for soak tests, evaluation and the GUI.
+
+    Per-step series (reward, utilization, waiting passengers, cumulative
+    deliveries and ticks) keep only the last `window` steps in ring buffers.
+    Per-passenger wait and trip times go to quantile sketches covering every
+    trip since the metrics were created, and the most recent waits are kept
+    for histograms. Trips are read incrementally from the building's ledger.
+    Passengers still waiting or riding when an episode ends are added to the
+    wait sketch with their wait so far (`record_open_waits`); mid-episode,
+    the wait percentiles cover delivered passengers only and so understate
+    the tail under load.
+    """
+    def __init__(self, window=1000, relative_accuracy=0.01):
+        self.rewards = RingBuffer(window)
+        self.utilization = RingBuffer(window)
+        self.waiting = RingBuffer(window, dtype=np.int64)
+        self.delivered = RingBuffer(window, dtype=np.int64)  # cumulative deliveries after each step
+        self.ticks = RingBuffer(window, dtype=np.int64)  # cumulative simulated ticks after each step
+        self.recent_waits = RingBuffer(window, dtype=np.int64)
+        self.wait_times = QuantileSketch(relative_accuracy)
+        self.trip_times = QuantileSketch(relative_accuracy)
+        self.steps = 0
+        self.total_ticks = 0
+        self.total_delivered = 0
+        self.open_waits = 0  # undelivered passengers counted in wait_times at episode ends
+        self._ledger = None
+        self._seen = 0
+
+    def record(self, building, reward, elapsed=1):
+        """Record one env step of `elapsed` ticks and the trips completed during it"""
+        ledger = building.ledger
+        if ledger is not self._ledger:  # a new episode's building
+            self._ledger, self._seen = ledger, 0
+        self.record_trips(ledger.trips[self._seen:])
+        self._seen = len(ledger)
+
+        self.steps += 1
+        self.total_ticks += elapsed
+        self.rewards.append(reward)
+        self.utilization.append(building.get_utilization())
+        self.waiting.append(int(building.get_waiting_counts().sum()))
+        self.delivered.append(self.total_delivered)
+        self.ticks.append(self.total_ticks)
+
+    def record_trips(self, trips):
+        """Add ledger rows of completed trips to the wait and trip time sketches"""
+        if not len(trips):
+            return
+        waits = trips[:, BOARD] - trips[:, SPAWN]
+        self.wait_times.add(waits)
+        self.trip_times.add(trips[:, ARRIVAL] - trips[:, SPAWN])
+        self.recent_waits.extend(waits)
+        self.total_delivered += len(trips)
+
+    def record_open_waits(self, waits):
+        """Add the waits of passengers left undelivered at the end of an episode"""
+        self.wait_times.add(waits)
+        self.open_waits += len(waits)
+
+    def merge(self, other):
+        """Fold another lane's sketches and totals into these (ring buffers are per lane)"""
+        self.wait_times.merge(other.wait_times)
+        self.trip_times.merge(other.trip_times)
+        self.steps += other.steps
+        self.total_ticks += other.total_ticks
+        self.total_delivered += other.total_delivered
+        self.open_waits += other.open_waits
+        return self
+
+    def throughput(self):
+        """Passengers delivered per tick over the window"""
+        if len(self.ticks) < 2:
+            return self.total_delivered / max(self.total_ticks, 1)
+        ticks = int(self.ticks.last() - self.ticks.first())
+        return float(self.delivered.last() - self.delivered.first()) / max(ticks, 1)
+
+    def snapshot(self):
+        """Flat dict of the current tail latencies, throughput and utilization"""
+        snapshot = {f"wait_{k}": v for k, v in self.wait_times.percentiles().items()}
+        snapshot.update({f"trip_{k}": v for k, v in self.trip_times.percentiles().items()})
+        snapshot["delivered"] = self.total_delivered
+        snapshot["open_waits"] = self.open_waits
+        snapshot["throughput"] = self.throughput()
+        snapshot["utilization"] = self.utilization.mean()
+        return snapshot
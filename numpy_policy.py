@@ -0,0 +1,144 @@
+import numpy as np
+
+# Weights file layout (np.savez, no pickled objects):
+#   version                  format version
+#   observation_keys         observation keys in the order their values are concatenated ("" for a flat Box)
+#   observation_shapes       (len(keys), max_ndim) shapes, padded with -1
+#   activation               "tanh" or "relu"
+#   nvec                     categories of each action dimension
+#   weight_i, bias_i         hidden layers of the actor, in order; the last pair is the action head
+FORMAT_VERSION = 1
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+}
+
+def export_policy(model, path):
+    """Write the actor of a trained PPO (or MaskablePPO) model to the weights file `path`.
+
+    Only what deterministic and sampled predictions need is kept: the hidden
+    layers of the policy network and the action head. The value network and
+    optimizer state are dropped. The observation must be a Box or a Dict of
+    Boxes read through flattening extractors, and the actions MultiDiscrete.
+    """
+    from gymnasium import spaces
+    from torch import nn
+    from stable_baselines3.common.torch_layers import CombinedExtractor, FlattenExtractor
+    policy = model.policy
+    if not isinstance(policy.action_space, spaces.MultiDiscrete):
+        raise ValueError(f"Only MultiDiscrete action spaces can be exported, not {policy.action_space}")
+    observation_space = policy.observation_space
+    if isinstance(observation_space, spaces.Dict):
+        extractors = getattr(policy.pi_features_extractor, "extractors", {})
+        if not isinstance(policy.pi_features_extractor, CombinedExtractor) or \
+                not all(isinstance(e, nn.Flatten) for e in extractors.values()):
+            raise ValueError("Dict observations must be read by a CombinedExtractor of Flatten layers")
+        observation_spaces = observation_space.spaces
+    elif isinstance(policy.pi_features_extractor, FlattenExtractor):
+        observation_spaces = {"": observation_space}
+    else:
+        raise ValueError("Flat observations must be read by a FlattenExtractor")
+    if not all(isinstance(space, spaces.Box) for space in observation_spaces.values()):
+        raise ValueError("Only Box observations (or Dicts of them) can be exported")
+
+    layers, activation = [], None
+    for module in policy.mlp_extractor.policy_net:
+        if isinstance(module, nn.Linear):
+            layers.append(module)
+            continue
+        name = {nn.Tanh: "tanh", nn.ReLU: "relu"}.get(type(module))
+        if name is None or activation not in (None, name):
+            raise ValueError(f"Unsupported actor layer {module}")
+        activation = name
+    layers.append(policy.action_net)
+    arrays = {}
+    for i, layer in enumerate(layers):
+        # Stored transposed, so a forward pass is features @ weight
+        arrays[f"weight_{i}"] = layer.weight.detach().cpu().numpy().T.astype(np.float32)
+        arrays[f"bias_{i}"] = layer.bias.detach().cpu().numpy().astype(np.float32)
+    ndim = max(len(space.shape) for space in observation_spaces.values())
+    shapes = np.full((len(observation_spaces), ndim), -1, dtype=np.int64)
+    for i, space in enumerate(observation_spaces.values()):
+        shapes[i, :len(space.shape)] = space.shape
+    with open(path, "wb") as f:  # a file object keeps np.savez from appending ".npz"
+        np.savez(f, version=FORMAT_VERSION, observation_keys=np.array(list(observation_spaces)),
+                 observation_shapes=shapes, activation=np.array(activation or "tanh"),
+                 nvec=np.asarray(policy.action_space.nvec, dtype=np.int64), **arrays)
+
+class NumpyPolicy:
+    """Actor of an exported PPO model, evaluated with NumPy only.
+
+    `predict` follows the Stable-Baselines3 interface (single or batched
+    observations, optional `action_masks`), so an exported policy can stand in
+    for the model in evaluation, the GUI and the inference server. With
+    `deterministic=True` the action is the argmax of each action dimension's
+    logits, as in the torch policy; otherwise it is sampled from them.
+    """
+    def __init__(self, weights, biases, nvec, observation_keys, observation_shapes, activation="tanh", seed=None):
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unknown activation {activation!r}, expected one of {sorted(ACTIVATIONS)}")
+        self.weights = weights
+        self.biases = biases
+        self.nvec = np.asarray(nvec)
+        self.observation_keys = list(observation_keys)
+        self.observation_shapes = [tuple(shape) for shape in observation_shapes]
+        self.activation = activation
+        self._activation = ACTIVATIONS[activation]
+        # (dims, max(nvec)) logit columns of each action dimension; short dimensions repeat their
+        # first column, which never changes the argmax, so one gather and argmax pick every action
+        starts = np.concatenate(([0], np.cumsum(self.nvec)[:-1]))
+        columns = np.arange(self.nvec.max())
+        self._columns = starts[:, None] + np.where(columns < self.nvec[:, None], columns, 0)
+        self._flat = self.observation_keys == [""]
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def load(cls, path, seed=None):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != FORMAT_VERSION:
+                raise ValueError(f"{path} has weights format version {int(data['version'])}, expected {FORMAT_VERSION}")
+            count = sum(1 for name in data.files if name.startswith("weight_"))
+            weights = [data[f"weight_{i}"] for i in range(count)]
+            biases = [data[f"bias_{i}"] for i in range(count)]
+            shapes = [tuple(int(n) for n in row if n >= 0) for row in data["observation_shapes"]]
+            return cls(weights, biases, data["nvec"], data["observation_keys"].tolist(), shapes,
+                       str(data["activation"]), seed)
+
+    def _features(self, observation):
+        """(batch, features) float32 inputs, and whether the observation was a single one"""
+        if self._flat:
+            features = np.asarray(observation, dtype=np.float32)
+            single = features.shape == self.observation_shapes[0]
+            return features.reshape(1 if single else len(features), -1), single
+        first = np.asarray(observation[self.observation_keys[0]])
+        single = first.shape == self.observation_shapes[0]
+        batch = 1 if single else len(first)
+        return np.concatenate([np.asarray(observation[key], dtype=np.float32).reshape(batch, -1)
+                               for key in self.observation_keys], axis=1), single
+
+    def logits(self, observation):
+        """(batch, sum(nvec)) action logits"""
+        x, _ = self._features(observation)
+        return self._forward(x)
+
+    def _forward(self, x):
+        last = len(self.weights) - 1
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            x = x @ weight
+            x += bias
+            if i < last:
+                x = self._activation(x)
+        return x
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True, action_masks=None):
+        x, single = self._features(observation)
+        logits = self._forward(x)
+        if action_masks is not None:
+            # Same convention as sb3-contrib: masked logits become a large negative number
+            masks = np.asarray(action_masks, dtype=bool).reshape(logits.shape)
+            logits = np.where(masks, logits, np.float32(-1e8))
+        if not deterministic:
+            # Gumbel-max: argmax of logits plus Gumbel noise samples each categorical
+            logits = logits - np.log(-np.log(self.rng.random(logits.shape)))
+        actions = logits[:, self._columns].argmax(axis=2)
+        return (actions[0] if single else actions), state
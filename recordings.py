@@ -0,0 +1,234 @@
+import json
+import gymnasium as gym
+import numpy as np
+from elevator_env import ElevatorEnv, env_config
+
+# File layout: a fixed header, the ElevatorEnv keyword arguments as JSON, then chunks.
+# Each chunk is a CHUNK header followed by the contiguous little-endian columns of its steps:
+#   episode      int32[n]           episode index; each episode starts with a reset row
+#   time_step    int32[n]           env.current_step after the step, 0 on reset rows
+#   actions      int32[n, *action]  action_space shape (2, or num_elevators with joint actions); -1 on reset rows
+#   rewards      float32[n]         0 on reset rows
+#   trip_counts  int32[n]           trips completed during each step
+#   obs/<key>    dtype[n, *shape]   one column per observation key ("obs/flat" for flat observations)
+#   trips        int64[m, 5]        completed trips in TripLedger layout, in step order
+#   seeds        int64[k]           reset seeds of the k episodes starting in the chunk
+MAGIC = b"ELVRECRD"
+VERSION = 1
+HEADER = np.dtype([
+    ("magic", "S8"), ("version", "<u4"), ("num_floors", "<u4"), ("num_elevators", "<u4"),
+    ("config_bytes", "<u4"), ("reserved", "V24"),
+])
+CHUNK = np.dtype([("num_steps", "<u8"), ("num_trips", "<u8"), ("num_episodes", "<u8")])
+
+def _columns(env):
+    """(name, dtype, row shape) of every per-step column"""
+    columns = [("episode", "<i4", ()), ("time_step", "<i4", ()), ("actions", "<i4", env.action_space.shape),
+               ("rewards", "<f4", ()), ("trip_counts", "<i4", ())]
+    spaces = env.observation_space.spaces if hasattr(env.observation_space, "spaces") \
+        else {"flat": env.observation_space}
+    for key, space in spaces.items():
+        columns.append(("obs/" + key, np.dtype(space.dtype).newbyteorder("<"), space.shape))
+    return columns
+
+class EpisodeRecorder(gym.Wrapper):
+    """Records every step of an ElevatorEnv to a chunked columnar file.
+
+    Steps are copied into preallocated chunk buffers and written out every
+    `chunk_size` steps, so recording costs a few array copies per step. Each
+    reset draws its seed from `seed` and records it, which makes every episode
+    reproducible by ReplayEnv.
+    """
+    def __init__(self, env, path, chunk_size=4096, seed=None):
+        super().__init__(env)
+        base = env.unwrapped
+        self.path = path
+        self.chunk_size = chunk_size
+        self._columns = _columns(base)
+        self._buffers = {name: np.zeros((chunk_size,) + shape, dtype=dtype) for name, dtype, shape in self._columns}
+        self._obs_keys = [name[4:] for name, _, _ in self._columns if name.startswith("obs/")]
+        self._trips = []
+        self._seeds = []
+        self._rows = 0
+        self._seed_rng = np.random.default_rng(seed)
+        self._episode = -1
+        self._ledger = None
+        self._seen = 0
+
+        config = json.dumps(env_config(base)).encode()
+        header = np.zeros(1, dtype=HEADER)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["num_floors"] = base.num_floors
+        header["num_elevators"] = base.num_elevators
+        header["config_bytes"] = len(config)
+        self._file = open(path, "wb")
+        self._file.write(header.tobytes())
+        self._file.write(config)
+
+    def reset(self, seed=None, **kwargs):
+        if seed is None:
+            seed = int(self._seed_rng.integers(2**63))
+        obs, info = self.env.reset(seed=seed, **kwargs)
+        self._episode += 1
+        self._seeds.append(seed)
+        self._record(obs, -1, 0.0)
+        return obs, info
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        self._record(obs, action, reward)
+        return obs, reward, terminated, truncated, info
+
+    def _record(self, obs, action, reward):
+        base = self.env.unwrapped
+        row, buffers = self._rows, self._buffers
+        ledger = base.building.ledger
+        if ledger is not self._ledger:  # a new episode's building
+            self._ledger, self._seen = ledger, 0
+        trips = ledger.trips[self._seen:]
+        self._seen = len(ledger)
+        if len(trips):
+            self._trips.append(trips.copy())
+
+        buffers["episode"][row] = self._episode
+        buffers["time_step"][row] = base.current_step
+        buffers["actions"][row] = action
+        buffers["rewards"][row] = reward
+        buffers["trip_counts"][row] = len(trips)
+        for key in self._obs_keys:
+            buffers["obs/" + key][row] = obs[key] if isinstance(obs, dict) else obs
+        self._rows += 1
+        if self._rows == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered steps as one chunk"""
+        if not self._rows:
+            return
+        trips = np.concatenate(self._trips) if self._trips else np.zeros((0, 5), dtype=np.int64)
+        chunk = np.zeros(1, dtype=CHUNK)
+        chunk["num_steps"] = self._rows
+        chunk["num_trips"] = len(trips)
+        chunk["num_episodes"] = len(self._seeds)
+        self._file.write(chunk.tobytes())
+        for name, _, _ in self._columns:
+            self._file.write(self._buffers[name][:self._rows].tobytes())
+        self._file.write(trips.astype("<i8").tobytes())
+        self._file.write(np.asarray(self._seeds, dtype="<i8").tobytes())
+        self._rows = 0
+        self._trips = []
+        self._seeds = []
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+        super().close()
+
+class Recording:
+    """Memory-mapped reader of an EpisodeRecorder file.
+
+    Columns are mapped chunk by chunk, so opening a recording reads only the
+    chunk headers and any step can be reconstructed without re-simulating.
+    """
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER, count=1)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not an elevator recording")
+        with open(path, "rb") as f:
+            f.seek(HEADER.itemsize)
+            self.env_kwargs = json.loads(f.read(int(header["config_bytes"])))
+        columns = _columns(ElevatorEnv(**self.env_kwargs))
+
+        self.chunks = []
+        offset = HEADER.itemsize + int(header["config_bytes"])
+        with open(path, "rb") as f:
+            while True:
+                f.seek(offset)
+                raw = f.read(CHUNK.itemsize)
+                if len(raw) < CHUNK.itemsize:
+                    break
+                chunk_header = np.frombuffer(raw, dtype=CHUNK)[0]
+                offset += CHUNK.itemsize
+                steps = int(chunk_header["num_steps"])
+                chunk = {}
+                for name, dtype, shape in columns + [("trips", "<i8", (5,)), ("seeds", "<i8", ())]:
+                    rows = {"trips": int(chunk_header["num_trips"]),
+                            "seeds": int(chunk_header["num_episodes"])}.get(name, steps)
+                    chunk[name] = self._map(dtype, offset, (rows,) + shape)
+                    offset += chunk[name].nbytes
+                chunk["trip_offsets"] = np.concatenate(([0], np.cumsum(chunk["trip_counts"])))
+                self.chunks.append(chunk)
+        self.chunk_starts = np.cumsum([0] + [len(chunk["episode"]) for chunk in self.chunks])
+        self.num_steps = int(self.chunk_starts[-1])
+        self.episode_seeds = self.column("seeds")
+        self.obs_keys = [name[4:] for name, _, _ in columns if name.startswith("obs/")]
+
+    def _map(self, dtype, offset, shape):
+        # np.memmap rejects empty maps
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    def __len__(self):
+        return self.num_steps
+
+    def column(self, name):
+        """One column over all chunks (a copy unless the recording has a single chunk)"""
+        parts = [chunk[name] for chunk in self.chunks]
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.zeros(0)
+
+    def step(self, index):
+        """Everything recorded for row `index`: episode, time_step, action, reward, obs and its trips"""
+        if not 0 <= index < self.num_steps:
+            raise IndexError(f"step {index} out of range for a recording of {self.num_steps} steps")
+        c = int(np.searchsorted(self.chunk_starts, index, side="right")) - 1
+        chunk, row = self.chunks[c], index - self.chunk_starts[c]
+        obs = {key: np.array(chunk["obs/" + key][row]) for key in self.obs_keys}
+        return {
+            "episode": int(chunk["episode"][row]),
+            "time_step": int(chunk["time_step"][row]),
+            "action": np.array(chunk["actions"][row]),
+            "reward": float(chunk["rewards"][row]),
+            "obs": obs["flat"] if self.obs_keys == ["flat"] else obs,
+            "trips": np.array(chunk["trips"][chunk["trip_offsets"][row]:chunk["trip_offsets"][row+1]]),
+        }
+
+    def episode_rows(self, episode):
+        """Row indices of `episode`, starting with its reset row"""
+        return np.flatnonzero(self.column("episode") == episode)
+
+class ReplayEnv(ElevatorEnv):
+    """ElevatorEnv that re-simulates a recording.
+
+    reset() restores the recorded episode seeds in order and predict() returns
+    the recorded actions, so the env doubles as the model of an ElevatorGUI
+    to play a recording back without the policy that produced it.
+    """
+    def __init__(self, recording):
+        self.recording = recording if isinstance(recording, Recording) else Recording(recording)
+        super().__init__(**self.recording.env_kwargs)
+        self._episode = -1
+        self._actions = np.zeros((0,) + self.action_space.shape, dtype=np.int32)
+        self._next = 0
+
+    def reset(self, seed=None, **kwargs):
+        self._episode = (self._episode + 1) % max(len(self.recording.episode_seeds), 1)
+        rows = self.recording.episode_rows(self._episode)
+        self._actions = self.recording.column("actions")[rows[1:]]
+        self._next = 0
+        return super().reset(seed=int(self.recording.episode_seeds[self._episode]), **kwargs)
+
+    def step(self, action):
+        self._next += 1
+        return super().step(action)
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=True):
+        """The recorded action of the next step (the last one once the recorded episode ends)"""
+        if not len(self._actions):
+            raise ValueError(f"{self.recording.path} holds no steps for episode {self._episode}")
+        return np.array(self._actions[min(self._next, len(self._actions) - 1)]), state
@@ -0,0 +1,86 @@
+import numpy as np
+from elevator_env import ElevatorEnv
+
+# The worker side of SharedMemoryVecEnv. Worker processes import only this module, so they
+# start without Stable-Baselines3 and torch.
+
+def shared_array(ctx, shape, dtype):
+    """Zeroed shared-memory block large enough for an array of `shape` and `dtype`"""
+    return ctx.RawArray("b", max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+
+def views(blocks, specs):
+    """NumPy views of the shared blocks, one per buffer spec"""
+    return {key: np.frombuffer(blocks[key], dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            for key, (shape, dtype) in specs.items()}
+
+def obs_spaces(observation_space):
+    """Observation buffers to share: one per Dict key, or a single "flat" one for a Box space"""
+    if hasattr(observation_space, "spaces"):
+        return observation_space.spaces
+    return {"flat": observation_space}
+
+def run_worker(remote, parent_remote, env_kwargs, start, count, blocks, specs):
+    """Step `count` ElevatorEnvs whose rows in the shared buffers start at `start`.
+
+    Only short commands travel over the pipe; actions are read from and
+    observations, rewards, dones and info scalars written to shared memory.
+    Step replies carry just the metrics and profile info dicts, if any.
+    """
+    parent_remote.close()
+    envs = [ElevatorEnv(**env_kwargs) for _ in range(count)]
+    buffers = views(blocks, specs)
+    actions, rewards, dones = buffers["actions"], buffers["rewards"], buffers["dones"]
+    wait_times, utilizations = buffers["total_wait_time"], buffers["elevator_utilization"]
+    elapsed_times = buffers.get("elapsed_time")
+    obs_buffers = {key[4:]: buffer for key, buffer in buffers.items() if key.startswith("obs/")}
+    terminal_buffers = {key[9:]: buffer for key, buffer in buffers.items() if key.startswith("terminal/")}
+    rows = range(start, start + count)
+
+    def write_obs(target, row, obs):
+        for key, buffer in target.items():
+            buffer[row] = obs[key] if isinstance(obs, dict) else obs
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                extras = {}  # info dicts too large for shared memory, by row
+                for row, env in zip(rows, envs):
+                    obs, reward, terminated, truncated, info = env.step(actions[row])
+                    rewards[row] = reward
+                    dones[row] = terminated or truncated
+                    wait_times[row] = info["total_wait_time"]
+                    utilizations[row] = info["elevator_utilization"]
+                    if elapsed_times is not None:
+                        elapsed_times[row] = info["elapsed_time"]
+                    extra = {key: info[key] for key in ("metrics", "profile") if key in info}
+                    if extra:
+                        extras[row] = extra
+                    if dones[row]:
+                        write_obs(terminal_buffers, row, obs)
+                        obs, _ = env.reset()
+                    write_obs(obs_buffers, row, obs)
+                remote.send(extras or None)
+            elif cmd == "reset":
+                for row, env, seed in zip(rows, envs, data):
+                    obs, _ = env.reset(seed=seed)
+                    write_obs(obs_buffers, row, obs)
+                remote.send(None)
+            elif cmd == "get_attr":
+                remote.send([getattr(envs[i], data[0]) for i in data[1]])
+            elif cmd == "set_attr":
+                for i in data[2]:
+                    setattr(envs[i], data[0], data[1])
+                remote.send([None] * len(data[2]))
+            elif cmd == "env_method":
+                name, args, kwargs, indices = data
+                remote.send([getattr(envs[i], name)(*args, **kwargs) for i in indices])
+            elif cmd == "close":
+                for env in envs:
+                    env.close()
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except (EOFError, KeyboardInterrupt):
+            break
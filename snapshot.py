@@ -0,0 +1,63 @@
+import numpy as np
+
+# Snapshots are flat int64 arrays: each component appends its words in a fixed order and
+# restores by reading them back in the same order through a SnapshotReader.
+# A building snapshot is the same for both simulation cores:
+#   header      [SNAPSHOT_VERSION, num_floors, num_elevators, time, delivered, trips recorded]
+#   cars        [floor, destination (-1: none), direction, door_open, door_timer, riders] per car
+#   riders      [ORIGIN, DESTINATION, SPAWN, BOARD] per rider, car by car in boarding order
+#   calls       waiting passengers per hall call, floor by floor (up then down)
+#   waiting     [ORIGIN, DESTINATION, SPAWN] per waiting passenger, in queue order
+#   waits       WaitTracker.snapshot()
+#   traffic     snapshot() of the arrival source, to the end
+SNAPSHOT_VERSION = 1
+HEADER_WORDS = 6
+CAR_WORDS = 6
+RNG_WORDS = 6
+_MASK64 = (1 << 64) - 1
+
+def pack_rng(bit_generator):
+    """State of a PCG64 bit generator as RNG_WORDS int64 words"""
+    state = bit_generator.state
+    if state["bit_generator"] != "PCG64":
+        raise ValueError(f"Cannot snapshot a {state['bit_generator']} generator, only PCG64")
+    s, inc = state["state"]["state"], state["state"]["inc"]
+    words = [s >> 64, s & _MASK64, inc >> 64, inc & _MASK64, state["has_uint32"], state["uinteger"]]
+    return np.array(words, dtype=np.uint64).view(np.int64)
+
+def unpack_rng(bit_generator, words):
+    """Restore a PCG64 bit generator from the words of pack_rng"""
+    s_hi, s_lo, inc_hi, inc_lo, has_uint32, uinteger = np.asarray(words, dtype=np.int64).view(np.uint64).tolist()
+    bit_generator.state = {
+        "bit_generator": "PCG64",
+        "state": {"state": (s_hi << 64) | s_lo, "inc": (inc_hi << 64) | inc_lo},
+        "has_uint32": has_uint32,
+        "uinteger": uinteger,
+    }
+
+class SnapshotReader:
+    """Sequential reader over the words of a snapshot"""
+    def __init__(self, snapshot):
+        self.words = np.frombuffer(snapshot, dtype=np.int64) if isinstance(snapshot, (bytes, bytearray)) \
+            else np.asarray(snapshot, dtype=np.int64)
+        self.pos = 0
+
+    def take(self, count):
+        words = self.words[self.pos:self.pos+count]
+        if len(words) < count:
+            raise ValueError("Snapshot is truncated")
+        self.pos += count
+        return words
+
+    def rest(self):
+        return self.take(len(self.words) - self.pos)
+
+def read_building_header(reader, num_floors, num_elevators):
+    """Check a building snapshot's header; returns (time, delivered, trips recorded)"""
+    version, floors, elevators, time, delivered, trips = reader.take(HEADER_WORDS).tolist()
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+    if (floors, elevators) != (num_floors, num_elevators):
+        raise ValueError(f"Snapshot of a building with {floors} floors and {elevators} elevators "
+                         f"cannot be restored into one with {num_floors} floors and {num_elevators} elevators")
+    return time, delivered, trips
@@ -0,0 +1,62 @@
+import time
+
+class StepProfiler:
+    """Per-phase timings and event counters for the simulation hot path.
+
+    Buildings and ElevatorEnv hold a `profiler` attribute that is None unless
+    profiling is enabled, so the disabled cost is one None check per phase.
+    When enabled, `start()` stamps the clock and each `mark(phase)` charges the
+    time since the previous stamp to `phase`, so consecutive marks split a step
+    into phases without nesting timers.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.phase_totals = {}  # seconds per phase
+        self.phase_calls = {}
+        self.counters = {}  # cumulative event counts
+        self.gauges = {}  # latest value of sampled quantities
+        self.peaks = {}  # largest value each gauge has reached
+        self._last = time.perf_counter()
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phase_totals[phase] = self.phase_totals.get(phase, 0.0) + now - self._last
+        self.phase_calls[phase] = self.phase_calls.get(phase, 0) + 1
+        self._last = now
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+        if name not in self.peaks or value > self.peaks[name]:
+            self.peaks[name] = value
+
+    def snapshot(self):
+        """Plain-dict copy of everything recorded so far, mean phase times in microseconds"""
+        return {
+            "phase_mean_us": {phase: 1e6 * total / self.phase_calls[phase]
+                              for phase, total in self.phase_totals.items()},
+            "phase_total_s": dict(self.phase_totals),
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "peaks": dict(self.peaks),
+        }
+
+    def summary(self):
+        """Human-readable table of phase times and counters"""
+        total = sum(self.phase_totals.values()) or 1.0
+        lines = [f"{'phase':<14}{'calls':>10}{'mean us':>10}{'share':>8}"]
+        for phase, seconds in sorted(self.phase_totals.items(), key=lambda item: -item[1]):
+            calls = self.phase_calls[phase]
+            lines.append(f"{phase:<14}{calls:>10}{1e6 * seconds / calls:>10.1f}{seconds / total:>8.1%}")
+        counters = ", ".join(f"{name} {value}" for name, value in self.counters.items())
+        gauges = ", ".join(f"{name} {value} (peak {self.peaks[name]})" for name, value in self.gauges.items())
+        lines.append(f"counters: {counters}")
+        lines.append(f"gauges: {gauges}")
+        return "\n".join(lines)
@@ -0,0 +1,154 @@
+import multiprocessing as mp
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+from elevator_env import ElevatorEnv
+from shm_worker import shared_array, views, obs_spaces, run_worker
+
+class SharedMemoryVecEnv(VecEnv):
+    """Stable-Baselines3 VecEnv running ElevatorEnvs in worker processes.
+
+    Each of `num_workers` processes steps `envs_per_worker` environments in a
+    loop. Actions, observations, rewards, dones and the info scalars live in
+    shared-memory buffers with one row per environment, so a step costs one
+    short pipe message per worker instead of pickling observation dicts.
+    `info["metrics"]` and `info["profile"]`, when the envs produce them, are
+    the exception: they are pickled back with the step reply.
+    """
+    def __init__(self, num_workers, envs_per_worker=1, env_kwargs=None, start_method=None):
+        env_kwargs = env_kwargs or {}
+        num_envs = num_workers * envs_per_worker
+        spaces_env = ElevatorEnv(**env_kwargs)
+        self.render_mode = None
+        super().__init__(num_envs, spaces_env.observation_space, spaces_env.action_space)
+        self.num_workers = num_workers
+        self.envs_per_worker = envs_per_worker
+
+        if start_method is None:
+            # Fork is not safe once torch has started threads
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        specs = {
+            "actions": ((num_envs,) + spaces_env.action_space.shape, np.int64),
+            "rewards": ((num_envs,), np.float32),
+            "dones": ((num_envs,), np.bool_),
+            "total_wait_time": ((num_envs,), np.int64),
+            "elevator_utilization": ((num_envs,), np.float64),
+        }
+        if spaces_env.event_driven:
+            specs["elapsed_time"] = ((num_envs,), np.int64)
+        self._flat = not hasattr(self.observation_space, "spaces")
+        for key, space in obs_spaces(self.observation_space).items():
+            specs["obs/" + key] = ((num_envs,) + space.shape, space.dtype)
+            specs["terminal/" + key] = ((num_envs,) + space.shape, space.dtype)
+        blocks = {key: shared_array(ctx, shape, dtype) for key, (shape, dtype) in specs.items()}
+        buffers = views(blocks, specs)
+        self._actions = buffers["actions"]
+        self._rewards = buffers["rewards"]
+        self._dones = buffers["dones"]
+        self._wait_times = buffers["total_wait_time"]
+        self._utilizations = buffers["elevator_utilization"]
+        self._elapsed_times = buffers.get("elapsed_time")
+        self._obs_buffers = {key[4:]: buffer for key, buffer in buffers.items() if key.startswith("obs/")}
+        self._terminal_buffers = {key[9:]: buffer for key, buffer in buffers.items() if key.startswith("terminal/")}
+
+        self.remotes, self.processes = [], []
+        for worker in range(num_workers):
+            remote, work_remote = ctx.Pipe()
+            args = (work_remote, remote, env_kwargs, worker * envs_per_worker, envs_per_worker, blocks, specs)
+            # daemon=True: workers must not outlive a crashed trainer
+            process = ctx.Process(target=run_worker, args=args, daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self.closed = False
+
+    def _broadcast(self, cmd, per_worker_data=None):
+        for worker, remote in enumerate(self.remotes):
+            remote.send((cmd, None if per_worker_data is None else per_worker_data[worker]))
+        return [remote.recv() for remote in self.remotes]
+
+    def reset(self):
+        k = self.envs_per_worker
+        self._broadcast("reset", [self._seeds[w*k:(w+1)*k] for w in range(self.num_workers)])
+        self._reset_seeds()
+        return self._get_observations()
+
+    def step_async(self, actions):
+        self._actions[:] = np.asarray(actions).reshape(self._actions.shape)
+        for remote in self.remotes:
+            remote.send(("step", None))
+
+    def step_wait(self):
+        extras = [remote.recv() for remote in self.remotes]
+        dones = self._dones.copy()
+        infos = [
+            {"total_wait_time": int(self._wait_times[i]), "elevator_utilization": float(self._utilizations[i])}
+            for i in range(self.num_envs)
+        ]
+        if self._elapsed_times is not None:
+            for info, elapsed in zip(infos, self._elapsed_times.tolist()):
+                info["elapsed_time"] = elapsed
+        for worker_extras in extras:
+            for i, extra in (worker_extras or {}).items():
+                infos[i].update(extra)
+        for i in np.flatnonzero(dones).tolist():
+            if self._flat:
+                infos[i]["terminal_observation"] = self._terminal_buffers["flat"][i].copy()
+            else:
+                infos[i]["terminal_observation"] = {key: buffer[i].copy() for key, buffer in self._terminal_buffers.items()}
+            infos[i]["TimeLimit.truncated"] = False
+        return self._get_observations(), self._rewards.copy(), dones, infos
+
+    def _get_observations(self):
+        if self._flat:
+            return self._obs_buffers["flat"].copy()
+        return {key: buffer.copy() for key, buffer in self._obs_buffers.items()}
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def _worker_indices(self, indices):
+        """Group env indices by worker: {worker: [local index, ...]}"""
+        indices = self._indices(indices)
+        groups = {}
+        for i in indices:
+            groups.setdefault(i // self.envs_per_worker, []).append(i % self.envs_per_worker)
+        return groups
+
+    def _call(self, cmd, data, indices):
+        groups = self._worker_indices(indices)
+        for worker, local in groups.items():
+            self.remotes[worker].send((cmd, data + (local,)))
+        results = {}
+        for worker, local in groups.items():
+            for i, value in zip(local, self.remotes[worker].recv()):
+                results[worker * self.envs_per_worker + i] = value
+        # Back in the order of `indices`, not grouped by worker
+        return [results[i] for i in self._indices(indices)]
+
+    def get_attr(self, attr_name, indices=None):
+        return self._call("get_attr", (attr_name,), indices)
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._call("set_attr", (attr_name, value), indices)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._call("env_method", (method_name, method_args, method_kwargs), indices)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * sum(len(local) for local in self._worker_indices(indices).values())
@@ -0,0 +1,689 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import numpy as np
+from building import Building, Passenger
+from dispatchers import DISPATCHERS, ETADispatcher
+from elevator_env import ElevatorEnv, dispatch_action_masks
+from inference_server import InferenceServer, InferenceClient
+from lookahead import LookaheadDispatcher
+from ledger import TripLedger, SPAWN, BOARD, ARRIVAL
+from metrics import QuantileSketch, StreamingMetrics
+from recordings import EpisodeRecorder, Recording, ReplayEnv
+from traffic import TrafficGenerator, EVENING_PEAK
+from traces import generate_trace, TraceReplay
+from wait_tracker import WAIT_CAP
+
+try:
+    import stable_baselines3
+except ImportError:
+    stable_baselines3 = None
+requires_sb3 = unittest.skipIf(stable_baselines3 is None, "stable-baselines3 is not installed")
+
+def copy_obs(obs):
+    return {k: v.copy() for k, v in obs.items()} if isinstance(obs, dict) else obs.copy()
+
+def same_obs(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(np.array_equal(a[k], b[k]) for k in a)
+    return np.array_equal(a, b)
+
+def random_actions(count, num_elevators, num_floors, seed=0):
+    rng = np.random.default_rng(seed)
+    return [(int(rng.integers(num_elevators)), int(rng.integers(num_floors))) for _ in range(count)]
+
+def run(env, actions):
+    """(observation, reward, total wait, deliveries) after each action, up to the end of the episode"""
+    steps = []
+    for action in actions:
+        obs, reward, done, _, info = env.step(action)
+        steps.append((copy_obs(obs), reward, info["total_wait_time"], len(env.building.ledger)))
+        if done:
+            break
+    return steps
+
+class TestCores(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # The cores sample arrivals differently, but replay the same trace
+        self.trace = os.path.join(self.tmp.name, "trace.bin")
+        generate_trace(self.trace, 8, 300, seed=3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cores_step_identically(self):
+        for kwargs in [{}, {"event_driven": True}, {"flat_obs": True}]:
+            envs = [ElevatorEnv(8, 3, episode_length=300, trace_path=self.trace, array_core=array_core, **kwargs)
+                    for array_core in (False, True)]
+            first, second = [env.reset(seed=1)[0] for env in envs]
+            self.assertTrue(same_obs(first, second))
+            actions = random_actions(300, 3, 8)
+            reference, steps = [run(env, actions) for env in envs]
+            self.assertEqual(len(reference), len(steps))
+            for expected, got in zip(reference, steps):
+                self.assertTrue(same_obs(expected[0], got[0]), kwargs)
+                self.assertEqual(expected[1:], got[1:], kwargs)
+            self.assertGreater(reference[-1][3], 0)
+
+    def test_joint_actions(self):
+        envs = [ElevatorEnv(8, 3, episode_length=300, trace_path=self.trace, array_core=array_core,
+                            joint_actions=True) for array_core in (False, True)]
+        for env in envs:
+            env.reset(seed=1)
+        actions = np.random.default_rng(2).integers(9, size=(300, 3))
+        reference, steps = [run(env, actions) for env in envs]
+        for expected, got in zip(reference, steps):
+            self.assertTrue(same_obs(expected[0], got[0]))
+            self.assertEqual(expected[1:], got[1:])
+        self.assertGreater(reference[-1][3], 0)
+        # Out-of-range targets are invalid, like single dispatches
+        self.assertEqual(envs[0].step(np.array([0, 9, 0]))[1], -10)
+
+    def test_action_masks(self):
+        for joint_actions in (False, True):
+            envs = [ElevatorEnv(8, 3, episode_length=300, trace_path=self.trace, array_core=array_core,
+                                joint_actions=joint_actions) for array_core in (False, True)]
+            for env in envs:
+                env.reset(seed=1)
+            for action in random_actions(300, 3, 8):
+                valid = [env.valid_dispatches() for env in envs]
+                self.assertTrue(np.array_equal(*valid))
+                masks = envs[0].action_masks()
+                self.assertTrue(np.array_equal(masks, dispatch_action_masks(valid[0], joint_actions)))
+                self.assertTrue(np.array_equal(masks, envs[1].action_masks()))
+                self.assertEqual(masks.shape, (3 * 9,) if joint_actions else (3 + 8,))
+                # A full car takes no dispatch
+                self.assertFalse(valid[0][envs[0].building.loads >= 10].any())
+                if joint_actions:
+                    action = envs[0].dispatch_action(*action)
+                for env in envs:
+                    env.step(action)
+
+class TestTraffic(unittest.TestCase):
+    def test_seeded_and_valid(self):
+        for process in ("bernoulli", "poisson"):
+            first, second = [TrafficGenerator(12, seed=3, arrival_process=process) for _ in range(2)]
+            for time_step in range(0, 1440, 7):
+                floors, destinations = first.sample(time_step)
+                other = second.sample(time_step)
+                self.assertTrue(np.array_equal(floors, other[0]) and np.array_equal(destinations, other[1]))
+                self.assertTrue(np.all(np.diff(floors) >= 0))
+                self.assertTrue(np.all(destinations != floors))
+                self.assertTrue(np.all((destinations >= 0) & (destinations < 12)))
+                if process == "bernoulli":
+                    self.assertEqual(len(np.unique(floors)), len(floors))  # at most one rider per floor
+                if TrafficGenerator.phase(time_step) == EVENING_PEAK:  # evening rush: the top floor goes to the lobby
+                    self.assertTrue(np.all(destinations[floors == 11] == 0))
+
+    def test_sample_lanes(self):
+        traffic = TrafficGenerator(12, seed=1, arrival_process="poisson", max_arrivals=4)
+        lanes, floors, destinations = traffic.sample_lanes(np.array([100, 500, 1100]))
+        self.assertTrue(np.all(np.diff(lanes) >= 0))
+        self.assertTrue(np.all(destinations != floors))
+        counts = np.zeros((3, 12), dtype=np.int64)
+        np.add.at(counts, (lanes, floors), 1)
+        self.assertLessEqual(counts.max(), 4)
+
+class TestTraces(unittest.TestCase):
+    def test_replay_matches_generator(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.bin")
+            generate_trace(path, 10, 200, seed=7, arrival_process="poisson")
+            trace = TraceReplay(path)
+            traffic = TrafficGenerator(10, seed=7, arrival_process="poisson")
+            expected = [traffic.sample(t) for t in range(200)]
+            for t in range(400):  # the trace wraps around
+                floors, destinations = trace.sample(t)
+                self.assertTrue(np.array_equal(floors, expected[t % 200][0]))
+                self.assertTrue(np.array_equal(destinations, expected[t % 200][1]))
+            steps = np.array([5, 199, 0, 250])
+            lanes, floors, destinations = trace.sample_lanes(steps)
+            for lane, step in enumerate(steps):
+                self.assertTrue(np.array_equal(floors[lanes == lane], expected[step % 200][0]))
+                self.assertTrue(np.array_equal(destinations[lanes == lane], expected[step % 200][1]))
+
+    def test_env_replay_ignores_seed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.bin")
+            generate_trace(path, 8, 100, seed=1)
+            actions = random_actions(100, 3, 8)
+            runs = []
+            for seed in (1, 2):
+                env = ElevatorEnv(8, 3, episode_length=100, trace_path=path)
+                env.reset(seed=seed)
+                runs.append([step[1:] for step in run(env, actions)])
+                env.close()
+            self.assertEqual(runs[0], runs[1])
+
+class TestHallCallQueues(unittest.TestCase):
+    def setUp(self):
+        self.building = Building(8, 2)
+        # Floor 3: the longest-waiting rider goes down, the next two go up
+        for destination, spawn_time in [(0, 0), (6, 1), (5, 2)]:
+            self.building.add_waiting(Passenger(3, destination, spawn_time))
+        self.building.time = 4
+
+    def stop_at(self, elevator, direction, destination):
+        elevator.current_floor, elevator.direction, elevator.destination = 3, direction, destination
+        elevator.door_open = True
+        elevator._try_pickup_passengers()
+        return [p.spawn_time for p in elevator.passengers]
+
+    def test_cars_board_riders_going_their_way_in_arrival_order(self):
+        car = self.building.elevators[0]
+        car.capacity = 1
+        self.assertEqual(self.stop_at(car, 1, 7), [1])
+        self.assertEqual(self.building.call_counts[3].tolist(), [1, 1])
+        self.assertEqual(self.building.get_max_wait_times()[3], 4)
+        car.capacity = 10
+        self.assertEqual(self.stop_at(car, 1, 7), [1, 2])
+        self.assertEqual([p.wait_time for p in car.passengers], [3, 2])
+        self.assertEqual(self.building.waiting_counts[3], 1)
+
+    def test_idle_car_serves_the_longest_waiting_call(self):
+        self.assertEqual(self.stop_at(self.building.elevators[1], 0, None), [0])
+        self.assertEqual(self.building.get_hall_calls()[3].tolist(), [True, False])
+
+class TestFlatObservation(unittest.TestCase):
+    def test_flat_matches_scaled_dict(self):
+        for joint_actions in (False, True):
+            envs = [ElevatorEnv(8, 3, episode_length=100, flat_obs=flat_obs, joint_actions=joint_actions)
+                    for flat_obs in (False, True)]
+            observations = [env.reset(seed=2)[0] for env in envs]
+            flat_env = envs[1]
+            rng = np.random.default_rng(0)
+            for _ in range(100):
+                obs, flat = observations
+                self.assertEqual(flat.dtype, np.float32)
+                self.assertTrue(flat_env.observation_space.contains(flat))
+                for key, space in flat_env.dict_observation_space.spaces.items():
+                    expected = np.minimum(obs[key].ravel() / max(float(space.high.max()), 1), 1)
+                    np.testing.assert_allclose(flat[flat_env.obs_layout[key]], expected, rtol=1e-6)
+                action = rng.integers(9, size=3) if joint_actions else rng.integers((3, 8))
+                observations = [env.step(action)[0] for env in envs]
+
+class TestLedger(unittest.TestCase):
+    def test_ledger_grows(self):
+        ledger = TripLedger(capacity=2)
+        for i in range(5):
+            ledger.record(i, i + 1, 10 * i, 10 * i + 3, 10 * i + 5)
+        ledger.record_many(np.array([[7, 2, 50, 54], [1, 4, 51, 54]]), 60)
+        self.assertEqual(len(ledger), 7)
+        self.assertEqual(ledger.wait_times().tolist(), [3] * 5 + [4, 3])
+        self.assertEqual(ledger.ride_times().tolist(), [2] * 5 + [6, 6])
+        self.assertEqual(ledger.trip_times().tolist(), [5] * 5 + [10, 9])
+
+    def test_incremental_reward(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.bin")
+            generate_trace(path, 8, 300, seed=5)
+            env = ElevatorEnv(8, 3, episode_length=300, trace_path=path)
+            env.reset(seed=0)
+            delivered = 0
+            for action in random_actions(300, 3, 8):
+                _, reward, _, _, info = env.step(action)
+                building = env.building
+                # The reward from scratch: deliveries from the ledger, waits of everyone still waiting
+                waits = np.array([building.time - p.spawn_time for p in building.get_all_waiting()])
+                moving = building.directions != 0
+                expected = (5.0 * (len(building.ledger) - delivered) - 0.1 * np.minimum(waits, WAIT_CAP).sum()
+                            - 0.05 * (moving.sum() + (moving & (building.loads > 0)).sum()))
+                self.assertAlmostEqual(reward, np.clip(expected / 10, -1, 1))
+                self.assertEqual(info["total_wait_time"], waits.sum())
+                delivered = len(building.ledger)
+            trips = building.ledger.trips
+            self.assertGreater(len(trips), 0)
+            self.assertTrue(np.all(trips[:, SPAWN] <= trips[:, BOARD]) and np.all(trips[:, BOARD] < trips[:, ARRIVAL]))
+
+class TestEventDriven(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.trace = os.path.join(self.tmp.name, "trace.bin")
+        generate_trace(self.trace, 8, 400, seed=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_elapsed_time(self):
+        env = ElevatorEnv(8, 3, episode_length=400, trace_path=self.trace, event_driven=True, max_skip=15)
+        env.reset(seed=0)
+        elapsed, done = [], False
+        for action in random_actions(400, 3, 8):
+            _, _, done, _, info = env.step(action)
+            elapsed.append(info["elapsed_time"])
+            if done:
+                break
+        self.assertTrue(done)
+        self.assertEqual(sum(elapsed), env.current_step)
+        self.assertTrue(all(1 <= ticks <= 15 for ticks in elapsed))
+        self.assertLess(len(elapsed), 400)  # some steps were skipped ahead
+
+    def test_single_tick_matches_plain_steps(self):
+        actions = random_actions(200, 3, 8)
+        runs = []
+        for kwargs in [{}, {"event_driven": True, "max_skip": 1}]:
+            env = ElevatorEnv(8, 3, episode_length=200, trace_path=self.trace, **kwargs)
+            env.reset(seed=0)
+            runs.append(run(env, actions))
+        for expected, got in zip(*runs):
+            self.assertTrue(same_obs(expected[0], got[0]))
+            self.assertEqual(expected[1:], got[1:])
+
+@requires_sb3
+class TestBatchedVecEnv(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.trace = os.path.join(self.tmp.name, "trace.bin")
+        generate_trace(self.trace, 8, 300, seed=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check_lanes(self, actions, **kwargs):
+        """ElevatorVecEnv lanes step like separate array-core ElevatorEnvs on the same trace, across auto-resets"""
+        from vec_env import ElevatorVecEnv
+        num_envs = actions.shape[1]
+        venv = ElevatorVecEnv(num_envs, 8, 3, episode_length=200, trace_path=self.trace, **kwargs)
+        envs = [ElevatorEnv(8, 3, episode_length=200, trace_path=self.trace, array_core=True, **kwargs)
+                for _ in range(num_envs)]
+        obs = venv.reset()
+        for i, env in enumerate(envs):
+            self.assertTrue(same_obs({k: v[i] for k, v in obs.items()}, env.reset(seed=0)[0]))
+        for step_actions in actions:
+            obs, rewards, dones, infos = venv.step(step_actions)
+            for i, env in enumerate(envs):
+                lane_obs, reward, done, _, info = env.step(step_actions[i])
+                if done:
+                    self.assertTrue(same_obs(infos[i]["terminal_observation"], lane_obs))
+                    lane_obs, _ = env.reset(seed=0)
+                self.assertTrue(same_obs({k: v[i] for k, v in obs.items()}, lane_obs))
+                self.assertEqual(rewards[i], np.float32(reward))
+                self.assertEqual(dones[i], done)
+                self.assertEqual(infos[i]["total_wait_time"], info["total_wait_time"])
+
+    def test_lanes_match_single_envs(self):
+        rng = np.random.default_rng(0)
+        actions = np.stack([rng.integers(3, size=(600, 3)), rng.integers(8, size=(600, 3))], axis=-1)
+        self.check_lanes(actions)
+
+    def test_joint_actions_match_single_envs(self):
+        # A target per car, 8 (the number of floors) keeping its orders
+        actions = np.random.default_rng(1).integers(9, size=(400, 3, 3))
+        self.check_lanes(actions, joint_actions=True)
+
+    def test_action_masks_per_lane(self):
+        from vec_env import ElevatorVecEnv
+        venv = ElevatorVecEnv(3, 8, 3, episode_length=200, trace_path=self.trace)
+        envs = [ElevatorEnv(8, 3, episode_length=200, trace_path=self.trace, array_core=True) for _ in range(3)]
+        venv.reset()
+        for env in envs:
+            env.reset(seed=0)
+        rng = np.random.default_rng(3)
+        for _ in range(100):
+            masks = venv.action_masks()
+            for i, env in enumerate(envs):
+                self.assertTrue(np.array_equal(masks[i], env.action_masks()))
+            actions = np.stack([rng.integers(3, size=3), rng.integers(8, size=3)], axis=1)
+            venv.step(actions)
+            for env, action in zip(envs, actions):
+                env.step(action)
+
+    def test_lane_attributes_and_methods(self):
+        from vec_env import ElevatorVecEnv
+        venv = ElevatorVecEnv(4, 8, 3, seed=0)
+        venv.reset()
+        for _ in range(5):
+            venv.step(np.zeros((4, 2), dtype=np.int64))
+        venv.set_attr("current_step", 50, [1, 3])
+        self.assertEqual(venv.get_attr("current_step", [3, 0, 1]), [50, 5, 50])
+        (obs, info), = venv.env_method("reset", indices=[3])
+        self.assertEqual(venv.get_attr("current_step"), [5, 50, 5, 0])
+        self.assertEqual(obs["time_step"][0], 0)
+        with self.assertRaises(ValueError):
+            venv.set_attr("episode_length", 10, [0])
+        with self.assertRaises(AttributeError):
+            venv.set_attr("no_such_attribute", 1)
+        with self.assertRaises(NotImplementedError):
+            venv.env_method("render")
+
+@requires_sb3
+class TestSharedMemoryVecEnv(unittest.TestCase):
+    def test_matches_dummy_vec_env(self):
+        from stable_baselines3.common.vec_env import DummyVecEnv
+        from subproc_vec_env import SharedMemoryVecEnv
+        kwargs = dict(num_floors=8, num_elevators=3, episode_length=30, event_driven=True, metrics=True)
+        venv = SharedMemoryVecEnv(2, 2, kwargs)
+        reference = DummyVecEnv([lambda: ElevatorEnv(**kwargs) for _ in range(4)])
+        try:
+            venv.seed(3)
+            reference.seed(3)
+            self.assertTrue(same_obs(venv.reset(), reference.reset()))
+            rng = np.random.default_rng(0)
+            for _ in range(60):  # across auto-resets
+                actions = np.stack([rng.integers(3, size=4), rng.integers(8, size=4)], axis=1)
+                obs, rewards, dones, infos = venv.step(actions)
+                expected = reference.step(actions)
+                self.assertTrue(same_obs(obs, expected[0]))
+                self.assertTrue(np.array_equal(rewards, expected[1]) and np.array_equal(dones, expected[2]))
+                for info, other in zip(infos, expected[3]):
+                    self.assertEqual((info["total_wait_time"], info["elapsed_time"]), (other["total_wait_time"], other["elapsed_time"]))
+                    np.testing.assert_equal(info["metrics"], other["metrics"])
+
+            # Results come back in the order of the requested indices, not grouped by worker
+            for i in range(4):
+                venv.set_attr("max_skip", 10 + i, i)
+            self.assertEqual(venv.get_attr("max_skip", [3, 0, 2, 1]), [13, 10, 12, 11])
+            self.assertEqual(venv.env_method("dispatch_action", 2, 5, indices=[2, 1])[0].tolist(), [2, 5])
+        finally:
+            venv.close()
+
+@requires_sb3
+class TestDispatchers(unittest.TestCase):
+    def test_vectorized_predict_matches_single_envs(self):
+        from stable_baselines3.common.vec_env import DummyVecEnv
+        from vec_env import ElevatorVecEnv
+        with tempfile.TemporaryDirectory() as tmp:
+            trace = os.path.join(tmp, "trace.bin")
+            generate_trace(trace, 8, 150, seed=6)
+            kwargs = dict(episode_length=150, trace_path=trace)
+            for name, dispatcher_class in DISPATCHERS.items():
+                # Lanes replaying one trace see what a single env sees, so they dispatch alike
+                single = ElevatorEnv(8, 3, array_core=True, **kwargs)
+                vec_envs = [DummyVecEnv([lambda: ElevatorEnv(8, 3, array_core=True, **kwargs) for _ in range(2)]),
+                            ElevatorVecEnv(2, 8, 3, **kwargs)]
+                dispatchers = [dispatcher_class(env) for env in [single] + vec_envs]
+                obs = [single.reset(seed=0)[0]] + [venv.reset() for venv in vec_envs]
+                for _ in range(150):
+                    actions = [dispatcher.predict(o)[0] for dispatcher, o in zip(dispatchers, obs)]
+                    self.assertEqual(np.shape(actions[0]), (2,), name)
+                    for batch in actions[1:]:
+                        self.assertTrue(np.array_equal(batch, [actions[0]] * 2), name)
+                    obs = [single.step(actions[0])[0]] + [venv.step(a)[0] for venv, a in zip(vec_envs, actions[1:])]
+                self.assertGreater(len(single.building.ledger), 0, name)
+
+class TestLookahead(unittest.TestCase):
+    def test_base_action_when_out_of_budget(self):
+        env = ElevatorEnv(8, 3, episode_length=100)
+        obs, _ = env.reset(seed=3)
+        planner = LookaheadDispatcher(env, budget=0.0, horizon=5)
+        base = ETADispatcher(env)
+        for _ in range(100):
+            action = planner.predict(obs)[0]
+            self.assertEqual(planner.last_scores, {})
+            self.assertTrue(np.array_equal(action, base.predict(obs)[0]))
+            obs = env.step(action)[0]
+        planner.close()
+
+    def test_scores_every_candidate(self):
+        env = ElevatorEnv(8, 3, episode_length=100)
+        obs, _ = env.reset(seed=3)
+        planner = LookaheadDispatcher(env, budget=60.0, horizon=5, num_candidates=3, seed=0)
+        for _ in range(30):
+            obs = env.step(planner.predict(obs)[0])[0]
+            candidates = planner._proposers[0].candidates(0, env.dispatch_state(), 3)
+            if len(candidates) > 1:
+                break
+        planner.predict(obs)
+        self.assertEqual(set(planner.last_scores), set(candidates))
+        planner.close()
+
+class FirstCarModel:
+    """Stand-in for an SB3 model that always sends car 0 to the top floor"""
+    def predict(self, obs, deterministic=True, **kwargs):
+        num_envs = len(obs["elevator_positions"])
+        return np.tile([0, 7], (num_envs, 1)), None
+
+@requires_sb3
+class TestEvaluation(unittest.TestCase):
+    def test_run_episodes(self):
+        from stable_baselines3.common.vec_env import DummyVecEnv
+        from evaluation import run_episodes, collect_metrics
+        venv = DummyVecEnv([lambda: ElevatorEnv(8, 3, episode_length=20, metrics=True) for _ in range(3)])
+        lane_metrics = []
+        results = run_episodes(FirstCarModel(), venv, 7, seed=0, lane_metrics=lane_metrics)
+        self.assertEqual(len(results), 7)
+        self.assertTrue(all(result["length"] == 20 for result in results))
+        self.assertEqual(results[0].keys(), {"reward", "length", "total_wait_time", "elevator_utilization"})
+        # Lanes play 2, 2 and 3 episodes; the steps past a lane's target are not in its metrics
+        self.assertEqual(len(lane_metrics), 3)
+        self.assertEqual(collect_metrics(lane_metrics).steps, 7 * 20)
+
+    def test_env_lanes_match_dummy_vec_env(self):
+        from stable_baselines3.common.vec_env import DummyVecEnv
+        from evaluation import EnvLanes, run_episodes
+        for kwargs in [{}, {"event_driven": True, "flat_obs": True}]:
+            env_fns = [lambda: ElevatorEnv(8, 3, episode_length=50, **kwargs) for _ in range(3)]
+            results = []
+            for venv in (DummyVecEnv(env_fns), EnvLanes(env_fns)):
+                results.append(run_episodes(DISPATCHERS["eta"](venv), venv, 6, seed=4))
+            self.assertEqual(*results)
+
+    def test_dispatcher_evaluation_without_torch(self):
+        import subprocess
+        import sys
+        code = ("import sys; from evaluation import make_eval_env, run_episodes; from dispatchers import ETADispatcher; "
+                "venv = make_eval_env(8, 3, 2); run_episodes(ETADispatcher(venv), venv, 2); "
+                "print('torch' in sys.modules or 'stable_baselines3' in sys.modules)")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        self.assertEqual(output.strip(), "False")
+
+class BusiestFloorModel:
+    """Stand-in policy sending car 0 to the floor with the most people waiting"""
+    def predict(self, obs, deterministic=True):
+        counts = obs["waiting_counts"]
+        if counts.ndim == 1:
+            return np.array([0, counts.argmax()]), None
+        return np.stack([np.zeros(len(counts), dtype=np.int64), counts.argmax(axis=1)], axis=1), None
+
+class FailingModel:
+    def predict(self, obs, deterministic=True):
+        raise ValueError("no policy")
+
+class TestInferenceServer(unittest.TestCase):
+    def serve(self, model, clients):
+        """Run `clients(server, connect)` against a server of `model` on a Unix socket"""
+        env = ElevatorEnv(8, 3)
+        async def main(path):
+            server = await InferenceServer(model, env.observation_space, env.action_space,
+                                           max_batch=4, max_delay=0.05).start(path)
+            async def connect():
+                return await InferenceClient(env.observation_space, env.action_space).connect(path)
+            try:
+                return await clients(server, connect)
+            finally:
+                await server.close()
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(main(os.path.join(tmp, "policy.sock")))
+
+    def test_round_trip(self):
+        model = BusiestFloorModel()
+        async def clients(server, connect):
+            async def controller(seed):
+                client = await connect()
+                env = ElevatorEnv(8, 3)
+                obs, _ = env.reset(seed=seed)
+                for _ in range(20):
+                    action, response = await client.predict(obs)
+                    self.assertTrue(np.array_equal(action, model.predict(obs)[0]))
+                    obs = env.step(action)[0]
+                await client.close()
+                return response
+            responses = await asyncio.gather(*(controller(seed) for seed in range(4)))
+            return responses, server.stats()
+        responses, stats = self.serve(model, clients)
+        self.assertEqual(stats["requests"], 80)
+        self.assertEqual(stats["failed_batches"], 0)
+        self.assertGreater(stats["batch_size_p99"], 1)  # concurrent requests share batches
+        self.assertTrue(all(1 <= r["batch_size"] <= 4 for r in responses))
+
+    def test_failed_inference(self):
+        async def clients(server, connect):
+            client = await connect()
+            with self.assertRaises(RuntimeError):
+                await client.predict(ElevatorEnv(8, 3).reset(seed=0)[0])
+            await client.close()
+            return server.failed_batches
+        self.assertEqual(self.serve(FailingModel(), clients), 1)
+
+class TestMetrics(unittest.TestCase):
+    def test_quantiles_within_relative_accuracy(self):
+        rng = np.random.default_rng(0)
+        values = np.concatenate((np.zeros(50), np.round(rng.lognormal(3, 1.5, 5000))))
+        for accuracy in (0.01, 0.05):
+            sketch = QuantileSketch(accuracy)
+            sketch.add(values)
+            qs = np.linspace(0, 1, 101)
+            # The sketch estimates the value of rank q * (count - 1), rounded down
+            exact = np.sort(values)[np.floor(qs * (len(values) - 1)).astype(int)]
+            estimates = sketch.quantiles(qs)
+            self.assertTrue(np.all(np.abs(estimates - exact) <= accuracy * exact + 1e-9))
+
+    def test_merge(self):
+        rng = np.random.default_rng(1)
+        first, second = rng.integers(0, 500, 1000), rng.integers(0, 5000, 300)
+        merged, whole = QuantileSketch(), QuantileSketch()
+        merged.add(first)
+        other = QuantileSketch()
+        other.add(second)
+        merged.merge(other)
+        whole.add(np.concatenate((first, second)))
+        self.assertEqual(merged.count, whole.count)
+        self.assertEqual(merged.percentiles(), whole.percentiles())
+        with self.assertRaises(ValueError):
+            merged.merge(QuantileSketch(0.05))
+
+        lanes = [StreamingMetrics(), StreamingMetrics()]
+        for lane, waits in zip(lanes, ([3, 4], [5])):
+            lane.record_open_waits(waits)
+        lanes[0].merge(lanes[1])
+        self.assertEqual(lanes[0].open_waits, 3)
+        self.assertEqual(lanes[0].wait_times.count, 3)
+
+    def test_open_waits_at_episode_end(self):
+        for array_core in (False, True):
+            env = ElevatorEnv(10, 3, episode_length=100, metrics=True, array_core=array_core)
+            env.reset(seed=2)
+            done = False
+            for action in random_actions(100, 3, 10):
+                _, _, done, _, info = env.step(action)
+                if done:
+                    break
+            self.assertTrue(done)
+            open_waits = env.building.get_open_waits()
+            self.assertGreater(len(open_waits), 0)
+            self.assertEqual(info["metrics"]["open_waits"], len(open_waits))
+            self.assertEqual(env.metrics.wait_times.count, env.metrics.total_delivered + len(open_waits))
+            # Everyone still waiting or riding
+            riders = int(env.dispatch_state().loads.sum())
+            self.assertEqual(len(open_waits), int(env.building.get_waiting_counts().sum()) + riders)
+
+class TestRecordings(unittest.TestCase):
+    def test_replay_rewards(self):
+        for array_core in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "episodes.rec")
+                env = ElevatorEnv(10, 3, episode_length=200, array_core=array_core)
+                recorder = EpisodeRecorder(env, path, chunk_size=64, seed=7)
+                policy = ETADispatcher(env)
+                rewards = []
+                for _ in range(2):
+                    obs, _ = recorder.reset()
+                    episode, done = [], False
+                    while not done:
+                        obs, reward, done, _, _ = recorder.step(policy.predict(obs)[0])
+                        episode.append(reward)
+                    rewards.append(episode)
+                recorder.close()
+
+                replay = ReplayEnv(Recording(path))
+                self.assertEqual(replay.array_core, array_core)
+                for episode in rewards:
+                    obs, _ = replay.reset()
+                    replayed, done = [], False
+                    while not done:
+                        obs, reward, done, _, _ = replay.step(replay.predict(obs)[0])
+                        replayed.append(reward)
+                        # What the GUI draws, read the same way from either core
+                        building = replay.building
+                        self.assertTrue(np.array_equal(building.get_call_counts().sum(axis=1),
+                                                       building.get_waiting_counts()))
+                        self.assertTrue(np.array_equal(building.get_car_call_counts().sum(axis=1), building.loads))
+                        self.assertEqual(len(building.get_open_trips()), len(building.get_open_waits()))
+                    self.assertEqual(replayed, episode)
+
+class TestSnapshots(unittest.TestCase):
+    def test_round_trip(self):
+        for array_core in (False, True):
+            env = ElevatorEnv(10, 3, array_core=array_core)
+            env.reset(seed=5)
+            actions = random_actions(600, 3, 10)
+            run(env, actions[:300])
+            snapshot = env.snapshot()
+            reference = run(env, actions[300:])
+            env.restore(snapshot)
+            steps = run(env, actions[300:])
+            self.assertEqual(len(reference), len(steps))
+            for expected, got in zip(reference, steps):
+                self.assertTrue(same_obs(expected[0], got[0]))
+                self.assertEqual(expected[1:], got[1:])
+
+    def test_cross_core(self):
+        actions = random_actions(600, 3, 10, seed=1)
+        for source_core in (False, True):
+            source = ElevatorEnv(10, 3, array_core=source_core)
+            target = ElevatorEnv(10, 3, array_core=not source_core)
+            source.reset(seed=1)
+            target.reset(seed=2)
+            run(source, actions[:300])
+            snapshot = source.snapshot()
+            reference = run(source, actions[300:])
+            target.restore(snapshot)
+            steps = run(target, actions[300:])
+            # Deliveries are counted by the ledger, which is not part of a snapshot
+            self.assertEqual([s[1:3] for s in reference], [s[1:3] for s in steps])
+
+    def test_traffic_replays_arrivals(self):
+        traffic = TrafficGenerator(12, seed=5)
+        for time_step in range(100):
+            traffic.sample(time_step)
+        words = traffic.snapshot()
+        expected = [traffic.sample(t) for t in range(100, 300)]
+        traffic.restore(words)
+        for t, (floors, destinations) in zip(range(100, 300), expected):
+            got = traffic.sample(t)
+            self.assertTrue(np.array_equal(floors, got[0]) and np.array_equal(destinations, got[1]))
+
+@requires_sb3
+class TestNumpyPolicy(unittest.TestCase):
+    def test_matches_model(self):
+        from stable_baselines3 import PPO
+        from numpy_policy import NumpyPolicy, export_policy
+        for flat_obs in (False, True):
+            env = ElevatorEnv(8, 3, flat_obs=flat_obs)
+            model = PPO("MlpPolicy" if flat_obs else "MultiInputPolicy", env, seed=1, device="cpu",
+                        n_steps=64, batch_size=32)
+            # A fresh actor's logits are near-ties that float32 rounding can break either way
+            model.learn(128)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "policy.npz")
+                export_policy(model, path)
+                policy = NumpyPolicy.load(path)
+            obs, _ = env.reset(seed=3)
+            observations = []
+            for _ in range(100):
+                expected, _ = model.predict(obs, deterministic=True)
+                got, _ = policy.predict(obs, deterministic=True)
+                self.assertTrue(np.array_equal(expected, got))
+                observations.append(copy_obs(obs))
+                obs, *_ = env.step(expected)
+            if flat_obs:
+                batch = np.stack(observations)
+            else:
+                batch = {k: np.stack([o[k] for o in observations]) for k in observations[0]}
+            self.assertTrue(np.array_equal(model.predict(batch, deterministic=True)[0], policy.predict(batch)[0]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import argparse
+import numpy as np
+from traffic import TrafficGenerator
+
+# File layout: a fixed header followed by contiguous little-endian columns
+#   step_offsets int64[num_steps+1]   arrivals of step t are rows [step_offsets[t], step_offsets[t+1])
+#   times        int32[num_arrivals]
+#   origins      int16[num_arrivals]
+#   destinations int16[num_arrivals]
+MAGIC = b"ELVTRACE"
+VERSION = 1
+HEADER = np.dtype([
+    ("magic", "S8"), ("version", "<u4"), ("num_floors", "<u4"),
+    ("num_steps", "<u8"), ("num_arrivals", "<u8"), ("seed", "<i8"), ("reserved", "V24"),
+])
+
+def generate_trace(path, num_floors, num_steps=1440, seed=None, arrival_process="bernoulli", max_arrivals=10):
+    """Pre-generate the arrivals of `num_steps` steps (a full day by default) into a trace file"""
+    traffic = TrafficGenerator(num_floors, seed=seed, arrival_process=arrival_process, max_arrivals=max_arrivals)
+    origins, destinations = [], []
+    step_offsets = np.zeros(num_steps + 1, dtype="<i8")
+    for t in range(num_steps):
+        floors, dests = traffic.sample(t)
+        origins.append(floors)
+        destinations.append(dests)
+        step_offsets[t+1] = step_offsets[t] + len(floors)
+    num_arrivals = int(step_offsets[-1])
+    times = np.repeat(np.arange(num_steps, dtype="<i4"), np.diff(step_offsets))
+
+    header = np.zeros(1, dtype=HEADER)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["num_floors"] = num_floors
+    header["num_steps"] = num_steps
+    header["num_arrivals"] = num_arrivals
+    header["seed"] = -1 if seed is None else seed
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        f.write(step_offsets.tobytes())
+        f.write(times.tobytes())
+        f.write(np.concatenate(origins).astype("<i2").tobytes())
+        f.write(np.concatenate(destinations).astype("<i2").tobytes())
+    return num_arrivals
+
+class TraceReplay:
+    """Arrival source that replays a trace file instead of sampling.
+
+    The file is memory-mapped, so replaying costs two index lookups per step
+    and any number of workers can share one copy through the page cache. It
+    offers the same `sample`/`sample_lanes` interface as TrafficGenerator and
+    wraps around at the end of the trace.
+    """
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER, count=1)[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not an elevator trace file")
+        self.num_floors = int(header["num_floors"])
+        self.num_steps = int(header["num_steps"])
+        self.num_arrivals = int(header["num_arrivals"])
+
+        offset = HEADER.itemsize
+        self.step_offsets = np.memmap(path, dtype="<i8", mode="r", offset=offset, shape=(self.num_steps + 1,))
+        offset += self.step_offsets.nbytes
+        # np.memmap rejects empty maps, so a trace without arrivals gets empty columns
+        if self.num_arrivals == 0:
+            self.times = np.zeros(0, dtype="<i4")
+            self.origins = self.destinations = np.zeros(0, dtype="<i2")
+            return
+        self.times = np.memmap(path, dtype="<i4", mode="r", offset=offset, shape=(self.num_arrivals,))
+        offset += self.times.nbytes
+        self.origins = np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(self.num_arrivals,))
+        offset += self.origins.nbytes
+        self.destinations = np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(self.num_arrivals,))
+
+    def seed(self, seed=None):
+        """Replays are deterministic; kept for interface parity with TrafficGenerator"""
+
+    def snapshot(self):
+        """Replays keep no state of their own"""
+        return np.zeros(0, dtype=np.int64)
+
+    def restore(self, words):
+        pass
+
+    def sample(self, time_step=0):
+        """Arrivals recorded for `time_step`: (floors, destinations), sorted by floor"""
+        step = time_step % self.num_steps
+        start, end = self.step_offsets[step], self.step_offsets[step+1]
+        return self.origins[start:end], self.destinations[start:end]
+
+    def sample_lanes(self, time_steps):
+        """Arrivals of several buildings at their own time steps: (lanes, floors, destinations)"""
+        steps = np.asarray(time_steps) % self.num_steps
+        starts, ends = self.step_offsets[steps], self.step_offsets[steps+1]
+        counts = ends - starts
+        lanes = np.repeat(np.arange(len(steps)), counts)
+        rows = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return lanes, self.origins[rows], self.destinations[rows]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate a passenger arrival trace")
+    parser.add_argument("path", type=str, help="Output trace file")
+    parser.add_argument("--floors", type=int, default=10, help="Number of floors")
+    parser.add_argument("--steps", type=int, default=1440, help="Steps to generate (1440 = one day)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrival counts instead of Bernoulli")
+    args = parser.parse_args()
+
+    count = generate_trace(args.path, args.floors, args.steps, args.seed,
+                           "poisson" if args.poisson else "bernoulli")
+    print(f"Wrote {count} arrivals over {args.steps} steps to {args.path}")
@@ -0,0 +1,155 @@
+import numpy as np
+from snapshot import RNG_WORDS, pack_rng, unpack_rng, SnapshotReader
+
+# Traffic phases by minute of the day
+OFF_PEAK, MORNING_PEAK, EVENING_PEAK = 0, 1, 2
+# Hall call directions, the column order of per-direction queue state
+UP_CALL, DOWN_CALL = 0, 1
+
+class TrafficGenerator:
+    """Seeded passenger arrival generator.
+
+    Arrival counts per floor are drawn for all floors of a step in one call
+    from a NumPy Generator, either as at most one rider per floor per step
+    (`"bernoulli"`, the original model) or as Poisson counts truncated at
+    `max_arrivals` (`"poisson"`). Uniforms for future steps are drawn a block
+    at a time and turned into counts by inverse CDF lookup against the rates of
+    the requested step, so blocks stay valid whatever time steps are asked for.
+    """
+    def __init__(self, num_floors, seed=None, arrival_process="bernoulli", max_arrivals=10,
+                 base_rate=0.05, peak_rate=0.3, block_size=64):
+        if arrival_process not in ("bernoulli", "poisson"):
+            raise ValueError(f"Unknown arrival process {arrival_process!r}")
+        self.num_floors = num_floors
+        self.arrival_process = arrival_process
+        self.block_size = block_size
+
+        # Arrival rate per phase and floor (morning rush at the lobby, evening rush at the top)
+        self.rates = np.full((3, num_floors), base_rate)
+        self.rates[MORNING_PEAK, 0] = peak_rate
+        self.rates[EVENING_PEAK, num_floors-1] = peak_rate
+
+        # CDF of the arrival count per phase and floor: count = number of CDF values <= u
+        if arrival_process == "bernoulli":
+            self._cdfs = (1 - self.rates)[..., None]
+        else:
+            counts = np.arange(max_arrivals)
+            log_pmf = counts * np.log(self.rates[..., None]) - self.rates[..., None] - \
+                np.cumsum(np.log(np.maximum(counts, 1)))
+            self._cdfs = np.cumsum(np.exp(log_pmf), axis=-1)
+
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """Restart the random stream, dropping any pre-drawn numbers"""
+        self.rng = np.random.default_rng(seed)
+        self._uniforms = None
+        self._row = self.block_size
+        self._offsets = np.empty(0, dtype=np.int64)
+        self._offset = 0
+        # Generator state each pool was drawn from, so a snapshot can redraw instead of copy it
+        self._uniforms_from = None
+        self._offsets_from = None
+
+    def snapshot(self):
+        """Generator state and pool positions as int64 words (the pools themselves are redrawn)"""
+        empty = np.zeros(RNG_WORDS, dtype=np.int64)
+        return np.concatenate([
+            pack_rng(self.rng.bit_generator),
+            [self._row, self._uniforms_from is not None],
+            empty if self._uniforms_from is None else self._uniforms_from,
+            [self._offset, len(self._offsets), self._offsets_from is not None],
+            empty if self._offsets_from is None else self._offsets_from,
+        ]).astype(np.int64)
+
+    def restore(self, words):
+        reader = SnapshotReader(words)
+        now = reader.take(RNG_WORDS)
+        row, has_uniforms = reader.take(2).tolist()
+        uniforms_from = reader.take(RNG_WORDS)
+        offset, size, has_offsets = reader.take(3).tolist()
+        offsets_from = reader.take(RNG_WORDS)
+        bit_generator = self.rng.bit_generator
+        # Pools are only redrawn when they came from a different generator state
+        if not has_uniforms:
+            self._uniforms, self._uniforms_from = None, None
+        elif self._uniforms_from is None or not np.array_equal(self._uniforms_from, uniforms_from):
+            unpack_rng(bit_generator, uniforms_from)
+            self._uniforms = self.rng.random((self.block_size, self.num_floors))
+            self._uniforms_from = uniforms_from.copy()
+        if not has_offsets:
+            self._offsets, self._offsets_from = np.empty(0, dtype=np.int64), None
+        elif self._offsets_from is None or len(self._offsets) != size or \
+                not np.array_equal(self._offsets_from, offsets_from):
+            unpack_rng(bit_generator, offsets_from)
+            self._offsets = self.rng.integers(0, self.num_floors-1, size=size)
+            self._offsets_from = offsets_from.copy()
+        self._row = row
+        self._offset = offset
+        unpack_rng(bit_generator, now)
+
+    @staticmethod
+    def phase(time_step):
+        # Simulate peak hours (morning rush - going up, evening - going down)
+        minute = time_step % 1440
+        if 480 <= minute < 600:  # 8-10AM
+            return MORNING_PEAK
+        if 1020 <= minute < 1140:  # 5-7PM
+            return EVENING_PEAK
+        return OFF_PEAK
+
+    @staticmethod
+    def phases(time_steps):
+        minutes = np.asarray(time_steps) % 1440
+        return np.where((minutes >= 480) & (minutes < 600), MORNING_PEAK,
+                        np.where((minutes >= 1020) & (minutes < 1140), EVENING_PEAK, OFF_PEAK))
+
+    def sample(self, time_step=0):
+        """Arrivals for one step: (floors, destinations), sorted by floor"""
+        if self._row == self.block_size:
+            self._uniforms_from = pack_rng(self.rng.bit_generator)
+            self._uniforms = self.rng.random((self.block_size, self.num_floors))
+            self._row = 0
+        uniforms = self._uniforms[self._row]
+        self._row += 1
+
+        phase = self.phase(time_step)
+        if self.arrival_process == "bernoulli":
+            floors = np.flatnonzero(uniforms >= self._cdfs[phase, :, 0])
+        else:
+            counts = (uniforms[:, None] >= self._cdfs[phase]).sum(axis=1)
+            floors = np.repeat(np.arange(self.num_floors), counts)
+        return floors, self._destinations(floors, phase == EVENING_PEAK)
+
+    def sample_lanes(self, time_steps):
+        """Arrivals for one step of several buildings at their own time steps:
+        (lanes, floors, destinations), sorted by lane then floor"""
+        phases = self.phases(time_steps)
+        uniforms = self.rng.random((len(phases), self.num_floors))
+        if self.arrival_process == "bernoulli":
+            lanes, floors = np.nonzero(uniforms >= self._cdfs[phases, :, 0])
+        else:
+            counts = (uniforms[..., None] >= self._cdfs[phases]).sum(axis=2)
+            lanes = np.repeat(np.arange(len(phases)), counts.sum(axis=1))
+            floors = np.repeat(np.tile(np.arange(self.num_floors), len(phases)), counts.ravel())
+        return lanes, floors, self._destinations(floors, phases[lanes] == EVENING_PEAK)
+
+    def _destinations(self, floors, is_evening_peak):
+        """Uniform destination among the other floors (for the lobby that is any floor above it);
+        in the evening rush everyone on the top floor goes down to the lobby"""
+        destinations = self._next_offsets(len(floors))
+        destinations += destinations >= floors
+        if is_evening_peak is not False:  # sample() passes a plain bool, sample_lanes() a mask per arrival
+            destinations[is_evening_peak & (floors == self.num_floors-1)] = 0
+        return destinations
+
+    def _next_offsets(self, count):
+        """Uniform integers in [0, num_floors-1), served from a pre-drawn pool"""
+        if self._offset + count > len(self._offsets):
+            size = max(count, self.block_size * self.num_floors)
+            self._offsets_from = pack_rng(self.rng.bit_generator)
+            self._offsets = self.rng.integers(0, self.num_floors-1, size=size)
+            self._offset = 0
+        offsets = self._offsets[self._offset:self._offset+count].copy()
+        self._offset += count
+        return offsets
@@ -0,0 +1,189 @@
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+from batched_building import BatchedBuilding
+from elevator_env import ElevatorEnv, DispatchState, dispatch_action, dispatch_action_masks
+from traffic import TrafficGenerator
+from traces import TraceReplay
+
+class ElevatorVecEnv(VecEnv):
+    """Stable-Baselines3 VecEnv that steps N buildings in one batched call.
+
+    Observations, rewards and auto-reset behave like a DummyVecEnv over
+    ElevatorEnv instances, but the simulation runs on a single BatchedBuilding
+    and observations are written into preallocated (N, ...) buffers.
+    """
+    def __init__(self, num_envs, num_floors=10, num_elevators=3, episode_length=1440, seed=None,
+                 arrival_process="bernoulli", max_arrivals=10, trace_path=None, flat_obs=False, joint_actions=False):
+        # Reuse the single-building spaces so policies are interchangeable with ElevatorEnv
+        spaces_env = ElevatorEnv(num_floors, num_elevators, episode_length, flat_obs=flat_obs,
+                                 joint_actions=joint_actions)
+        self.render_mode = None
+        super().__init__(num_envs, spaces_env.observation_space, spaces_env.action_space)
+
+        self.num_floors = num_floors
+        self.num_elevators = num_elevators
+        self.episode_length = episode_length
+        if trace_path:
+            traffic = TraceReplay(trace_path)
+        else:
+            traffic = TrafficGenerator(num_floors, seed=seed, arrival_process=arrival_process,
+                                       max_arrivals=max_arrivals)
+        self.building = BatchedBuilding(num_envs, num_floors, num_elevators, traffic=traffic)
+        self.current_steps = np.zeros(num_envs, dtype=np.int64)
+        self._actions = None
+        self.joint_actions = joint_actions
+        self.flat_obs = flat_obs
+        if flat_obs:
+            # Per-key (N, ...) views into one (N, D) float32 block, laid out like ElevatorEnv's
+            self._flat = np.zeros((num_envs,) + self.observation_space.shape, dtype=np.float32)
+            self._flat_scale = spaces_env._flat_scale
+            self._obs_buffers = {
+                key: self._flat[:, spaces_env.obs_layout[key]].reshape((num_envs,) + space.shape)
+                for key, space in spaces_env.dict_observation_space.spaces.items()
+            }
+        else:
+            self._obs_buffers = {
+                key: np.zeros((num_envs,) + space.shape, dtype=space.dtype)
+                for key, space in self.observation_space.spaces.items()
+            }
+
+    def reset(self):
+        seed = self._seeds[0]
+        if seed is not None:
+            self.building.traffic.seed(seed)
+        self.building.reset_lanes(slice(None))
+        self.current_steps[:] = 0
+        self._reset_seeds()
+        return self._get_observations()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions).reshape((self.num_envs,) + self.action_space.shape)
+
+    def step_wait(self):
+        self.current_steps += 1
+
+        # Invalid actions are penalized and skip the simulation step, like ElevatorEnv.step
+        if self.joint_actions:
+            valid = ((self._actions >= 0) & (self._actions <= self.num_floors)).all(axis=1)
+            self.building.step(self.current_steps, active=valid)
+            rewards = self.building.take_joint_actions(self._actions).astype(np.float32)
+        else:
+            elevator_ids, floors = self._actions[:, 0], self._actions[:, 1]
+            valid = (elevator_ids >= 0) & (elevator_ids < self.num_elevators) & \
+                (floors >= 0) & (floors < self.num_floors)
+            self.building.step(self.current_steps, active=valid)
+            rewards = self.building.take_actions(self._actions).astype(np.float32)
+
+        obs = self._get_observations()
+        dones = self.current_steps >= self.episode_length
+        total_wait_times = self.building.get_total_wait_times()
+        utilizations = self.building.get_utilizations()
+        infos = [
+            {"total_wait_time": int(total_wait_times[i]), "elevator_utilization": float(utilizations[i])}
+            for i in range(self.num_envs)
+        ]
+
+        # Auto-reset finished lanes, keeping their last observation for bootstrapping
+        if dones.any():
+            for i in np.flatnonzero(dones).tolist():
+                if self.flat_obs:
+                    infos[i]["terminal_observation"] = obs[i]
+                else:
+                    infos[i]["terminal_observation"] = {key: value[i] for key, value in obs.items()}
+                infos[i]["TimeLimit.truncated"] = False
+            self.building.reset_lanes(dones)
+            self.current_steps[dones] = 0
+            obs = self._get_observations()
+        return obs, rewards, dones, infos
+
+    def _get_observations(self):
+        buffers = self._obs_buffers
+        self.building.fill_observations(buffers)
+        buffers["time_step"][:, 0] = self.current_steps
+        if self.joint_actions:
+            buffers["elevator_destinations"][:] = self.building.destinations
+        if self.flat_obs:
+            np.multiply(self._flat, self._flat_scale, out=self._flat)
+            np.minimum(self._flat, 1, out=self._flat)
+            return self._flat.copy()
+        return {key: buffer.copy() for key, buffer in buffers.items()}
+
+    def close(self):
+        pass
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    # ElevatorEnv attributes that hold one value per lane here
+    LANE_ATTRS = {"current_step": "current_steps"}
+
+    def get_attr(self, attr_name, indices=None):
+        if attr_name in self.LANE_ATTRS:
+            values = getattr(self, self.LANE_ATTRS[attr_name])
+            return [values[i].item() for i in self._indices(indices)]
+        value = getattr(self, attr_name)
+        return [value for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        if attr_name in self.LANE_ATTRS:
+            getattr(self, self.LANE_ATTRS[attr_name])[list(self._indices(indices))] = value
+            return
+        if not hasattr(self, attr_name):
+            raise AttributeError(f"ElevatorVecEnv has no attribute {attr_name!r} to set")
+        if sorted(self._indices(indices)) != list(range(self.num_envs)):
+            raise ValueError(f"{attr_name!r} is shared by all lanes of an ElevatorVecEnv and can only be set "
+                             f"for all of them, not for indices {indices}")
+        setattr(self, attr_name, value)
+
+    def action_masks(self):
+        """(num_envs, mask size) valid action masks of every lane, see ElevatorEnv.action_masks"""
+        return dispatch_action_masks(self.building.get_valid_dispatches(), self.joint_actions)
+
+    def dispatch_states(self, indices=None):
+        """DispatchState of every lane (or of `indices`), for the classical dispatchers"""
+        building = self.building
+        lanes = list(self._indices(indices))
+        arrays = (building.positions, building.loads, building.destinations, building.get_car_calls(),
+                  building.get_hall_calls(), building.get_dispatchable(), building.get_valid_dispatches(),
+                  building.get_max_wait_times())
+        return [DispatchState(self.num_floors, *(array[lane].copy() for array in arrays)) for lane in lanes]
+
+    def reset_lanes(self, indices=None):
+        """Start a new episode in the given lanes only; (observation, info) of each, like ElevatorEnv.reset.
+        The lanes share one traffic generator, so they cannot be seeded one by one."""
+        lanes = list(self._indices(indices))
+        mask = np.zeros(self.num_envs, dtype=bool)
+        mask[lanes] = True
+        self.building.reset_lanes(mask)
+        self.current_steps[mask] = 0
+        obs = self._get_observations()
+        if self.flat_obs:
+            return [(obs[i], {}) for i in lanes]
+        return [({key: value[i] for key, value in obs.items()}, {}) for i in lanes]
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        """The ElevatorEnv methods that map onto the batched lanes: action_masks, dispatch_state,
+        dispatch_action and reset (without a seed)"""
+        lanes = list(self._indices(indices))
+        if method_name == "action_masks":  # what masked-policy algorithms call on a VecEnv
+            return list(self.action_masks()[lanes])
+        if method_name == "dispatch_state":
+            return self.dispatch_states(lanes)
+        if method_name == "dispatch_action":
+            action = dispatch_action(*method_args, num_floors=self.num_floors, num_elevators=self.num_elevators,
+                                     joint_actions=self.joint_actions, **method_kwargs)
+            return [action.copy() for _ in lanes]
+        if method_name == "reset":
+            if method_args or method_kwargs.get("seed") is not None:
+                raise ValueError("ElevatorVecEnv lanes share one traffic generator and cannot be seeded one by one")
+            return self.reset_lanes(lanes)
+        raise NotImplementedError(f"ElevatorVecEnv lanes are not separate environment objects; env_method "
+                                  f"supports action_masks, dispatch_state, dispatch_action and reset, "
+                                  f"not {method_name!r}")
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._indices(indices)]
@@ -0,0 +1,67 @@
+WAIT_CAP = 20  # per-passenger cap used by the wait penalty
+
+class WaitTracker:
+    """Running wait-time totals over the passengers currently waiting.
+
+    Waits are never stored or incremented per passenger: someone spawned at
+    tick `s` has waited `now - s`. The uncapped total follows from the count
+    and the sum of spawn times, and the capped total is `cap * count` minus
+    what the passengers younger than `cap` have not waited yet, which only
+    needs a ring of per-tick spawn counts for the last `cap` ticks.
+    """
+    def __init__(self, cap=WAIT_CAP):
+        self.cap = cap
+        self.now = 0
+        self.count = 0  # passengers waiting
+        self.spawn_sum = 0  # sum of their spawn times
+        self._recent_spawns = [0] * cap  # waiting passengers by spawn tick, for the last `cap` ticks
+        self._recent_count = 0  # waiting passengers younger than `cap`
+        self._recent_deficit = 0  # sum of `cap - wait` over those passengers
+
+    def snapshot(self):
+        """Totals and recent spawn ring as `cap + 5` ints"""
+        return [self.now, self.count, self.spawn_sum, self._recent_count, self._recent_deficit, *self._recent_spawns]
+
+    def restore(self, words):
+        self.now, self.count, self.spawn_sum, self._recent_count, self._recent_deficit = words[:5]
+        self._recent_spawns = list(words[5:])
+
+    def advance(self, now):
+        """Move the clock forward to `now`"""
+        while self.now < now:
+            self.now += 1
+            self._recent_deficit -= self._recent_count
+            slot = self.now % self.cap  # passengers spawned `cap` ticks ago are now capped
+            self._recent_count -= self._recent_spawns[slot]
+            self._recent_spawns[slot] = 0
+
+    def add(self, spawn_time, count=1):
+        self.count += count
+        self.spawn_sum += spawn_time * count
+        wait = self.now - spawn_time
+        if wait < self.cap:
+            self._recent_spawns[spawn_time % self.cap] += count
+            self._recent_count += count
+            self._recent_deficit += (self.cap - wait) * count
+
+    def remove(self, spawn_time):
+        self.count -= 1
+        self.spawn_sum -= spawn_time
+        wait = self.now - spawn_time
+        if wait < self.cap:
+            self._recent_spawns[spawn_time % self.cap] -= 1
+            self._recent_count -= 1
+            self._recent_deficit -= self.cap - wait
+
+    def remove_capped(self, count, spawn_sum):
+        """Remove `count` passengers that have all waited at least `cap` ticks"""
+        self.count -= count
+        self.spawn_sum -= spawn_sum
+
+    def total_wait(self):
+        """Sum of waits of everyone still waiting"""
+        return self.count * self.now - self.spawn_sum
+
+    def capped_wait_sum(self):
+        """Sum over everyone still waiting of min(wait, cap)"""
+        return self.cap * self.count - self._recent_deficit